@@ -0,0 +1,207 @@
+"""
+Recount the mention leaderboards from channel history.
+
+Channels are scanned a few at a time, oldest message first. Each channel's
+progress (last message id and its counts so far) is checkpointed to disk,
+so a scan that is interrupted picks up where it stopped. Nothing touches
+the leaderboards until every channel is done; then they are replaced in one
+write.
+"""
+
+import asyncio
+import datetime as dt
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+import discord
+
+import users
+from mentions import KeywordMatcher
+from paths import BACKFILL
+from store import JsonFile
+
+CONCURRENCY = 3  # channels scanned at once, discord rate limits history per route
+CHECKPOINT_EVERY = 5_000  # messages per channel between checkpoint writes
+SKIP_PREFIX = "!mistborn"  # the leaderboard command itself is not a mention
+
+# Checkpoint for one channel, {"last": message id, "done": bool,
+# "counts": {board: {user id: count}}}
+CHANNEL = dict[str, Any]
+
+
+class HistoryProvider(ABC):
+    """Where channel history comes from.
+
+    Messages need an id, content and author.id, like discord.Message.
+    """
+
+    @abstractmethod
+    def channels(self) -> list[int]:
+        """Ids of every channel to scan."""
+
+    @abstractmethod
+    def latest(self) -> int:
+        """A message id after every message that exists right now."""
+
+    @abstractmethod
+    def history(self, channel_id: int, after: int, before: int) -> AsyncIterator[Any]:
+        """Messages strictly between two message ids, oldest first."""
+
+
+class DiscordHistory(HistoryProvider):
+    """History of every text channel the bot can read in a guild.
+
+    discord.py waits out rate limits on its own; the scan keeps the number
+    of channels paging at once low so it rarely has to.
+    """
+
+    def __init__(self, guild: discord.Guild) -> None:
+        self.guild = guild
+
+    def channels(self) -> list[int]:
+        return [
+            channel.id
+            for channel in self.guild.text_channels
+            if channel.permissions_for(self.guild.me).read_message_history
+        ]
+
+    def latest(self) -> int:
+        return discord.utils.time_snowflake(dt.datetime.now(dt.timezone.utc))
+
+    async def history(
+        self, channel_id: int, after: int, before: int
+    ) -> AsyncIterator[discord.Message]:
+        channel = self.guild.get_channel(channel_id)
+        if not isinstance(channel, discord.TextChannel):
+            return
+        async for message in channel.history(
+            limit=None,
+            after=discord.Object(after),
+            before=discord.Object(before),
+            oldest_first=True,
+        ):
+            yield message
+
+
+@dataclass(slots=True)
+class BackfillResult:
+    """What a scan did."""
+
+    channels: int
+    resumed: int  # channels with progress from an earlier, interrupted scan
+    messages: int  # messages read by this run
+    seconds: float
+
+
+class Backfill:
+    """One recount of the mention leaderboards, resumable from its checkpoint."""
+
+    def __init__(
+        self,
+        provider: HistoryProvider,
+        matcher: KeywordMatcher,
+        skip_author: int | None = None,
+        checkpoint: Path = BACKFILL,
+        concurrency: int = CONCURRENCY,
+    ) -> None:
+        self.provider = provider
+        self.matcher = matcher
+        self.skip_author = skip_author
+        self.checkpoint = JsonFile(checkpoint)
+        self.concurrency = concurrency
+        self.messages = 0
+        self._saving = asyncio.Lock()
+
+    @property
+    def boards(self) -> list[str]:
+        """Every leaderboard the matcher counts for."""
+        return sorted(set(self.matcher.groups.values()))
+
+    async def _save(self) -> None:
+        # Concurrent channels share one file, so writes must not overlap.
+        async with self._saving:
+            self.checkpoint.mark_dirty()
+            await self.checkpoint.flush_async()
+
+    def _counted(self, message: Any) -> bool:
+        """Whether the live listener would have counted the message."""
+        if message.author.id == self.skip_author:
+            return False
+        return message.content[: len(SKIP_PREFIX)].lower() != SKIP_PREFIX
+
+    async def _scan(
+        self, channel_id: int, state: CHANNEL, before: int, slots: asyncio.Semaphore
+    ) -> None:
+        counts: dict[str, dict[str, int]] = state["counts"]
+        async with slots:
+            since_save = 0
+            try:
+                async for message in self.provider.history(
+                    channel_id, state["last"], before
+                ):
+                    self.messages += 1
+                    if self._counted(message):
+                        user_id = str(message.author.id)
+                        for board, count in self.matcher.count(message.content).items():
+                            scores = counts.setdefault(board, {})
+                            scores[user_id] = scores.get(user_id, 0) + count
+                    # Only after counting, so a checkpoint never skips a message.
+                    state["last"] = message.id
+                    since_save += 1
+                    if since_save >= CHECKPOINT_EVERY:
+                        since_save = 0
+                        await self._save()
+                state["done"] = True
+            finally:
+                await self._save()
+
+    async def run(self) -> BackfillResult:
+        """Scan every channel not yet done, then replace the leaderboards.
+
+        The checkpoint is removed once the new counts are written.
+        """
+        start = time.perf_counter()
+        data = self.checkpoint.data
+        if "before" not in data:
+            data["before"] = self.provider.latest()
+            # Mentions still queued would be missing from the snapshot.
+            users.flush_mentions_now()
+            data["since"] = await users.mention_counts(self.boards)
+            data["channels"] = {}
+        channels: dict[str, CHANNEL] = data["channels"]
+        resumed = sum(1 for state in channels.values() if state["last"])
+        for channel_id in self.provider.channels():
+            channels.setdefault(
+                str(channel_id), {"last": 0, "done": False, "counts": {}}
+            )
+
+        slots = asyncio.Semaphore(self.concurrency)
+        scans = [
+            asyncio.create_task(
+                self._scan(int(channel_id), state, data["before"], slots)
+            )
+            for channel_id, state in channels.items()
+            if not state["done"]
+        ]
+        try:
+            await asyncio.gather(*scans)
+        finally:
+            # Let every scan write its checkpoint before giving up.
+            for scan in scans:
+                scan.cancel()
+            await asyncio.gather(*scans, return_exceptions=True)
+
+        totals: dict[str, dict[str, int]] = {board: {} for board in self.boards}
+        for state in channels.values():
+            for board, scores in state["counts"].items():
+                total = totals.setdefault(board, {})
+                for user_id, count in scores.items():
+                    total[user_id] = total.get(user_id, 0) + count
+        await users.replace_mention_leaderboards(totals, data["since"])
+        self.checkpoint.path.unlink(missing_ok=True)
+        return BackfillResult(
+            len(channels), resumed, self.messages, time.perf_counter() - start
+        )
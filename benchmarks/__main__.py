@@ -0,0 +1,7 @@
+"""
+python -m benchmarks runs the full suite.
+"""
+
+from .suite import main
+
+main()
@@ -0,0 +1,152 @@
+"""
+Channel history backfill against a fake guild that streams synthetic messages.
+
+python -m benchmarks.history [--messages 1000000] [--channels 20] [--latency 0]
+
+Runs the scan once straight through, then again with an interruption half way
+and a resume, and checks both produce the same leaderboards.
+"""
+
+import argparse
+import asyncio
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator
+
+import users
+from backfill import Backfill, HistoryProvider
+from mentions import DEFAULT_GROUPS, MISTBORN, KeywordMatcher
+
+from .mentions import messages
+from .synthetic import FIRST_ID, json_storage
+
+FIRST_MESSAGE = 1_000_000_000_000_000_000
+PAGE = 100  # messages per history request, as discord pages them
+
+
+@dataclass(slots=True)
+class Author:
+    """Only the id of a message author is read."""
+
+    id: int
+
+
+@dataclass(slots=True)
+class FakeMessage:
+    """Stands in for discord.Message."""
+
+    id: int
+    content: str
+    author: Author
+
+
+class FakeHistory(HistoryProvider):
+    """A guild whose channels hold total messages between them.
+
+    Nothing is stored: a message's content and author follow from its id, so
+    any range of history can be streamed again after an interruption.
+    Message ids of the channels interleave the way real snowflakes would.
+    """
+
+    def __init__(
+        self, total: int, channels: int = 20, members: int = 10_000, latency: float = 0
+    ) -> None:
+        self.total = total
+        self.channel_count = channels
+        self.authors = [Author(FIRST_ID + idx) for idx in range(members)]
+        self.corpus = messages(4096, ["mistborn", "sanderson"])
+        self.latency = latency  # seconds per page request
+        self.stop_after: int | None = None  # messages to serve before failing
+
+    def channels(self) -> list[int]:
+        return list(range(self.channel_count))
+
+    def latest(self) -> int:
+        return FIRST_MESSAGE + self.total
+
+    def message(self, message_id: int) -> FakeMessage:
+        """The message with an id."""
+        idx = message_id - FIRST_MESSAGE
+        return FakeMessage(
+            message_id,
+            self.corpus[idx * 2654435761 % len(self.corpus)],
+            self.authors[idx * 40503 % len(self.authors)],
+        )
+
+    async def history(
+        self, channel_id: int, after: int, before: int
+    ) -> AsyncIterator[FakeMessage]:
+        step = self.channel_count
+        first = max(after + 1 - FIRST_MESSAGE, 0)
+        # First index at or after `first` that belongs to this channel.
+        idx = first + (channel_id - first) % step
+        end = min(before, self.latest()) - FIRST_MESSAGE
+        while idx < end:
+            await asyncio.sleep(self.latency)
+            for _ in range(PAGE):
+                if idx >= end:
+                    break
+                if self.stop_after is not None:
+                    if self.stop_after <= 0:
+                        raise ConnectionError("history request failed")
+                    self.stop_after -= 1
+                yield self.message(FIRST_MESSAGE + idx)
+                idx += step
+
+
+async def recount(
+    provider: FakeHistory, folder: Path, stop_after: int | None = None
+) -> dict[str, int]:
+    """Backfill into fresh storage in folder, optionally failing part way.
+
+    Returns:
+        dict[str, int]: The recounted Mistborn leaderboard.
+    """
+    users.use_backend(json_storage(folder))
+    matcher = KeywordMatcher(DEFAULT_GROUPS)
+    checkpoint = folder / "backfill.json"
+    if stop_after is not None:
+        provider.stop_after = stop_after
+        try:
+            await Backfill(provider, matcher, checkpoint=checkpoint).run()
+        except ConnectionError:
+            pass
+        provider.stop_after = None
+    result = await Backfill(provider, matcher, checkpoint=checkpoint).run()
+    print(
+        f"  {result.messages:,} messages over {result.channels} channels "
+        f"({result.resumed} resumed) in {result.seconds:.2f}s, "
+        f"{result.messages / result.seconds:,.0f} messages/s"
+    )
+    counts = (await users.mention_counts([MISTBORN]))[MISTBORN]
+    users.BACKEND.close()
+    return counts
+
+
+def main() -> None:
+    """Scan straight through, then with a resume, and compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--members", type=int, default=10_000)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds per page request"
+    )
+    args = parser.parse_args()
+    provider = FakeHistory(args.messages, args.channels, args.members, args.latency)
+
+    print("Straight through:")
+    with tempfile.TemporaryDirectory() as folder:
+        straight = asyncio.run(recount(provider, Path(folder)))
+    print("Interrupted half way, then resumed:")
+    with tempfile.TemporaryDirectory() as folder:
+        resumed = asyncio.run(recount(provider, Path(folder), args.messages // 2))
+    assert straight == resumed, "resumed scan counted differently"
+    print(
+        f"Both counted {sum(straight.values()):,} mentions by {len(straight):,} users"
+    )
+
+
+if __name__ == "__main__":
+    main()
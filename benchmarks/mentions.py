@@ -0,0 +1,68 @@
+"""
+Keyword counting: one str.count per keyword vs the compiled KeywordMatcher.
+"""
+
+import random
+
+from mentions import KeywordMatcher
+
+from . import per_call
+
+WORDS = "the a game night team mid baron jungle support dragon book read".split()
+
+
+def keywords(total: int) -> dict[str, list[str]]:
+    """total keywords spread over leaderboards of up to 5 keywords each."""
+    words = ["sanderson", "mistborn", *(f"keyword{i:03}" for i in range(total - 2))]
+    words = words[:total]
+    return {f"board{i // 5}": words[i : i + 5] for i in range(0, total, 5)}
+
+
+def messages(count: int, keyword_list: list[str]) -> list[str]:
+    """Chat-sized messages where roughly one in ten mentions a keyword."""
+    rng = random.Random(0)
+    result = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(3, 40))
+        if rng.random() < 0.1:
+            words.insert(rng.randrange(len(words)), rng.choice(keyword_list).title())
+        result.append(" ".join(words))
+    return result
+
+
+def count_each(groups: dict[str, list[str]], text: str) -> dict[str, int]:
+    """The original approach generalised: lower once, str.count per keyword."""
+    lowered = text.lower()
+    counts = {}
+    for group, words in groups.items():
+        if found := sum(lowered.count(word) for word in words):
+            counts[group] = found
+    return counts
+
+
+def main() -> None:
+    """Print the cost per message for 1, 10 and 100 keywords."""
+    for total in (1, 10, 100):
+        groups = keywords(total)
+        corpus = messages(1000, [word for words in groups.values() for word in words])
+        matcher = KeywordMatcher(groups)
+        assert all(matcher.count(msg) == count_each(groups, msg) for msg in corpus)
+
+        def old() -> None:
+            for msg in corpus:
+                count_each(groups, msg)
+
+        def new() -> None:
+            for msg in corpus:
+                matcher.count(msg)
+
+        before = per_call(old, number=10) / len(corpus)
+        after = per_call(new, number=10) / len(corpus)
+        print(
+            f"{total:>3} keywords: str.count {before * 1e6:6.2f} us/msg, "
+            f"matcher {after * 1e6:6.2f} us/msg ({before / after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
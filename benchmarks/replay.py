@@ -0,0 +1,472 @@
+"""
+Replay gateway events through the bot's real handlers, with no Discord connection.
+
+python -m benchmarks.replay [--events events.jsonl] [--rates 1000 5000 10000 20000]
+    [--seconds 5] [--members 10000] [--save-events events.jsonl]
+
+Events are json lines, user ids are member numbers in the synthetic guild:
+
+    {"type": "message", "author": 3, "channel": 1, "content": "Mistborn again"}
+    {"type": "member_update", "user": 3, "name": "New name"}
+    {"type": "member_update", "user": 3, "timeout": true}
+    {"type": "command", "author": 3, "channel": 1, "command": "mistborn rank",
+     "args": [{"member": 7}], "kwargs": {}}
+
+Each rate is a stage on fresh state: events are offered at that rate for the
+given time, then the bot is left to catch up. Messages go through the
+on_message listeners and the message queue, member updates through
+on_member_update and commands straight to the command callback, each in its
+own task the way discord.py dispatches them. What the bot sends is captured.
+The report shows where it stops keeping up.
+"""
+
+import argparse
+import asyncio
+import configparser
+import dataclasses
+import datetime as dt
+import json
+import random
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Coroutine, Iterator
+
+import dadbot
+import memberfilter
+import metrics
+import users
+from mentions import MISTBORN
+
+from .mentions import messages
+from .synthetic import FIRST_ID, generate, json_storage
+
+RATES = (1_000, 5_000, 10_000, 20_000)
+CHANNELS = 5
+TICK = 0.001  # seconds between batches of offered events
+KEEPING_UP = 0.95  # share of the offered rate a stage must sustain
+# Command names and arguments, "member" is replaced by a random member.
+COMMANDS: tuple[tuple[str, tuple[Any, ...]], ...] = (
+    ("mistborn", ()),
+    ("mistborn rank", ("member",)),
+    ("jailtime", ()),
+    ("jailtime", (7,)),
+    ("jailtime", (None, "member")),
+    ("history", ("member",)),
+)
+
+
+@dataclass(slots=True)
+class Sent:
+    """A message the bot sent."""
+
+    channel: int
+    content: str
+
+
+@dataclass(slots=True)
+class ReplayChannel:
+    """Stands in for discord.TextChannel, keeping what is sent to it."""
+
+    id: int
+    outbox: list[Sent]
+
+    async def send(self, content: str = "", **_: Any) -> None:
+        self.outbox.append(Sent(self.id, content))
+
+
+@dataclass(slots=True)
+class ReplayMember:
+    """Stands in for discord.Member."""
+
+    id: int
+    name: str
+    display_name: str
+    guild: "ReplayGuild"
+    roles: frozenset[int] = frozenset()
+    timed_out_until: dt.datetime | None = None
+    bot: bool = False
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def get_role(self, role_id: int) -> int | None:
+        return role_id if role_id in self.roles else None
+
+
+@dataclass(slots=True)
+class ReplayGuild:
+    """Stands in for discord.Guild with every member cached."""
+
+    id: int
+    members: dict[int, ReplayMember] = field(default_factory=dict)
+
+    def get_member(self, user_id: int) -> ReplayMember | None:
+        return self.members.get(user_id)
+
+    async def query_members(
+        self, user_ids: list[int], limit: int = 5
+    ) -> list[ReplayMember]:
+        return [found for user in user_ids if (found := self.members.get(user))]
+
+
+@dataclass(slots=True)
+class ReplayMessage:
+    """Stands in for discord.Message."""
+
+    id: int
+    content: str
+    author: ReplayMember
+    channel: ReplayChannel
+    guild: ReplayGuild
+    created_at: Any
+
+
+@dataclass(slots=True)
+class ReplayContext:
+    """Stands in for commands.Context."""
+
+    author: ReplayMember
+    channel: ReplayChannel
+    guild: ReplayGuild
+    message: ReplayMessage
+
+    async def send(self, content: str = "", **kwargs: Any) -> None:
+        await self.channel.send(content, **kwargs)
+
+
+def synthetic_events(count: int, members: int, seed: int = 0) -> list[dict[str, Any]]:
+    """A chat heavy event stream with some renames, timeouts and commands.
+
+    90% messages (about one in ten mentions Mistborn), 7% member updates and
+    3% commands. Timeouts alternate per user so every leave follows an enter.
+    """
+    rng = random.Random(seed)
+    corpus = messages(4096, ["mistborn", "sanderson"])
+    in_timeout: set[int] = set()
+    events: list[dict[str, Any]] = []
+    for idx in range(count):
+        user = rng.randrange(members)
+        channel = rng.randrange(CHANNELS) + 1
+        roll = rng.random()
+        if roll < 0.9:
+            events.append(
+                {
+                    "type": "message",
+                    "author": user,
+                    "channel": channel,
+                    "content": corpus[idx % len(corpus)],
+                }
+            )
+        elif roll < 0.935:
+            events.append(
+                {"type": "member_update", "user": user, "name": f"User {idx}"}
+            )
+        elif roll < 0.97:
+            timeout = user not in in_timeout
+            in_timeout.symmetric_difference_update((user,))
+            events.append({"type": "member_update", "user": user, "timeout": timeout})
+        else:
+            name, args = rng.choice(COMMANDS)
+            events.append(
+                {
+                    "type": "command",
+                    "author": user,
+                    "channel": channel,
+                    "command": name,
+                    "args": [
+                        {"member": rng.randrange(members)} if arg == "member" else arg
+                        for arg in args
+                    ],
+                }
+            )
+    return events
+
+
+def read_events(path: Path) -> list[dict[str, Any]]:
+    """Events from a json lines file."""
+    with path.open(encoding="utf8") as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def replay_config(workers: int, queue: int) -> configparser.ConfigParser:
+    """Settings for a bot that never connects."""
+    config = configparser.ConfigParser()
+    config.read_dict(
+        {
+            "DISCORD": {
+                "ANNOUNCEMENTS_CHANNEL_ID": "0",
+                "NEW_GAMES_CHANNEL_ID": "0",
+                "GAME_NIGHT_CHANNEL_ID": "0",
+                "GAME_NIGHT_USER": str(FIRST_ID),
+                "MISTBORN_BEST_USER": str(FIRST_ID),
+                "ADMIN": str(FIRST_ID),
+            },
+            "PIPELINE": {"WORKERS": str(workers), "QUEUE": str(queue)},
+        }
+    )
+    return config
+
+
+def process_io() -> tuple[int, int]:
+    """Bytes this process has read and written so far, (0, 0) off Linux."""
+    try:
+        with open("/proc/self/io", encoding="utf8") as fp:
+            found = dict(line.split(": ") for line in fp.read().splitlines())
+    except OSError:
+        return 0, 0
+    return int(found["rchar"]), int(found["wchar"])
+
+
+class Gateway:
+    """Dispatches events to a bot's handlers as discord.py would."""
+
+    def __init__(self, bot: Any, members: int) -> None:
+        self.bot = bot
+        self.guild = ReplayGuild(1)
+        self.outbox: list[Sent] = []
+        self.channels = {
+            idx: ReplayChannel(idx, self.outbox) for idx in range(1, CHANNELS + 1)
+        }
+        for idx in range(members):
+            self.guild.members[FIRST_ID + idx] = ReplayMember(
+                FIRST_ID + idx, f"user{idx}", f"User {idx}", self.guild
+            )
+        self.listeners = bot.extra_events.get("on_message", [])
+        self.pending: set[asyncio.Task[None]] = set()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors = 0
+        self._ids = 0
+
+    def member(self, user: int) -> ReplayMember:
+        return self.guild.members[FIRST_ID + user]
+
+    def message(self, event: dict[str, Any]) -> ReplayMessage:
+        self._ids += 1
+        return ReplayMessage(
+            self._ids,
+            event.get("content", ""),
+            self.member(event["author"]),
+            self.channels[event.get("channel", 1)],
+            self.guild,
+            dt.datetime.now(dt.timezone.utc),
+        )
+
+    def dispatch(self, event: dict[str, Any]) -> None:
+        """Start handling one event."""
+        kind = event["type"]
+        if kind == "message":
+            msg = self.message(event)
+            for listener in self.listeners:
+                # Only queues the message, its wait shows up as queue wait.
+                self._start("on_message", listener(msg))
+        elif kind == "member_update":
+            after = self.member(event["user"])
+            before = dataclasses.replace(after)
+            if "name" in event:
+                after.display_name = event["name"]
+            if "timeout" in event:
+                after.roles = (
+                    frozenset((memberfilter.TIMEOUT_ROLE,))
+                    if event["timeout"]
+                    else frozenset()
+                )
+            self._start("on_member_update", self.bot.on_member_update(before, after))
+        elif kind == "command":
+            msg = self.message(event)
+            ctx = ReplayContext(msg.author, msg.channel, self.guild, msg)
+            args = [
+                self.member(arg["member"]) if isinstance(arg, dict) else arg
+                for arg in event.get("args", [])
+            ]
+            command = self.bot.get_command(event["command"])
+            if command is None:
+                raise ValueError(f"Unknown command {event['command']}")
+            self._start(
+                f"!{event['command']}",
+                command(ctx, *args, **event.get("kwargs", {})),
+            )
+        else:
+            raise ValueError(f"Unknown event type {kind}")
+
+    def _start(self, kind: str, handler: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(self._timed(kind, handler))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _timed(self, kind: str, handler: Coroutine[Any, Any, None]) -> None:
+        start = time.perf_counter()
+        try:
+            await handler
+        except Exception:  # pylint: disable=broad-except
+            self.errors += 1
+            if self.errors <= 3:
+                users.LOGGER.exception("Replayed %s failed", kind)
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - start)
+
+
+async def flush_periodically() -> None:
+    """What the bot's flush loops do, on the same intervals."""
+    since_state = 0.0
+    while True:
+        await asyncio.sleep(dadbot.MENTION_FLUSH)
+        await users.flush_mentions()
+        since_state += dadbot.MENTION_FLUSH
+        if since_state >= dadbot.FLUSH_INTERVAL:
+            since_state = 0
+            await users.BACKEND.flush_async()
+
+
+async def offer(
+    gateway: Gateway, events: list[dict[str, Any]], total: int, rate: float
+) -> float:
+    """Dispatch total events, cycling through events, at rate per second.
+
+    Returns:
+        float: Seconds it took, longer than total / rate if the loop fell behind
+    """
+    start = time.perf_counter()
+    sent = 0
+    while sent < total:
+        due = min(total, int((time.perf_counter() - start) * rate) + 1)
+        for idx in range(sent, due):
+            gateway.dispatch(events[idx % len(events)])
+        sent = due
+        await asyncio.sleep(TICK)
+    return time.perf_counter() - start
+
+
+async def stage(
+    events: list[dict[str, Any]],
+    rate: float,
+    seconds: float,
+    members: int,
+    config: configparser.ConfigParser,
+    folder: Path,
+) -> dict[str, Any]:
+    """Replay at one rate on fresh state and measure how the bot coped."""
+    generate(folder, members)
+    users.use_backend(json_storage(folder))
+    for labels in metrics.HISTOGRAMS.values():
+        labels.clear()
+    bot, queue = dadbot.build_bot(config)
+    gateway = Gateway(bot, members)
+    await users.timeout_board()
+    await users.mention_board(MISTBORN)
+    queue.start()
+    flusher = asyncio.create_task(flush_periodically())
+
+    read_before, written_before = process_io()
+    total = int(rate * seconds)
+    start = time.perf_counter()
+    offered = await offer(gateway, events, total, rate)
+    await asyncio.gather(*gateway.pending)
+    await queue.queue.join()
+    await asyncio.gather(*gateway.pending)  # anything the queue started
+    flusher.cancel()
+    await users.flush_mentions()
+    await users.BACKEND.flush_async()
+    elapsed = time.perf_counter() - start
+    read_after, written_after = process_io()
+    await queue.stop()
+    users.BACKEND.close()
+
+    waits = metrics.HISTOGRAMS["dadbot_queue_wait_seconds"].get("messages")
+    files = {
+        kind: sum(h.count for h in metrics.HISTOGRAMS[metric].values())
+        for kind, metric in (
+            ("reads", "dadbot_file_read_seconds"),
+            ("writes", "dadbot_file_write_seconds"),
+        )
+    }
+    return {
+        "rate": rate,
+        "offered_per_sec": total / offered,
+        # Everything offered has been handled or dropped by now.
+        "handled_per_sec": (total - queue.stats.dropped) / elapsed,
+        "events": total,
+        "dropped": queue.stats.dropped,
+        "queue_peak": queue.stats.high_water,
+        "queue_wait_p50_ms": waits.quantile(0.5) * 1000 if waits else 0,
+        "queue_wait_p99_ms": waits.quantile(0.99) * 1000 if waits else 0,
+        "queue_wait_max_ms": waits.largest * 1000 if waits else 0,
+        "p99_ms": {
+            kind: (
+                statistics.quantiles(latencies, n=100)[-1] * 1000
+                if len(latencies) > 1
+                else latencies[0] * 1000
+            )
+            for kind, latencies in sorted(gateway.latencies.items())
+        },
+        "errors": gateway.errors + queue.stats.failed,
+        "sent": len(gateway.outbox),
+        "file_reads": files["reads"],
+        "file_writes": files["writes"],
+        "kib_read": (read_after - read_before) / 1024,
+        "kib_written": (written_after - written_before) / 1024,
+    }
+
+
+def report(result: dict[str, Any]) -> Iterator[str]:
+    """Lines describing one stage."""
+    yield (
+        f"{result['rate']:>8,.0f}/s offered {result['offered_per_sec']:>9,.0f}/s "
+        f"handled {result['handled_per_sec']:>9,.0f}/s, "
+        f"{result['dropped']:,} dropped, queue peak {result['queue_peak']:,}"
+    )
+    yield (
+        f"          queue wait p50 <{result['queue_wait_p50_ms']:.2f} ms "
+        f"p99 <{result['queue_wait_p99_ms']:.2f} ms "
+        f"max {result['queue_wait_max_ms']:.2f} ms"
+    )
+    for kind, p99 in result["p99_ms"].items():
+        yield f"          {kind:<16} p99 {p99:8.2f} ms"
+    yield (
+        f"          {result['sent']:,} sent, {result['errors']:,} errors, "
+        f"{result['file_reads']:,} file reads / {result['file_writes']:,} writes, "
+        f"{result['kib_read']:,.0f} KiB read / {result['kib_written']:,.0f} KiB written"
+    )
+
+
+def main() -> None:
+    """Replay each rate in turn and report the first the bot cannot sustain."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=Path, help="json lines to replay")
+    parser.add_argument("--save-events", type=Path, help="write the synthetic stream")
+    parser.add_argument("--rates", type=float, nargs="+", default=list(RATES))
+    parser.add_argument("--seconds", type=float, default=5, help="per rate")
+    parser.add_argument("--members", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=dadbot.MESSAGE_WORKERS)
+    parser.add_argument("--queue", type=int, default=dadbot.MESSAGE_QUEUE)
+    args = parser.parse_args()
+
+    if args.events:
+        events = read_events(args.events)
+    else:
+        events = synthetic_events(100_000, args.members)
+    if args.save_events:
+        with args.save_events.open("w", encoding="utf8") as fp:
+            fp.writelines(json.dumps(event) + "\n" for event in events)
+    metrics.enable()
+    config = replay_config(args.workers, args.queue)
+    breaking_point = None
+    for rate in args.rates:
+        with tempfile.TemporaryDirectory() as folder:
+            result = asyncio.run(
+                stage(events, rate, args.seconds, args.members, config, Path(folder))
+            )
+        print(*report(result), sep="\n")
+        behind = result["handled_per_sec"] < rate * KEEPING_UP
+        if breaking_point is None and (result["dropped"] or behind):
+            breaking_point = rate
+    if breaking_point is None:
+        print("Kept up with every rate.")
+    else:
+        print(f"Fell behind at {breaking_point:,.0f} events/s.")
+
+
+if __name__ == "__main__":
+    main()
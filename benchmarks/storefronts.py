@@ -0,0 +1,180 @@
+"""
+Storefront providers against local fixture feeds.
+
+python -m benchmarks.storefronts [--games 50] [--slow 2] [--rounds 5]
+
+Serves an Epic style promotions feed (with ETags), a second store listing some
+of the same games, one that answers too slowly and one that always fails, then
+checks the merge, the change detection, the timeouts and the circuit breaker.
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+
+import storefronts
+from games import EpicFetcher, EpicProvider
+
+HOST = "127.0.0.1"
+TIMEOUT = 0.5  # seconds each fixture provider is given
+
+
+def epic_game(number: int, offer: dict[str, str]) -> dict[str, Any]:
+    """One game of a promotions payload, free while the offer lasts."""
+    return {
+        "title": f"Game {number}",
+        "catalogNs": {"mappings": [{"pageSlug": f"game-{number}"}]},
+        "productSlug": f"game-{number}",
+        "price": {"totalPrice": {"discountPrice": 0}},
+        "promotions": {"promotionalOffers": [{"promotionalOffers": [offer]}]},
+    }
+
+
+def epic_payload(games: int) -> dict[str, Any]:
+    """A promotions payload with games free this week."""
+    now = datetime.now(timezone.utc)
+    offer = {
+        "startDate": (now - timedelta(days=1)).isoformat(),
+        "endDate": (now + timedelta(days=6)).isoformat(),
+    }
+    elements = [epic_game(number, offer) for number in range(games)]
+    return {"data": {"Catalog": {"searchStore": {"elements": elements}}}}
+
+
+class Fixtures:
+    """The fixture feeds, counting the requests each one gets."""
+
+    def __init__(self, games: int, slow: float) -> None:
+        self.epic = epic_payload(games)
+        self.games = games
+        self.slow = slow
+        self.hits: Counter[str] = Counter()
+
+    async def epic_feed(self, request: web.Request) -> web.StreamResponse:
+        self.hits["epic"] += 1
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(self.epic, headers={"ETag": '"v1"'})
+
+    async def other_feed(self, request: web.Request) -> web.StreamResponse:
+        self.hits["other"] += 1
+        # Every other Epic game is also on this store, plus some of its own.
+        titles = [f"GAME {number}" for number in range(0, self.games, 2)]
+        titles += [f"Other {number}" for number in range(self.games // 5)]
+        return web.json_response([{"title": title} for title in titles])
+
+    async def slow_feed(self, request: web.Request) -> web.StreamResponse:
+        self.hits["slow"] += 1
+        await asyncio.sleep(self.slow)
+        return web.json_response([{"title": "Too Late"}])
+
+    async def broken_feed(self, request: web.Request) -> web.StreamResponse:
+        self.hits["broken"] += 1
+        return web.Response(status=503)
+
+    async def serve(self) -> tuple[web.AppRunner, str]:
+        app = web.Application()
+        app.router.add_get("/epic", self.epic_feed)
+        app.router.add_get("/other", self.other_feed)
+        app.router.add_get("/slow", self.slow_feed)
+        app.router.add_get("/broken", self.broken_feed)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, HOST, 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        return runner, f"http://{HOST}:{port}"
+
+
+class ListProvider(storefronts.Provider):
+    """A store that serves a plain json list of titles."""
+
+    def __init__(self, name: str, url: str, session: aiohttp.ClientSession) -> None:
+        self.name = name
+        self.url = url
+        self.session = session
+        self.timeout = TIMEOUT
+
+    async def free_games(self) -> list[storefronts.FreeGame]:
+        async with self.session.get(self.url) as response:
+            response.raise_for_status()
+            listed = await response.json()
+        return [
+            storefronts.FreeGame(
+                game["title"],
+                f"{self.url}/{game['title'].replace(' ', '-')}",
+                self.name,
+            )
+            for game in listed
+        ]
+
+
+async def exercise(games: int, slow: float, rounds: int, folder: Path) -> None:
+    fixtures = Fixtures(games, slow)
+    runner, base = await fixtures.serve()
+    session = aiohttp.ClientSession()
+    epic = EpicProvider(EpicFetcher(f"{base}/epic", folder / "epic.json", retries=0))
+    epic.timeout = TIMEOUT
+    free_games = storefronts.FreeGames(
+        [
+            epic,
+            *(
+                ListProvider(name, f"{base}/{name}", session)
+                for name in ("other", "slow", "broken")
+            ),
+        ]
+    )
+    saved = folder / "games.json"
+    try:
+        for number in range(1, rounds + 1):
+            start = time.perf_counter()
+            found = await free_games.fetch()
+            seconds = time.perf_counter() - start
+            changed = storefronts.changed(found, saved)
+            if changed:
+                storefronts.save(found, saved)
+            stores = Counter(game.store for game in found)
+            opened = [name for name, b in free_games.breakers.items() if b.open]
+            print(
+                f"round {number}: {len(found)} games {dict(stores)} in "
+                f"{seconds * 1000:.0f} ms, changed={changed}, "
+                f"open breakers={opened}"
+            )
+            assert seconds < slow, "a slow provider held up the others"
+            assert stores["epic"] == games, "epic games missing"
+            assert stores["other"] == games // 5, "duplicates were not merged"
+            assert "slow" not in stores and "broken" not in stores
+            assert changed == (number == 1), "change detection was wrong"
+    finally:
+        await free_games.close()
+        await session.close()
+        await runner.cleanup()
+    assert fixtures.hits["broken"] == min(
+        rounds, storefronts.FAILURES
+    ), "the broken feed was called after its breaker opened"
+    print(f"requests: {dict(fixtures.hits)}")
+
+
+def main() -> None:
+    """Run the fixture feeds and check every round."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument(
+        "--slow", type=float, default=2, help="seconds the slow feed takes"
+    )
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(exercise(args.games, args.slow, args.rounds, Path(folder)))
+
+
+if __name__ == "__main__":
+    main()
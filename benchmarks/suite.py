@@ -0,0 +1,264 @@
+"""
+Time the bot's hot paths against synthetic guilds, with no Discord connection.
+
+python -m benchmarks [--sizes 1000 100000 1000000] [--budget 2] [--compare OLD]
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, cast
+
+import discord
+
+import teambuilder
+import users
+from mentions import DEFAULT_GROUPS, KeywordMatcher
+
+from .mentions import messages
+from .synthetic import NOW, generate, json_storage, member
+
+RESULTS = Path(__file__).parent / "results"
+SIZES = (1_000, 100_000, 1_000_000)
+MIN_CALLS = 3
+MAX_CALLS = 10_000
+
+
+def summarize(name: str, size: int | None, latencies: list[float]) -> dict[str, Any]:
+    """Throughput and latency percentiles for one benchmark."""
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "name": name,
+        "size": size,
+        "calls": len(latencies),
+        "ops_per_sec": len(latencies) / total if total else float("inf"),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def time_calls(func: Callable[[], Any], budget: float) -> list[float]:
+    """Latency of each call, calling until the time budget is spent."""
+    latencies: list[float] = []
+    deadline = time.perf_counter() + budget
+    while len(latencies) < MIN_CALLS or (
+        len(latencies) < MAX_CALLS and time.perf_counter() < deadline
+    ):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def time_awaits(func: Callable[[], Awaitable[Any]], budget: float) -> list[float]:
+    """Like time_calls for coroutine functions."""
+    latencies: list[float] = []
+    deadline = time.perf_counter() + budget
+    while len(latencies) < MIN_CALLS or (
+        len(latencies) < MAX_CALLS and time.perf_counter() < deadline
+    ):
+        start = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def bench_guild(size: int, folder: Path, budget: float) -> list[dict[str, Any]]:
+    """Benchmarks whose cost depends on the number of members."""
+    generate(folder, size)
+    rng = random.Random(1)
+    storage = json_storage(folder)
+    users.use_backend(storage)
+    results = []
+
+    def load() -> None:
+        storage.log.load()
+        storage.state.mist.load()
+        storage.state.names.load()
+
+    results.append(summarize("load state files", size, time_calls(load, budget)))
+
+    data = storage.all_timeouts()
+
+    def full_leaderboard() -> None:
+        [list(board) for board in users.get_timeout_leaderboard(NOW, data)]
+
+    results.append(
+        summarize(
+            "users.get_timeout_leaderboard",
+            size,
+            time_calls(full_leaderboard, budget),
+        )
+    )
+
+    async def indexed_leaderboard() -> None:
+        [list(board) for board in await users.timeout_leaderboard(NOW)]
+
+    await users.timeout_board()  # build the index outside the timing
+    results.append(
+        summarize(
+            "users.timeout_leaderboard",
+            size,
+            await time_awaits(indexed_leaderboard, budget),
+        )
+    )
+
+    async def mention() -> None:
+        await users.update_mistborn_leaderboard(
+            cast(discord.Member, member(rng.randrange(size))), 1
+        )
+
+    await users.mention_board()
+    results.append(
+        summarize(
+            "users.update_mistborn_leaderboard",
+            size,
+            await time_awaits(mention, budget),
+        )
+    )
+
+    async def rename() -> None:
+        user = member(rng.randrange(size))
+        user.display_name = f"Renamed {rng.randrange(1000)}"
+        await users.name_change(cast(discord.Member, user))
+
+    results.append(
+        summarize("users.name_change", size, await time_awaits(rename, budget))
+    )
+
+    matcher = KeywordMatcher(DEFAULT_GROUPS)
+    corpus = messages(1000, ["mistborn", "sanderson"])
+
+    async def listener() -> None:
+        counts = matcher.count(rng.choice(corpus))
+        if cnt := counts.get("mistborn"):
+            await users.update_mistborn_leaderboard(
+                cast(discord.Member, member(rng.randrange(size))), cnt
+            )
+
+    results.append(
+        summarize("mention listener", size, await time_awaits(listener, budget))
+    )
+
+    async def flush() -> None:
+        # One change per flush so every sample writes the mention and name files.
+        await users.update_mistborn_leaderboard(
+            cast(discord.Member, member(rng.randrange(size))), 1
+        )
+        await users.name_change(cast(discord.Member, member(rng.randrange(size))))
+        await storage.flush_async()
+
+    results.append(
+        summarize("flush state files", size, await time_awaits(flush, budget))
+    )
+    storage.close()
+    return results
+
+
+def bench_teams(budget: float) -> list[dict[str, Any]]:
+    """Team generation, which does not depend on guild size."""
+    champs, champ_positions = teambuilder.get_champs()
+    sampler = teambuilder.TeamSampler(champ_positions)
+    return [
+        summarize(
+            "teambuilder.make_team",
+            None,
+            time_calls(lambda: teambuilder.make_team(champ_positions), budget),
+        ),
+        summarize(
+            "teambuilder.make_chaos",
+            None,
+            time_calls(lambda: teambuilder.make_chaos(champs), budget),
+        ),
+        summarize(
+            "TeamSampler.draw(sides=2)",
+            None,
+            time_calls(lambda: sampler.draw(sides=2), budget),
+        ),
+    ]
+
+
+def commit() -> str | None:
+    """Current git commit, if the project is a checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results: list[dict[str, Any]]) -> None:
+    """Print a results table."""
+    print(f"{'benchmark':<36} {'members':>9} {'ops/s':>11} {'p50 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        size = "-" if result["size"] is None else f"{result['size']:,}"
+        print(
+            f"{result['name']:<36} {size:>9} {result['ops_per_sec']:>11,.0f} "
+            f"{result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}"
+        )
+
+
+def compare(old: Path, results: list[dict[str, Any]]) -> None:
+    """Print p50 changes against an earlier results file."""
+    before = {
+        (result["name"], result["size"]): result
+        for result in json.loads(old.read_text(encoding="utf8"))["results"]
+    }
+    print(f"\nCompared with {old.name} (p50, lower is better):")
+    for result in results:
+        if (found := before.get((result["name"], result["size"]))) is None:
+            continue
+        ratio = result["p50_ms"] / found["p50_ms"] if found["p50_ms"] else 1
+        size = "-" if result["size"] is None else f"{result['size']:,}"
+        print(f"{result['name']:<36} {size:>9} {ratio:>7.2f}x")
+
+
+def main() -> None:
+    """Run every benchmark and save the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument(
+        "--budget", type=float, default=2, help="seconds to spend per benchmark"
+    )
+    parser.add_argument("--compare", type=Path, help="earlier results file")
+    parser.add_argument("--output", type=Path, help="where to save the results")
+    args = parser.parse_args()
+
+    results = bench_teams(args.budget)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            results.extend(asyncio.run(bench_guild(size, Path(folder), args.budget)))
+    report(results)
+
+    created = dt.datetime.now()
+    output = args.output or RESULTS / f"{created:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "created": created.isoformat(),
+                "commit": commit(),
+                "python": platform.python_version(),
+                "results": results,
+            },
+            indent=2,
+        ),
+        encoding="utf8",
+    )
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(args.compare, results)
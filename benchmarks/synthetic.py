@@ -0,0 +1,91 @@
+"""
+Synthetic state files shaped like a large guild's.
+"""
+
+import datetime as dt
+import json
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+from eventlog import TimeoutLog
+from records import TimeoutRecord, dump_records, epoch
+from storage import JsonStorage
+from store import StateStore
+
+NOW = dt.datetime(2024, 1, 1, 12)
+FIRST_ID = 100_000_000_000_000_000  # discord ids are 18 digit snowflakes
+
+
+@dataclass(slots=True)
+class FakeMember:
+    """Stands in for discord.Member where only id and names are read."""
+
+    id: int
+    name: str
+    display_name: str
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+def member(idx: int) -> FakeMember:
+    """The idx'th synthetic member."""
+    return FakeMember(FIRST_ID + idx, f"user{idx}", f"User {idx}")
+
+
+def generate(folder: Path, users: int, seed: int = 0) -> StateStore:
+    """Write timeouts, mistborn and names files for a guild of users members.
+
+    About a fifth of members have been in timeout (1% are in it now), a
+    third have mentioned Mistborn and everyone has one to five names.
+    """
+    rng = random.Random(seed)
+    timeouts: dict[int, TimeoutRecord] = {}
+    mist = {}
+    names = {}
+    for idx in range(users):
+        user = member(idx)
+        if rng.random() < 0.2:
+            start = None
+            if rng.random() < 0.05:
+                start = epoch(NOW - dt.timedelta(seconds=rng.randint(1, 86_400)))
+            timeouts[user.id] = TimeoutRecord(
+                user.id,
+                rng.randint(1, 50),
+                rng.randint(60, 1_000_000),
+                start,
+                user.name,
+            )
+        if rng.random() < 0.33:
+            mist[str(user.id)] = rng.randint(1, 500)
+        versions = range(rng.randint(1, 5))
+        names[str(user.id)] = [f"{user.display_name} v{n}" for n in versions]
+    folder.mkdir(parents=True, exist_ok=True)
+    state = state_store(folder)
+    for file, data in (
+        (state.timeouts, dump_records(timeouts)),
+        (state.mist, mist),
+        (state.names, names),
+    ):
+        file.path.write_text(json.dumps(data, indent=2), encoding="utf8")
+    return state
+
+
+def state_store(folder: Path) -> StateStore:
+    """A StateStore with every file in folder."""
+    return StateStore(
+        folder / "timeouts.json",
+        folder / "mistborn.json",
+        folder / "names.json",
+        folder / "mentions.json",
+        folder / "timeout_days.json",
+    )
+
+
+def json_storage(folder: Path) -> JsonStorage:
+    """JsonStorage reading and writing only inside folder."""
+    state = state_store(folder)
+    log = TimeoutLog(state.timeouts, folder / "timeouts.jsonl", folder / "history")
+    return JsonStorage(state, log)
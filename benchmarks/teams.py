@@ -0,0 +1,58 @@
+"""
+Team generation: make_team per side vs TeamSampler batches, and how often
+champions come back from the previous game nights with recent picks avoided.
+"""
+
+import time
+
+import teambuilder
+
+from . import per_call
+
+COUNT = 10_000
+NIGHTS = 2_000  # game nights of one team pair each for the repeat rate
+
+
+def repeat_rate(sampler: teambuilder.TeamSampler, nights: int = NIGHTS) -> float:
+    """Share of picks that were also picked in the game night before."""
+    previous: set[str] = set()
+    repeats = 0
+    for _ in range(nights):
+        picked = {pick for side in sampler.draw(sides=2) for pick in side}
+        repeats += len(picked & previous)
+        previous = picked
+    return repeats / (nights * 10)
+
+
+def main() -> None:
+    """Print the cost per team pair for COUNT pairs."""
+    _, champ_positions = teambuilder.get_champs()
+    sampler = teambuilder.TeamSampler(champ_positions)
+
+    def make_team_pair() -> None:
+        teambuilder.make_team(champ_positions)
+        teambuilder.make_team(champ_positions)
+
+    before = per_call(make_team_pair, number=COUNT)
+    start = time.perf_counter()
+    sampler.draw_many(COUNT)
+    after = (time.perf_counter() - start) / COUNT
+    print(
+        f"{COUNT} pairs: make_team x2 {before * 1e6:.1f} us/pair (duplicates allowed), "
+        f"TeamSampler {after * 1e6:.1f} us/pair (no duplicates)"
+    )
+    recent = teambuilder.RecentPicks()
+    avoiding = teambuilder.TeamSampler(champ_positions, recent=recent)
+    start = time.perf_counter()
+    avoiding.draw_many(COUNT)
+    weighted = (time.perf_counter() - start) / COUNT
+    print(
+        f"{COUNT} pairs avoiding the last {recent.size} teams: "
+        f"{weighted * 1e6:.1f} us/pair"
+    )
+    for label, each in (("uniform", sampler), ("recent avoided", avoiding)):
+        print(f"{label:>15}: {repeat_rate(each):.1%} of picks repeat the night before")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,110 @@
 """
 Helper module to add new champs to the pool.
+
+python champs.py                       add champs one at a time
+python champs.py --import new.json     merge {champ: [positions]} from a file
+python champs.py --import new.csv      merge rows of champ,positions
+
+CSV positions may be names or role letters (b, m, d, s, j), separated by
+spaces, semicolons or "|". Nothing is written unless every row is valid.
 """
 
+import argparse
+import csv
 import json
+import os
+import re
 from collections import OrderedDict
 from pathlib import Path
 
+from teambuilder import validate_champs
+
 CHAMPS = Path("champs.json")
+ROLES = {"b": "Baron", "m": "Mid", "d": "Dragon", "s": "Support", "j": "Jungle"}
+
+
+def read_csv(path: Path) -> dict[str, list[str]]:
+    """Champions from a csv file, with or without a champion,positions header."""
+    champs: dict[str, list[str]] = {}
+    with path.open(newline="", encoding="utf-8") as csv_file:
+        for line, row in enumerate(csv.reader(csv_file)):
+            if not any(field.strip() for field in row):
+                continue
+            if line == 0 and row[0].strip().lower() in ("champ", "champion", "name"):
+                continue
+            champ, *rest = row
+            positions = [
+                ROLES.get(position.lower(), position.title())
+                for field in rest
+                for position in re.split(r"[\s;|]+", field)
+                if position
+            ]
+            champs[champ.strip()] = positions
+    return champs
+
+
+def read_file(path: Path) -> dict[str, list[str]]:
+    """Champions from a json or csv file."""
+    if path.suffix.lower() == ".csv":
+        return read_csv(path)
+    with path.open(encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def save(champs: dict[str, list[str]]) -> None:
+    """Write the pool sorted by name, replacing the file in one step.
+
+    The bot reloads the file when it changes, so it must never see it half
+    written.
+    """
+    temp = CHAMPS.with_name(f"{CHAMPS.name}.tmp")
+    with temp.open("w", encoding="utf-8") as json_file:
+        json.dump(OrderedDict(sorted(champs.items())), json_file, indent=2)
+    os.replace(temp, CHAMPS)
+
+
+def bulk_import(path: Path) -> None:
+    """Validate a file of champions and merge it into the pool.
+
+    Champions already in the pool get the positions from the file.
+    """
+    with CHAMPS.open(encoding="utf-8") as json_file:
+        champs: dict[str, list[str]] = json.load(json_file)
+    try:
+        new_champs = validate_champs(read_file(path))
+    except ValueError as err:
+        raise SystemExit(f"Nothing imported, {path} has problems:\n{err}") from err
+    added = sum(champ not in champs for champ in new_champs)
+    champs.update(new_champs)
+    save(champs)
+    print(
+        f"Imported {len(new_champs)} champs ({added} new, "
+        f"{len(new_champs) - added} updated), {len(champs)} in the pool."
+    )
 
 
 def main() -> None:
     """Add new champs. Enter a blank to exit."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--import", dest="source", type=Path, help="json or csv file of champs"
+    )
+    args = parser.parse_args()
+    if args.source is not None:
+        bulk_import(args.source)
+        return
+
     with CHAMPS.open(encoding="utf-8") as json_file:
         unordered_champs: dict[str, list[str]] = json.load(json_file)
     while champ := input("Enter the champ's name (enter blank to exit): "):
         positions = input("Enter the champ's positions (b, m, d, s, j): ")
-        roles = {"b": "Baron", "m": "Mid", "d": "Dragon", "s": "Support", "j": "Jungle"}
         # builds = input("Enter the champ's builds: ")
-        # new_champ = {champ: {"positions": [roles[i] for i in positions], "builds": []}}
-        new_champ = {champ: [roles[i] for i in sorted(positions)]}
+        # new_champ = {champ: {"positions": [ROLES[i] for i in positions], "builds": []}}
+        new_champ = {champ: [ROLES[i] for i in sorted(positions)]}
         unordered_champs.update(new_champ)
-    champs = OrderedDict(sorted(unordered_champs.items()))
-    with CHAMPS.open("w", encoding="utf-8") as json_file:
-        json.dump(champs, json_file, indent=2)
+    save(unordered_champs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""
+Rate limits for automatic replies, per guild, channel and feature.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+
+@dataclass(slots=True)
+class CooldownStats:
+    """Counters for a limiter."""
+
+    allowed: int = 0
+    limited: int = 0
+    expired: int = 0  # keys dropped after sitting idle for the ttl
+    evicted: int = 0  # keys dropped to stay under max_keys
+
+
+class RateLimiter(ABC):
+    """Per-key limiter with idle expiry and a hard cap on tracked keys.
+
+    Keys are kept in least recently used order, so expiring idle keys and
+    evicting for space both only ever look at the front of the queue.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        per: float,
+        ttl: float | None = None,
+        max_keys: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.limit = limit
+        self.per = per
+        # Once a key has been idle this long it is back to a fresh state anyway.
+        self.ttl = per if ttl is None else ttl
+        self.max_keys = max_keys
+        self.clock = clock
+        self.stats = CooldownStats()
+        self._state: OrderedDict[Hashable, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def _expire(self, now: float) -> None:
+        while self._state:
+            key, state = next(iter(self._state.items()))
+            if now - state[-1] < self.ttl:
+                break
+            del self._state[key]
+            self.stats.expired += 1
+
+    @abstractmethod
+    def _fresh(self, now: float) -> list[float]:
+        """State for a key that has not been seen, last item is time last seen."""
+
+    @abstractmethod
+    def _take(self, state: list[float], now: float) -> bool:
+        """Try to use one unit of the key's allowance."""
+
+    def allow(self, key: Hashable) -> bool:
+        """Check and use the allowance for key.
+
+        Returns:
+            bool: True if the action may go ahead.
+        """
+        now = self.clock()
+        self._expire(now)
+        if (state := self._state.get(key)) is None:
+            state = self._state[key] = self._fresh(now)
+            if len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+                self.stats.evicted += 1
+        else:
+            self._state.move_to_end(key)
+        allowed = self._take(state, now)
+        state[-1] = now
+        if allowed:
+            self.stats.allowed += 1
+        else:
+            self.stats.limited += 1
+        return allowed
+
+    def reset(self, key: Hashable) -> None:
+        """Forget key so its next action is allowed."""
+        self._state.pop(key, None)
+
+
+class FixedWindow(RateLimiter):
+    """At most limit actions per key in each window of per seconds.
+
+    The window starts with the first allowed action.
+
+    >>> now = [0.0]
+    >>> cooldown = FixedWindow(1, 600, clock=lambda: now[0])
+    >>> cooldown.allow("channel"), cooldown.allow("channel")
+    (True, False)
+    >>> now[0] = 601
+    >>> cooldown.allow("channel")
+    True
+    """
+
+    def _fresh(self, now: float) -> list[float]:
+        return [now, 0, now]  # window start, actions in window, last seen
+
+    def _take(self, state: list[float], now: float) -> bool:
+        if now - state[0] >= self.per:
+            state[0], state[1] = now, 0
+        if state[1] >= self.limit:
+            return False
+        state[1] += 1
+        return True
+
+
+class TokenBucket(RateLimiter):
+    """Bursts of up to limit actions, refilled at limit per `per` seconds.
+
+    >>> now = [0.0]
+    >>> bucket = TokenBucket(2, 10, clock=lambda: now[0])
+    >>> [bucket.allow("key") for _ in range(3)]
+    [True, True, False]
+    >>> now[0] = 5
+    >>> bucket.allow("key"), bucket.allow("key")
+    (True, False)
+    """
+
+    def _fresh(self, now: float) -> list[float]:
+        return [float(self.limit), now]  # tokens, last seen
+
+    def _take(self, state: list[float], now: float) -> bool:
+        refill = (now - state[-1]) * self.limit / self.per
+        state[0] = min(float(self.limit), state[0] + refill)
+        if state[0] < 1:
+            return False
+        state[0] -= 1
+        return True
@@ -9,29 +9,70 @@ Tasks so far:
     Gently remind PYN to announce gamenight
 """
 
+import asyncio
 import configparser
 import datetime as dt
 import json
-import logging
+import re
+import sqlite3
+import time
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Annotated, Awaitable, Callable, Optional, Sequence
 
 import discord
 from discord.ext import commands, tasks
-
+from discord.ext.commands._types import BotT
+
+import backfill
+import cooldown
+import leaderboard
+import logfiles
+import members
+import memberfilter
+import mentions
+import metrics
+import pipeline
+import rendercache
+import scheduler
+import storefronts
 import teambuilder
 import users
-from games import epic_free_games
-from paths import GAMES, INI, MIST, NAMES, PROJ_PATH, TIMEOUTS
+from games import EpicProvider
+from paths import DATABASE, GAMES, INI, MIST, NAMES, PROJ_PATH, TIMEOUTS
+from records import TimeoutRecord, epoch
+from storage import open_storage
 
-TIMEOUT = dict[str, tuple[int, int, str | bool, int]]
+TIMEOUT = dict[int, TimeoutRecord]
 MISTBORN = dt.timedelta(minutes=10)
+LEADERBOARD_PAGE = 5  # rows per page of the timeout leaderboard
+MAX_TEAMS = 20  # most team pairs !teams will make at once
+MESSAGE_LIMIT = 2000  # characters discord allows per message
+FLUSH_INTERVAL = 30  # seconds between writes of the user state files
+MENTION_FLUSH = 5  # seconds mention counts are collected before being written
+MESSAGE_WORKERS = 4  # tasks handling queued messages
+MESSAGE_QUEUE = 1000  # messages queued before new ones are dropped
+# Rendered leaderboards are reused until the data changes, or for this many
+# seconds at most, since live timeout totals and member names change too.
+RENDER_TTL = 15
+TIMEOUT_DATA = ("timeouts", "names")  # user data the timeout boards show
+MAX_WINDOW = 3650  # most days a time windowed command looks back
+CHAMPS_INTERVAL = 10  # seconds between checks of champs.json for changes
+METRICS_PORT = 9108  # local port for the prometheus endpoint
+GAME_NIGHT_JOB = "gamenight"  # scheduler job names
+# Game night reminders: Thursdays from 08:00 until 21:00, every 43 minutes.
+GAME_NIGHT_DAY = 3
+GAME_NIGHT_OPENS = dt.time(8)
+GAME_NIGHT_CLOSES = dt.time(21)
+GAME_NIGHT_EVERY = dt.timedelta(minutes=43)
+EPIC_JOB = "epic"
+# Epic updates the feed shortly after a promotion ends, check a bit later and
+# then every EPIC_RETRY until the new games show up.
+EPIC_GRACE = dt.timedelta(minutes=2)
+EPIC_RETRY = dt.timedelta(minutes=15)
 DISABLED = True
 
-HANDLER = logging.FileHandler(
-    filename=PROJ_PATH / "discord.log", encoding="utf-8", mode="w"
-)
+HANDLER = logfiles.open_log(PROJ_PATH / "discord.log")
 
 
 @dataclass(slots=True)
@@ -80,13 +121,56 @@ class GameNight:
         self.message_index = 0
 
 
+class Window(commands.Converter[int]):
+    """A number of days written like 7d, for time windowed commands."""
+
+    async def convert(self, ctx: commands.Context[BotT], argument: str) -> int:
+        found = re.fullmatch(r"(\d+)d", argument.lower())
+        if found is None or not 0 < int(found[1]) <= MAX_WINDOW:
+            raise commands.BadArgument(f"{argument} is not a window like 7d or 30d.")
+        return int(found[1])
+
+
 def main() -> None:
     """
-    The main bot. Has commands for team, teams, and chaos.
+    Run the bot until it is stopped.
     """
     config = configparser.ConfigParser()
     config.read(INI)
-    bot_token = config["DISCORD"]["BOT_TOKEN"]
+    logfiles.configure(
+        config.getint("LOGGING", "MAX_BYTES", fallback=logfiles.MAX_BYTES),
+        config.getint("LOGGING", "MAX_AGE", fallback=logfiles.MAX_AGE),
+        config.getint("LOGGING", "BACKUPS", fallback=logfiles.BACKUPS),
+        config.getboolean("LOGGING", "JSON", fallback=False),
+    )
+    users.use_backend(
+        open_storage(
+            config.get("STORAGE", "BACKEND", fallback="json"),
+            PROJ_PATH / config.get("STORAGE", "DATABASE", fallback=DATABASE.name),
+        )
+    )
+    bot, _ = build_bot(config)
+    try:
+        bot.run(config["DISCORD"]["BOT_TOKEN"], log_handler=HANDLER)
+    finally:
+        users.flush_mentions_now()
+        users.BACKEND.close()
+
+
+def build_bot(
+    config: configparser.ConfigParser,
+) -> tuple[commands.Bot, pipeline.MessagePipeline]:
+    """
+    The main bot. Has commands for team, teams, and chaos.
+
+    Everything is attached but nothing is connected or started, so the
+    handlers can also be driven offline. User state is read from and written
+    to whatever users.use_backend was last given.
+
+    Returns:
+        tuple[commands.Bot, pipeline.MessagePipeline]: The bot, and the queue
+            its message listeners are run from
+    """
     announcements_channel_id = int(config["DISCORD"]["ANNOUNCEMENTS_CHANNEL_ID"])
     new_games_channel_id = int(config["DISCORD"]["NEW_GAMES_CHANNEL_ID"])
     game_night_channel_id = int(config["DISCORD"]["GAME_NIGHT_CHANNEL_ID"])
@@ -94,8 +178,50 @@ def main() -> None:
     barnmol = config["DISCORD"]["MISTBORN_BEST_USER"]
     administrator = int(config["DISCORD"]["ADMIN"])
 
-    champs, champ_positions = teambuilder.get_champs()
-    sanderson_messages: dict[int, dt.datetime] = {}  # int is channel id
+    champ_pool = teambuilder.ChampPool(
+        weights=teambuilder.parse_weights(config.get("TEAMS", "WEIGHTS", fallback="")),
+        recent=teambuilder.RecentPicks(
+            config.getint("TEAMS", "RECENT", fallback=teambuilder.RECENT_TEAMS),
+            config.getfloat(
+                "TEAMS", "RECENT_WEIGHT", fallback=teambuilder.RECENT_WEIGHT
+            ),
+        ),
+    )
+    # Keyed by (guild id, channel id, feature) so other auto-replies can share it.
+    auto_replies = cooldown.FixedWindow(1, MISTBORN.total_seconds())
+    keyword_matchers = mentions.load_matchers()
+    if config.getboolean("METRICS", "ENABLED", fallback=False):
+        metrics.enable()
+    metrics_port = config.getint("METRICS", "PORT", fallback=METRICS_PORT)
+    metrics.GAUGES["dadbot_auto_replies_allowed"] = lambda: auto_replies.stats.allowed
+    metrics.GAUGES["dadbot_auto_replies_limited"] = lambda: auto_replies.stats.limited
+    metrics.GAUGES["dadbot_auto_replies_tracked"] = lambda: len(auto_replies)
+    member_names = members.MemberNames()
+    renders: rendercache.RenderCache[str] = rendercache.RenderCache(RENDER_TTL)
+    metrics.GAUGES["dadbot_render_cache_hits"] = lambda: renders.stats.hits
+    metrics.GAUGES["dadbot_render_cache_misses"] = lambda: renders.stats.misses
+    metrics.GAUGES["dadbot_render_cache_shared"] = lambda: renders.stats.shared
+    metrics.GAUGES["dadbot_member_names_cached"] = lambda: len(member_names)
+    metrics.GAUGES["dadbot_member_queries"] = lambda: member_names.stats.queries
+    metrics.GAUGES["dadbot_member_queried"] = lambda: member_names.stats.queried
+    background: set[asyncio.Task[None]] = set()
+    background_jobs: set[asyncio.Task[None]] = set()
+    command_starts: dict[int, float] = {}
+    backfills: set[int] = set()  # guilds with a history scan running
+    timeout_roles = config.get(
+        "TIMEOUTS", "ROLES", fallback=str(memberfilter.TIMEOUT_ROLE)
+    )
+    member_filter = memberfilter.MemberUpdateFilter(
+        (int(role) for role in timeout_roles.split(",")),
+        config.getboolean("TIMEOUTS", "NATIVE", fallback=True),
+    )
+    member_updates = member_filter.stats
+    metrics.GAUGES["dadbot_member_updates_passed"] = lambda: member_updates.passed
+    metrics.GAUGES["dadbot_member_updates_dropped"] = lambda: member_updates.dropped
+    timeout_expiries: dict[int, asyncio.Task[None]] = {}
+    metrics.GAUGES["dadbot_mentions_queued"] = lambda: users.MENTION_STATS["queued"]
+    metrics.GAUGES["dadbot_mention_writes"] = lambda: users.MENTION_STATS["writes"]
+    metrics.GAUGES["dadbot_mentions_pending"] = lambda: len(users.PENDING_MENTIONS)
 
     intents = discord.Intents(
         messages=True,
@@ -105,12 +231,38 @@ def main() -> None:
     )
     bot = commands.Bot(command_prefix="!", intents=intents)
     game_night = GameNight()
+    free_games = storefronts.FreeGames([EpicProvider()])
+    for name, breaker in free_games.breakers.items():
+        metrics.GAUGES[f"dadbot_storefront_{name}_open"] = lambda breaker=breaker: int(
+            breaker.open
+        )
+    schedule = scheduler.Scheduler()
+    metrics.GAUGES["dadbot_scheduler_wakeups"] = lambda: schedule.stats.wakeups
+    metrics.GAUGES["dadbot_scheduler_runs"] = lambda: schedule.stats.runs
 
     @bot.event
     async def on_ready() -> None:
+        # Only game night needs the channels checked below; start the rest first.
+        if not flush_state.is_running():
+            flush_state.start()
+        if not flush_mentions.is_running():
+            flush_mentions.start()
+        messages.start()
+        if not reload_champs.is_running():
+            reload_champs.start()
+        if metrics.ENABLED and not background:
+            # on_ready runs again after reconnects, only start these once.
+            background.add(asyncio.create_task(metrics.probe_loop_lag()))
+            await metrics.serve(metrics_port)
+        # Drop a scheduler task that died, so it is started again.
+        background_jobs.difference_update(
+            [task for task in background_jobs if task.done()]
+        )
+        if not background_jobs:
+            background_jobs.add(asyncio.create_task(run_schedule()))
+        await resume_timeouts()
         announcements_channel = bot.get_channel(announcements_channel_id)
         game_night_channel = bot.get_channel(game_night_channel_id)
-        new_games_channel = bot.get_channel(new_games_channel_id)
         if not isinstance(announcements_channel, discord.TextChannel) or not isinstance(
             game_night_channel, discord.TextChannel
         ):
@@ -118,27 +270,54 @@ def main() -> None:
         game_night.announcements_channel = announcements_channel
         game_night.game_night_channel = game_night_channel
         game_night.announcer = bot.get_user(game_night_host_id)
-        # did_pyn_announce_gamenight.start()
-        # epic_games.start(new_games_channel)
+
+    @bot.before_invoke
+    async def start_command_timer(ctx: commands.Context[commands.Bot]) -> None:
+        if metrics.ENABLED:
+            command_starts[id(ctx)] = time.perf_counter()
+
+    @bot.after_invoke
+    async def stop_command_timer(ctx: commands.Context[commands.Bot]) -> None:
+        if (start := command_starts.pop(id(ctx), None)) is not None:
+            name = ctx.command.qualified_name if ctx.command else "unknown"
+            metrics.observe("dadbot_handler_seconds", name, time.perf_counter() - start)
 
     @bot.command(name="team", help="Responds with a random team")
     async def on_message(ctx: commands.Context[commands.Bot]) -> None:
         """
         (1) 5 champ team with roles based on where they normally play
         """
-        await ctx.send("\n".join(teambuilder.make_team(champ_positions)))
+        await ctx.send("\n".join(champ_pool.index.sampler.draw()[0]))
 
-    @bot.command(name="teams", help="Responds with two random teams")
-    async def on_message(ctx: commands.Context[commands.Bot]) -> None:
+    @bot.command(
+        name="teams",
+        help=(
+            f"Responds with two random teams, or N pairs of teams (up to {MAX_TEAMS})."
+            " Give a seed as well to get the same teams every time."
+        ),
+    )
+    async def on_message(
+        ctx: commands.Context[commands.Bot], count: int = 1, seed: Optional[int] = None
+    ) -> None:
         """
-        (2) 5 champ teams with roles based on where they normally play
+        (2) 5 champ teams with roles based on where they normally play.
+        No champ is on both sides.
         """
-        response = ""
-        for side in "AB":
-            squad = "\n> ".join(teambuilder.make_team(champ_positions))
-            response += f"Side {side}\n> {squad}\n"
-
-        await ctx.send(response)
+        count = max(1, min(count, MAX_TEAMS))
+        matches = []
+        sampler = champ_pool.index.sampler
+        if seed is not None:
+            # Reproducible brackets, so recent picks are left out.
+            sampler = sampler.seeded(seed)
+        for match, sides in enumerate(sampler.draw_many(count), start=1):
+            response = f"**Match {match}**\n" if count > 1 else ""
+            for side, team in zip("AB", sides):
+                squad = "\n> ".join(team)
+                response += f"Side {side}\n> {squad}\n"
+            matches.append(response)
+
+        for message in split_message(matches):
+            await ctx.send(message)
 
     @bot.command(
         name="chaos",
@@ -149,90 +328,219 @@ def main() -> None:
         (2) 5 champ teams with roles and builds fully random
         """
         response = ""
+        index = champ_pool.index
         for side in "AB":
-            squad = "\n> ".join(teambuilder.make_chaos(champs))
+            squad = "\n> ".join(teambuilder.make_chaos(index.champs, index.sampler))
             response += f"Side {side}\n> {squad}\n"
 
         await ctx.send(response.strip())  # Remove tailing '\n'
 
-    @bot.command(
+    async def cached(
+        ctx: commands.Context[commands.Bot],
+        command: tuple[str | int, ...],
+        data: tuple[str, ...],
+        render: Callable[[], Awaitable[list[str]]],
+    ) -> str:
+        """A rendered response, reused until the data it shows is written.
+
+        Args:
+            ctx (commands.Context): Context of the command
+            command (tuple): Command name and arguments
+            data (tuple[str, ...]): Kinds of user data the response shows
+            render (Callable): Builds the response lines
+        """
+
+        async def joined() -> str:
+            return "\n".join(await render())
+
+        guild_id = ctx.guild.id if ctx.guild else None
+        return await renders.get((guild_id, *command), users.version(*data), joined)
+
+    async def timeout_leaderboard(
+        guild: Optional[discord.Guild], page: int
+    ) -> list[str]:
+        """Render one page of the timeout leaderboard."""
+        if not await users.timed_out_users():
+            return ["No timeouts yet."]
+        now = dt.datetime.utcnow()
+        most, longest = (
+            list(board)
+            for board in await users.timeout_leaderboard(now, page, LEADERBOARD_PAGE)
+        )
+        first = (page - 1) * LEADERBOARD_PAGE + 1
+        return await render_timeout_boards(guild, most, longest, first)
+
+    async def window_leaderboard(
+        guild: Optional[discord.Guild], days: int
+    ) -> list[str]:
+        """Render the timeout leaderboard for the last days days."""
+        now = dt.datetime.utcnow()
+        most, longest = await users.timeout_window_leaderboard(
+            now, days, LEADERBOARD_PAGE
+        )
+        if not most and not longest:
+            return [f"No timeouts in the last {days} days."]
+        return await render_timeout_boards(
+            guild, most, longest, 1, f" (last {days} days)"
+        )
+
+    async def render_timeout_boards(
+        guild: Optional[discord.Guild],
+        most: Sequence[tuple[int, int | str]],
+        longest: Sequence[tuple[int, int | str]],
+        first: int,
+        window: str = "",
+    ) -> list[str]:
+        """Format the most and longest timed out boards."""
+        names = await member_names.resolve(
+            guild, [user[1] for user in (*most, *longest)]
+        )
+        padding = 30
+        return [
+            f"```Most timed out{window}:",
+            "-" * padding,
+            "\n".join(
+                f"{idx:2}: {user[0]:<4} | {names[int(user[1])]}"
+                for idx, user in enumerate(most, start=first)
+            ),
+            "-" * padding,
+            f"Longest timed out{window}:",
+            "-" * padding,
+            "\n".join(
+                f"{idx:2}: {seconds_to_hms(user[0])} | {names[int(user[1])]}"
+                for idx, user in enumerate(longest, start=first)
+            ),
+            "```",
+        ]
+
+    @bot.group(
         name="jailtime",
         help="Get the total amount of time the user has spent in timeout.",
+        invoke_without_command=True,
     )
-    async def on_message(
-        ctx: commands.Context[commands.Bot], *args: discord.Member
+    async def jailtime(
+        ctx: commands.Context[commands.Bot],
+        days: Annotated[Optional[int], Optional[Window]] = None,
+        *args: discord.Member,
     ) -> None:
         """
-        How long the supplied users have been in jail.
+        How long the supplied users have been in jail, optionally over the
+        last N days, e.g. !jailtime 7d or !jailtime 30d @user.
         """
-        now = dt.datetime.utcnow()
-        guild = ctx.guild
-        with TIMEOUTS.open() as json_file:
-            data: TIMEOUT = json.load(json_file)
         if args:
             # Show a user or multiple users
+            now = dt.datetime.utcnow()
             response: list[str] = []
             for user in args:
-                found = data.get(user.name, (0, 0, False, user.id))
-                timeouts, total_time = users.get_user_timeout_data(now, found)
+                if days is None:
+                    found = await users.user_timeout(user)
+                    timeouts, total_time = users.get_user_timeout_data(now, found)
+                    window = ""
+                else:
+                    timeouts, total_time = await users.user_timeout_window(
+                        user, now, days
+                    )
+                    window = f" in the last {days} days"
                 response.append(
                     (
                         f"{user.mention} has been in timeout {timeouts} times "
-                        f"for {seconds_to_hms(total_time)}."
+                        f"for {seconds_to_hms(total_time)}{window}."
                     )
                 )
-        elif data != {}:
-            # Show the leaderboard
-            leaderboard = users.get_timeout_leaderboard(now, data)
-            padding = 30
+        elif days is not None:
             response = [
-                "```Most timed out:",
-                "-" * padding,
-                "\n".join(
-                    f"{idx:2}: {user[0]:<4} | {users.get_user(guild, user[1])}"
-                    for idx, user in enumerate(leaderboard[0], start=1)
-                ),
-                "-" * padding,
-                "Longest timed out:",
-                "-" * padding,
-                "\n".join(
-                    f"{idx:2}: {seconds_to_hms(user[0])} | {users.get_user(guild, user[1])}"
-                    for idx, user in enumerate(leaderboard[1], start=1)
-                ),
-                "```",
+                await cached(
+                    ctx,
+                    ("jailtime", f"{days}d"),
+                    TIMEOUT_DATA,
+                    lambda: window_leaderboard(ctx.guild, days),
+                )
             ]
         else:
-            response = ["No timeouts yet."]
+            # Show the leaderboard
+            response = [
+                await cached(
+                    ctx,
+                    ("jailtime", 1),
+                    TIMEOUT_DATA,
+                    lambda: timeout_leaderboard(ctx.guild, 1),
+                )
+            ]
         await ctx.send("\n".join(response))
 
-    @bot.command(
+    @jailtime.command(name="page", help="Show a page of the timeout leaderboard.")
+    async def jailtime_page(ctx: commands.Context[commands.Bot], page: int) -> None:
+        """
+        Later pages of the timeout leaderboard.
+        """
+        last_page = leaderboard.pages(await users.timed_out_users(), LEADERBOARD_PAGE)
+        if not 1 <= page <= last_page:
+            await ctx.send(f"Pick a page from 1 to {last_page}.")
+            return
+
+        async def render() -> list[str]:
+            response = await timeout_leaderboard(ctx.guild, page)
+            response.insert(-1, f"Page {page} of {last_page}")
+            return response
+
+        # Page 1 differs from plain !jailtime by its "Page 1 of n" line.
+        await ctx.send(
+            await cached(ctx, ("jailtime", "page", page), TIMEOUT_DATA, render)
+        )
+
+    @bot.group(
         name="mistborn",
         help="Show the Mistborn/Sanderson leaderboard",
+        invoke_without_command=True,
     )
-    async def on_message(ctx: commands.Context[commands.Bot]) -> None:
+    async def mistborn(ctx: commands.Context[commands.Bot]) -> None:
         """
         Show the leaderboard of Mistborn / Sanderson mentions
         """
+        await ctx.send(
+            await cached(
+                ctx,
+                ("mistborn",),
+                (f"mentions:{mentions.MISTBORN}", "names"),
+                lambda: mistborn_board(ctx.guild),
+            )
+        )
 
-        with MIST.open() as json_file:
-            data: dict[str, int] = json.load(json_file)
-        leaderboard = sorted(data.items(), key=lambda x: x[1], reverse=True)
-        guild = ctx.guild
+    async def mistborn_board(guild: Optional[discord.Guild]) -> list[str]:
+        """Render the Mistborn / Sanderson top 10."""
+        leaders = await users.mistborn_leaderboard(10)
+        names = await member_names.resolve(
+            guild, [*(leader[0] for leader in leaders), barnmol]
+        )
 
         res = ["```Mistborn / Sanderson Top 10 Leaderboard"]
-        for idx, (user_id, mentions) in enumerate(leaderboard[:10], start=1):
-            res.append(f"{idx:2}: {mentions:<4} | {users.get_user(guild, user_id)}")
-        if barnmol not in (leader[0] for leader in leaderboard[:10]):
-            res.append(
-                f"\nHonorary Mention: {users.get_user(guild, barnmol)} with {data[barnmol]}"
-            )
+        for idx, (user_id, mentions) in enumerate(leaders, start=1):
+            res.append(f"{idx:2}: {mentions:<4} | {names[int(user_id)]}")
+        if barnmol not in (leader[0] for leader in leaders):
+            mentions = await users.mistborn_mentions(barnmol)
+            res.append(f"\nHonorary Mention: {names[int(barnmol)]} with {mentions}")
         res.append("```")
-        await ctx.send("\n".join(res))
+        return res
+
+    @mistborn.command(name="rank", help="Show where a user is on the leaderboard.")
+    async def mistborn_rank(
+        ctx: commands.Context[commands.Bot], user: discord.Member
+    ) -> None:
+        """
+        A user's place on the Mistborn / Sanderson leaderboard.
+        """
+        rank, mentions = await users.mistborn_rank(user.id)
+        if rank is None:
+            await ctx.send(f"{user.display_name} has never mentioned Mistborn.")
+        else:
+            await ctx.send(
+                f"{user.display_name} is #{rank} with {mentions} mention(s)."
+            )
 
     @bot.command(name="badbot")
     async def kill_task(ctx: commands.Context[commands.Bot]) -> None:
         """Kill switch for the pyn announcement. Just in case."""
-        did_pyn_announce_gamenight.stop()
+        schedule.stop(GAME_NIGHT_JOB)
         await ctx.message.channel.send("PYN task stopped.")
 
     @bot.command(name="goodbot")
@@ -241,12 +549,56 @@ def main() -> None:
         if ctx.message.author.id != administrator:
             await ctx.message.channel.send(f"Nice try {ctx.message.author.mention}")
         else:
-            try:
-                did_pyn_announce_gamenight.start()
+            if schedule.start(GAME_NIGHT_JOB):
                 await ctx.message.channel.send("PYN task started.")
-            except RuntimeError:
+            else:
                 await ctx.message.channel.send("Task already running.")
 
+    @bot.command(name="stats", help="Handler, file and event loop timings.")
+    async def stats(ctx: commands.Context[commands.Bot]) -> None:
+        """Admin only view of the collected metrics."""
+        if ctx.author.id != administrator:
+            await ctx.send(f"Nice try {ctx.author.mention}")
+            return
+        if not metrics.ENABLED:
+            await ctx.send("Metrics are disabled, set [METRICS] ENABLED = true.")
+            return
+        lines = [f"{line}\n" for line in metrics.summary()] or ["Nothing yet.\n"]
+        for message in split_message(lines, MESSAGE_LIMIT - 8):
+            await ctx.send(f"```{message}```")
+
+    @bot.command(name="backfill", help="Recount the mention leaderboards.")
+    async def backfill_mentions(ctx: commands.Context[commands.Bot]) -> None:
+        """
+        Admin only. Rebuild the mention leaderboards from the guild's history.
+        Running it again after an interruption resumes the scan.
+        """
+        if ctx.author.id != administrator:
+            await ctx.send(f"Nice try {ctx.author.mention}")
+            return
+        if ctx.guild is None:
+            return
+        if backfills:
+            await ctx.send("A backfill is already running.")
+            return
+        backfills.add(ctx.guild.id)
+        await ctx.send("Reading channel history, this can take a while.")
+        try:
+            result = await backfill.Backfill(
+                backfill.DiscordHistory(ctx.guild),
+                mentions.matcher_for(keyword_matchers, ctx.guild.id),
+                skip_author=bot.user.id if bot.user else None,
+            ).run()
+        except discord.HTTPException as err:
+            await ctx.send(f"Backfill stopped ({err}), run it again to resume.")
+            return
+        finally:
+            backfills.discard(ctx.guild.id)
+        await ctx.send(
+            f"Recounted {result.messages:,} messages in {result.channels} channels "
+            f"in {seconds_to_hms(int(result.seconds))}."
+        )
+
     @bot.command(name="history")
     async def user_history(
         ctx: commands.Context[commands.Bot], user: discord.Member
@@ -260,35 +612,110 @@ def main() -> None:
         names = "\n".join(history)
         await ctx.message.channel.send(names)
 
+    @bot.command(name="whois", help="Find who has gone by a display name.")
+    async def whois(ctx: commands.Context[commands.Bot], *, name: str) -> None:
+        """
+        Message the channel with the users who have used a name, or one like it.
+        """
+        found = await users.whois(name)
+        if not found:
+            await ctx.send(f"Nobody has gone by {name}.")
+            return
+        names = await member_names.resolve(
+            ctx.guild, [match.user_id for match in found]
+        )
+        await ctx.send(
+            "\n".join(
+                f"{match.name} -> {names[int(match.user_id)]}"
+                + ("" if match.score == 1 else f" ({match.score:.0%} match)")
+                for match in found
+            )
+        )
+
     @bot.event
+    @metrics.timed("on_member_update")
     async def on_member_update(before: discord.Member, after: discord.Member) -> None:
         """
         Update the stored dictionary of user timeouts and name history.
         """
-
-        def check_for_timeout(roles: list[discord.Role]) -> bool:
-            for role in roles:
-                # Timeout role
-                if role.id == 937779479676338196:
-                    return True
-            return False
-
-        if after.display_name != before.display_name:
+        if (change := member_filter.check(before, after)) is None:
+            # Nothing tracked changed, do nothing.
+            return
+        if change.renamed:
+            member_names.remember(after)
             await users.name_change(before)
             await users.name_change(after)
 
+        if change.extended and after.timed_out_until is not None:
+            expire_timeout(after)
         now = dt.datetime.utcnow()
-        before_timeout = check_for_timeout(before.roles)
-        after_timeout = check_for_timeout(after.roles)
-        if before_timeout == after_timeout:
-            # No change, do nothing.
+        if change.timeout is None:
             return
-        if after_timeout:
+        if change.timeout:
             await users.entered_timeout(before, now)
+            if member_filter.native_timeouts and after.timed_out_until is not None:
+                expire_timeout(after)
         else:
+            if (pending := timeout_expiries.pop(after.id, None)) is not None:
+                pending.cancel()
             await users.left_timeout(before, now)
 
-    @bot.listen("on_message")
+    def expire_timeout(member: discord.Member) -> None:
+        """Record the end of a native timeout, which discord sends no update for."""
+
+        async def wait() -> None:
+            current = member
+            # An extended timeout moves timed_out_until, wait for the latest.
+            while (
+                until := current.timed_out_until
+            ) is not None and until > discord.utils.utcnow():
+                await discord.utils.sleep_until(until)
+                current = member.guild.get_member(member.id) or current
+            if timeout_expiries.get(member.id) is asyncio.current_task():
+                del timeout_expiries[member.id]
+            if not member_filter.in_timeout(current):
+                await users.left_timeout(current, dt.datetime.utcnow())
+
+        if (pending := timeout_expiries.pop(member.id, None)) is not None:
+            pending.cancel()
+        timeout_expiries[member.id] = asyncio.create_task(wait())
+
+    async def resume_timeouts() -> None:
+        """Pick up the timeouts left open by the last run.
+
+        Native timeouts still running get their expiry armed again. Timeouts
+        that ended while the bot was down are closed, at their end time if
+        discord still has it.
+        """
+        now = discord.utils.utcnow()
+        for user_id, record in (await users.all_timeouts()).items():
+            if not record.in_timeout or user_id in timeout_expiries:
+                continue
+            member = next(
+                (
+                    found
+                    for guild in bot.guilds
+                    if (found := guild.get_member(user_id)) is not None
+                ),
+                None,
+            )
+            if member is None:
+                continue
+            until = member.timed_out_until
+            if member_filter.in_timeout(member):
+                if member_filter.native_timeouts and until is not None and until > now:
+                    expire_timeout(member)
+                # Otherwise it is a timeout role, whose removal is an update.
+                continue
+            ended = now.replace(tzinfo=None)
+            if until is not None and until <= now:
+                native_end = until.astimezone(dt.timezone.utc).replace(tzinfo=None)
+                # A native timeout that ended before this one began is stale.
+                if record.start is not None and epoch(native_end) >= record.start:
+                    ended = native_end
+            await users.left_timeout(member, ended)
+
+    @metrics.timed("someone_mentioned_mistborn")
     async def someone_mentioned_mistborn(msg: discord.Message) -> None:
         """
         Update the mistborn leaderboard when someone mentions Mistborn or Sanderson.
@@ -296,22 +723,24 @@ def main() -> None:
         Args:
             msg (discord.Message): Message sent
         """
-        if (message := msg.content.lower()) == "!mistborn" or msg.author == bot.user:
+        if msg.content.lower().startswith("!mistborn") or msg.author == bot.user:
             # Don't count when the command is called or if the dadbot does it.
             return
-        if cnt := message.count("sanderson") + message.count("mistborn"):
-            mentions = await users.update_mistborn_leaderboard(msg.author, cnt)
-            last_response = sanderson_messages.get(msg.channel.id)
-            if (
-                last_response := sanderson_messages.get(msg.channel.id)
-            ) and dt.datetime.now(tz=dt.timezone.utc) - last_response < MISTBORN:
+        guild_id = msg.guild.id if msg.guild else None
+        counts = mentions.matcher_for(keyword_matchers, guild_id).count(msg.content)
+        for board, cnt in counts.items():
+            if board != mentions.MISTBORN:
+                await users.queue_mentions(board, msg.author, cnt)
+        if cnt := counts.get(mentions.MISTBORN, 0):
+            # Counted straight away so the reply is current, written in a batch.
+            total = await users.queue_mentions(mentions.MISTBORN, msg.author, cnt)
+            if not auto_replies.allow((guild_id, msg.channel.id, "mistborn")):
                 return
-            response = await msg.channel.send(
-                f"{msg.author.display_name} has mentioned Mistborn or Sanderson {mentions} time(s)."
+            await msg.channel.send(
+                f"{msg.author.display_name} has mentioned Mistborn or Sanderson {total} time(s)."
             )
-            sanderson_messages[msg.channel.id] = response.created_at
 
-    @bot.listen("on_message")
+    @metrics.timed("game_night_announcement")
     async def game_night_announcement(message: discord.Message) -> None:
         """Check if the game night announcement happened."""
         # if (
@@ -320,37 +749,121 @@ def main() -> None:
         # ):
         if message.channel == game_night.announcements_channel:
             game_night.last_game_night_announced = message.created_at.date()
+            game_night.mission_accomplished()
+            # No more reminders are needed today.
+            schedule.reschedule(GAME_NIGHT_JOB)
+
+    messages = pipeline.MessagePipeline(
+        [someone_mentioned_mistborn, game_night_announcement],
+        config.getint("PIPELINE", "WORKERS", fallback=MESSAGE_WORKERS),
+        config.getint("PIPELINE", "QUEUE", fallback=MESSAGE_QUEUE),
+    )
+    queued = messages.stats
+    metrics.GAUGES["dadbot_messages_queued"] = messages.queue.qsize
+    metrics.GAUGES["dadbot_messages_queue_peak"] = lambda: queued.high_water
+    metrics.GAUGES["dadbot_messages_dropped"] = lambda: queued.dropped
+    metrics.GAUGES["dadbot_messages_processed"] = lambda: queued.processed
+    metrics.GAUGES["dadbot_message_handler_errors"] = lambda: queued.failed
+    metrics.GAUGES["dadbot_log_records_queued"] = logfiles.queued
+
+    @bot.listen("on_message")
+    async def queue_message(message: discord.Message) -> None:
+        """Hand the message to the pipeline workers."""
+        if not messages.submit(message) and queued.dropped % 100 == 1:
+            users.LOGGER.warning(
+                "Message queue full, %d messages dropped so far.", queued.dropped
+            )
 
-    @tasks.loop(minutes=43)
     async def did_pyn_announce_gamenight() -> None:
         """Ping PYN until he announces gamenight."""
         if DISABLED:
             return
-        if (today := dt.datetime.now()).weekday() == 3 and 8 <= today.hour <= 20:
-            # is it Thursday at 8:00 am?
-            if (
-                game_night.last_game_night_announced != today.date()
-                and game_night.game_night_channel is not None
-            ):
-                await game_night.game_night_channel.send(game_night.message)
-            else:
-                game_night.mission_accomplished()
+        now = dt.datetime.now()
+        if (
+            now.weekday() != GAME_NIGHT_DAY
+            or not GAME_NIGHT_OPENS <= now.time() < GAME_NIGHT_CLOSES
+        ):
+            # A late run, e.g. caught up after a restart outside the window.
+            return
+        if (
+            game_night.last_game_night_announced != now.date()
+            and game_night.game_night_channel is not None
+        ):
+            await game_night.game_night_channel.send(game_night.message)
 
-    @tasks.loop(minutes=1)
-    async def epic_games(new_games_channel: discord.channel.TextChannel) -> None:
-        """Message new games chat with the Epic games of the week."""
-        if DISABLED:
+    async def epic_games() -> None:
+        """Message new games chat with the free games of the week."""
+        new_games_channel = bot.get_channel(new_games_channel_id)
+        if DISABLED or not isinstance(new_games_channel, discord.TextChannel):
             return
-        current = list(epic_free_games())
-        with GAMES.open("r", encoding="utf8") as fp:
-            last = json.load(fp)
-        if last == current:
+        current = await free_games.fetch()
+        # Nothing known yet, or every storefront is failing.
+        if not current or not await asyncio.to_thread(storefronts.changed, current):
             return
-        with GAMES.open("w") as f:
-            json.dump(current, f)
-        await new_games_channel.send("\n".join(current))
+        await asyncio.to_thread(storefronts.save, current)
+        await new_games_channel.send("\n".join(game.url for game in current))
+
+    def next_epic_check(now: dt.datetime) -> dt.datetime | None:
+        """Just after the current promotions end, or a retry if that is unknown."""
+        if DISABLED:
+            return None
+        if (end := free_games.next_change(now)) is None:
+            return now + EPIC_RETRY
+        return end + EPIC_GRACE
+
+    schedule.add(
+        scheduler.Job(
+            GAME_NIGHT_JOB,
+            did_pyn_announce_gamenight,
+            # Until the announcement is made.
+            scheduler.weekly_window(
+                GAME_NIGHT_DAY,
+                GAME_NIGHT_OPENS,
+                GAME_NIGHT_CLOSES,
+                GAME_NIGHT_EVERY,
+                skip=lambda day: game_night.last_game_night_announced == day,
+            ),
+            # A reminder is only worth sending before the next one is due.
+            grace=GAME_NIGHT_EVERY,
+        )
+    )
+    schedule.add(scheduler.Job(EPIC_JOB, epic_games, next_epic_check))
+
+    async def run_schedule() -> None:
+        """Run the scheduled jobs, releasing the http session on shutdown."""
+        try:
+            await schedule.run()
+        finally:
+            await free_games.close()
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_state() -> None:
+        """Write any changed user state to disk."""
+        await users.BACKEND.flush_async()
+
+    @tasks.loop(
+        seconds=config.getfloat("PIPELINE", "MENTION_FLUSH", fallback=MENTION_FLUSH)
+    )
+    async def flush_mentions() -> None:
+        """Write the mention counts collected since the last run."""
+        try:
+            await users.flush_mentions()
+        except (OSError, sqlite3.Error) as err:
+            # e.g. "database is locked"; an uncaught error would stop the loop.
+            users.LOGGER.warning("Mention counts not written, will retry: %s", err)
+
+    @tasks.loop(seconds=CHAMPS_INTERVAL)
+    async def reload_champs() -> None:
+        """Pick up champions added to champs.json without a restart."""
+        try:
+            if await champ_pool.reload():
+                users.LOGGER.info(
+                    "Reloaded %d champions.", len(champ_pool.index.champs)
+                )
+        except (OSError, ValueError) as err:
+            users.LOGGER.warning("Keeping the old champion pool: %s", err)
 
-    bot.run(bot_token, log_handler=HANDLER)
+    return bot, messages
 
 
 def seconds_to_hms(total_seconds: float) -> str:
@@ -369,6 +882,21 @@ def seconds_to_hms(total_seconds: float) -> str:
     return f"{hours}:{minutes}:{seconds}"
 
 
+def split_message(parts: list[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Join parts into as few messages as fit under discord's length limit.
+
+    >>> split_message(["a" * 6, "b" * 6, "c"], limit=10)
+    ['aaaaaa', 'bbbbbbc']
+    """
+    messages: list[str] = []
+    for part in parts:
+        if messages and len(messages[-1]) + len(part) <= limit:
+            messages[-1] += part
+        else:
+            messages.append(part)
+    return messages
+
+
 def file_initialize(file: Path) -> None:
     """Initialize the empty file if it does not exist
 
@@ -0,0 +1,215 @@
+"""
+Append-only log of timeout events, folded into the timeouts snapshot.
+
+Every event carries the full record it produced, so replaying an event is
+idempotent. That keeps recovery simple: whatever survives a crash (snapshot,
+half compacted segments, the live log) can be replayed in order and the
+result is the same as if nothing had happened.
+
+A snapshot in the first, name keyed format is upgraded when it is loaded,
+together with the events logged after it.
+"""
+
+import asyncio
+import datetime as dt
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+import metrics
+from paths import TIMEOUT_ARCHIVE, TIMEOUT_EVENTS
+from records import VERSION, TimeoutRecord, dump_records, load_records
+from store import JsonFile
+
+LOGGER = logging.getLogger("debug")
+COMPACT_EVERY = 500  # events in the live log before it is folded into the snapshot
+
+
+class TimeoutLog:
+    """Timeout records served from memory, persisted as snapshot + event log."""
+
+    def __init__(
+        self,
+        snapshot: JsonFile,
+        path: Path = TIMEOUT_EVENTS,
+        archive: Path = TIMEOUT_ARCHIVE,
+    ) -> None:
+        self.snapshot = snapshot
+        self.path = path
+        self.archive = archive
+        self.pending = 0  # events not yet folded into the snapshot
+        self.merged: int | None = None  # duplicates merged by an upgrade
+        self._records: dict[int, TimeoutRecord] | None = None
+        self._file: IO[str] | None = None
+
+    @property
+    def data(self) -> dict[int, TimeoutRecord]:
+        """Current record for every user, replaying the log on first access."""
+        if self._records is None:
+            self.load()
+        assert self._records is not None
+        return self._records
+
+    def load(self) -> None:
+        """Read the snapshot and replay the events written after it."""
+        self.snapshot.load()
+        raw = self.snapshot.data
+        legacy = raw.get("version") != VERSION
+        self.pending = 0
+        with metrics.timer("dadbot_file_read_seconds", self.path.name):
+            logged = [
+                event
+                for segment in (*_pending_segments(self.path), self.path)
+                for event in _read_events(segment)
+            ]
+        if legacy:
+            # Old events are applied in the old format, so a renamed user's
+            # records are merged only once they are complete.
+            for event in logged:
+                raw[event["name"]] = event["record"]
+            records, merged = load_records(raw)
+        else:
+            records = load_records(raw)[0]
+            for event in logged:
+                # Old events in front of a new snapshot were folded into it
+                # by the upgrade, only newer ones are replayed.
+                if "user" in event:
+                    records[int(event["user"])] = TimeoutRecord.load(
+                        event["user"], event["record"]
+                    )
+        self.pending = len(logged)
+        self._records = records
+        # The records are the copy that is kept up to date from here on.
+        raw.clear()
+        if legacy and (records or logged):
+            self._upgrade(merged)
+
+    def _upgrade(self, merged: int) -> None:
+        """Write the loaded records as a new format snapshot, once."""
+        if self.snapshot.path.exists():
+            backup = self.snapshot.path.with_name(f"{self.snapshot.path.name}.v1")
+            shutil.copy2(self.snapshot.path, backup)
+        self.pending += 1
+        self.compact()
+        self.merged = merged
+        LOGGER.info(
+            "Upgraded %s to version %d, merged %d duplicate record(s).",
+            self.snapshot.path.name,
+            VERSION,
+            merged,
+        )
+
+    def record(self, event: str, record: TimeoutRecord, when: dt.datetime) -> None:
+        """Apply an event and append it to the log.
+
+        Args:
+            event (str): "enter" or "leave"
+            record (TimeoutRecord): Record after the event
+            when (dt.datetime): Time of the event
+        """
+        self.data[record.user_id] = record
+        if self._file is None:
+            self._file = self.path.open("a", encoding="utf8")
+        line = {
+            "event": event,
+            "time": when.isoformat(),
+            "user": record.user_id,
+            "record": record.dump(),
+        }
+        with metrics.timer("dadbot_file_write_seconds", self.path.name):
+            self._file.write(json.dumps(line) + "\n")
+            self._file.flush()
+        self.pending += 1
+
+    def dumps(self) -> str:
+        """Serialize the records as a snapshot."""
+        return json.dumps(dump_records(self.data), indent=2)
+
+    def _rotate(self) -> None:
+        """Move the live log aside so new events start a fresh file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path.exists():
+            segment = self.path.with_name(f"{self.path.name}.{time.time_ns()}.pending")
+            os.replace(self.path, segment)
+
+    def _archive(self) -> None:
+        """Keep compacted segments for auditing."""
+        self.archive.mkdir(exist_ok=True)
+        for segment in _pending_segments(self.path):
+            archived = self.archive / f"timeouts-{_segment_id(segment)}.jsonl"
+            os.replace(segment, archived)
+
+    def compact(self) -> bool:
+        """Fold the log into the snapshot.
+
+        Returns:
+            bool: True if there was anything to fold.
+        """
+        if not self.pending:
+            return False
+        self._rotate()
+        self.snapshot.write(self.dumps())
+        self.pending = 0
+        self._archive()
+        return True
+
+    async def compact_async(self) -> bool:
+        """Like compact, but the snapshot is written on a worker thread."""
+        if not self.pending:
+            return False
+        self._rotate()
+        text = self.dumps()
+        pending, self.pending = self.pending, 0
+        try:
+            await asyncio.to_thread(self.snapshot.write, text)
+        except OSError:
+            self.pending += pending
+            raise
+        await asyncio.to_thread(self._archive)
+        return True
+
+    def close(self) -> None:
+        """Compact and release the log file."""
+        self.compact()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _segment_id(segment: Path) -> int:
+    """Rotation time stored in a segment's name (timeouts.jsonl.<ns>.pending)."""
+    return int(segment.suffixes[-2][1:])
+
+
+def _pending_segments(live: Path) -> list[Path]:
+    """Logs rotated out for compaction that have not been archived yet."""
+    return sorted(live.parent.glob(f"{live.name}.*.pending"), key=_segment_id)
+
+
+def _read_events(path: Path) -> Iterator[dict[str, Any]]:
+    """Events in a log file, skipping a torn final line."""
+    if not path.exists():
+        return
+    with path.open(encoding="utf8") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def events(
+    archive: Path = TIMEOUT_ARCHIVE, live: Path = TIMEOUT_EVENTS
+) -> Iterator[dict[str, Any]]:
+    """Every timeout event recorded, oldest first, for re-aggregation."""
+    archived = sorted(
+        archive.glob("timeouts-*.jsonl"), key=lambda path: int(path.stem[9:])
+    )
+    for segment in (*archived, *_pending_segments(live), live):
+        yield from _read_events(segment)
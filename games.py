@@ -1,18 +1,53 @@
 """
 Gather information on other games.
+
+Epic's promotions feed is the first storefronts.Provider, EpicProvider.
 """
+
 from __future__ import annotations
 
+import asyncio
 import json
+import random
+import sys
+import time
+import tracemalloc
 import urllib.request
-from datetime import datetime
-from typing import Any, Iterable
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple
 
+import aiohttp
 from attr import dataclass
 
+import storefronts
+from paths import EPIC_CACHE, GAMES
+
+EPIC_URL = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
 PROMO = dict[str, list[dict[str, list[dict[str, str]]]]]
 PRICE = dict[str, dict[str, int]]
 GAME = dict[str, str | PROMO | PRICE]
+# The only keys of the promotions payload that EpicGame needs.
+FIELDS = frozenset(
+    (
+        "data",
+        "Catalog",
+        "searchStore",
+        "elements",
+        "title",
+        "catalogNs",
+        "mappings",
+        "pageSlug",
+        "productSlug",
+        "price",
+        "totalPrice",
+        "discountPrice",
+        "promotions",
+        "promotionalOffers",
+        "startDate",
+        "endDate",
+    )
+)
 
 
 @dataclass(slots=True)
@@ -20,7 +55,7 @@ class EpicGame:
     title: str
     url: str
     price: int
-    promo: tuple[str, str] | None
+    promo: tuple[datetime, datetime] | None
 
     @classmethod
     def from_json(cls, json_data: dict[str, Any]) -> EpicGame:
@@ -36,18 +71,40 @@ class EpicGame:
             promo=get_promo_dates(json_data),
         )
 
-    def valid(self) -> bool:
+    def free_game(self) -> storefronts.FreeGame:
+        """The game as the storefronts merge it."""
+        ends = self.promo[1] if self.promo is not None else None
+        return storefronts.FreeGame(self.title, self.url, EpicProvider.name, ends)
+
+    def valid(self, today: date | None = None) -> bool:
         """Check that a game is valid"""
         if self.promo is None or not self.url:
             return False
-        today = datetime.now()
-        start = datetime.strptime(self.promo[0].split("T")[0], "%Y-%m-%d")
-        end = datetime.strptime(self.promo[1].split("T")[0], "%Y-%m-%d")
-        return start.date() <= today.date() <= end.date()
+        if today is None:
+            today = datetime.now().date()
+        return self.promo[0].date() <= today <= self.promo[1].date()
+
+
+def _parse_time(value: str) -> datetime:
+    """An Epic timestamp. Before 3.11 fromisoformat does not accept "Z".
+
+    >>> _parse_time("2023-03-16T15:00:00.000Z")
+    datetime.datetime(2023, 3, 16, 15, 0, tzinfo=datetime.timezone.utc)
+    """
+    if value.endswith("Z"):
+        value = f"{value[:-1]}+00:00"
+    return datetime.fromisoformat(value)
 
 
-def get_promo_dates(data: dict[str, Any]) -> tuple[str, str] | None:
-    """Parse the promos dict for current dates"""
+def get_promo_dates(data: dict[str, Any]) -> tuple[datetime, datetime] | None:
+    """Parse the promos dict for current dates
+
+    >>> get_promo_dates({"promotions": {"promotionalOffers": [{"promotionalOffers": \
+[{"startDate": "2023-03-16T15:00:00.000Z", "endDate": "2023-03-23T15:00:00.000Z"}]}]}})
+    ... # doctest: +NORMALIZE_WHITESPACE
+    (datetime.datetime(2023, 3, 16, 15, 0, tzinfo=datetime.timezone.utc),
+     datetime.datetime(2023, 3, 23, 15, 0, tzinfo=datetime.timezone.utc))
+    """
     promo = data.get("promotions")
     if promo is None:
         return None
@@ -55,23 +112,230 @@ def get_promo_dates(data: dict[str, Any]) -> tuple[str, str] | None:
     if len(offers) == 0:
         return None
     dates = offers[0]["promotionalOffers"][0]
-    return (dates["startDate"], dates["endDate"])
+    return (
+        _parse_time(dates["startDate"]),
+        _parse_time(dates["endDate"]),
+    )
+
+
+def _project(pairs: list[tuple[str, Any]]) -> dict[str, Any]:
+    """Keep only the fields we use so the rest of the payload is freed early."""
+    return {key: value for key, value in pairs if key in FIELDS}
+
+
+def parse_games(payload: bytes | str) -> list[EpicGame]:
+    """Every game in a promotions payload.
+
+    Objects are projected down to FIELDS as the decoder builds them, so
+    descriptions, images, tags etc. never outlive their parent object.
+    """
+    data = json.loads(payload, object_pairs_hook=_project)
+    raw_games: list[GAME] = data["data"]["Catalog"]["searchStore"]["elements"]
+    return [EpicGame.from_json(game) for game in raw_games]
+
+
+def current_free_games(payload: bytes) -> list[EpicGame]:
+    """The games that are free right now in a promotions payload."""
+    today = datetime.now().date()
+    games = [game for game in parse_games(payload) if game.price == 0]
+    return [game for game in games if game.valid(today)]
+
+
+def parse_free_games(payload: bytes, show_all_data: bool = False) -> list[str]:
+    """Urls of the games that are free right now in a promotions payload."""
+    free = current_free_games(payload)
+    if show_all_data:
+        print(*free, sep="\n")
+    return [game.url for game in free]
+
+
+class ParseStats(NamedTuple):
+    """Cost of parsing one payload."""
+
+    seconds: float
+    peak_bytes: int
+    games: int
+
+
+def profile_parse(payload: bytes, projected: bool = True) -> ParseStats:
+    """Measure time and peak memory of parsing a promotions payload.
+
+    Args:
+        payload (bytes): Raw response body
+        projected (bool): Use the projecting parser instead of a full json.loads
+    """
+
+    def full(raw: bytes) -> list[EpicGame]:
+        data = json.loads(raw)
+        elements = data["data"]["Catalog"]["searchStore"]["elements"]
+        return [EpicGame.from_json(game) for game in elements]
+
+    parse = parse_games if projected else full
+    tracemalloc.start()
+    start = time.perf_counter()
+    games = parse(payload)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ParseStats(seconds, peak, len(games))
 
 
 def epic_free_games(show_all_data: bool = False) -> Iterable[str]:
     """Get the free games of the week from epic."""
-    site = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
-    response = urllib.request.urlopen(site)
+    response = urllib.request.urlopen(EPIC_URL)
     if response.code != 200:
         return ["No Games Found"]
-    data = json.loads(response.read())
-    raw_games: list[GAME] = data["data"]["Catalog"]["searchStore"]["elements"]
-    games = [EpicGame.from_json(game) for game in raw_games]
-    if show_all_data:
-        print(*[game for game in games if game.valid() and game.price == 0], sep="\n")
-    return (game.url for game in games if game.valid() and game.price == 0)
+    return parse_free_games(response.read(), show_all_data)
+
+
+class EpicFetcher:
+    """Polls the Epic promotions endpoint from the event loop.
+
+    Requests are conditional (ETag / If-Modified-Since) and the last payload
+    is cached on disk, so an unchanged feed costs a 304 and no parsing, even
+    across restarts.
+    """
+
+    def __init__(
+        self,
+        url: str = EPIC_URL,
+        cache: Path = EPIC_CACHE,
+        timeout: float = 10,
+        retries: int = 3,
+        backoff: float = 2,
+    ) -> None:
+        self.url = url
+        self.cache = cache
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.validators: dict[str, str] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self._load_cache()
+
+    @property
+    def _meta(self) -> Path:
+        return self.cache.with_name(f"{self.cache.name}.meta")
+
+    def _load_cache(self) -> None:
+        if self.cache.exists() and self._meta.exists():
+            self.validators = json.loads(self._meta.read_text(encoding="utf8"))
+
+    def _save_cache(self, payload: bytes) -> None:
+        self.cache.write_bytes(payload)
+        self._meta.write_text(json.dumps(self.validators), encoding="utf8")
+
+    def cached(self) -> bytes | None:
+        """The last payload received, if any."""
+        return self.cache.read_bytes() if self.cache.exists() else None
+
+    async def session(self) -> aiohttp.ClientSession:
+        """The pooled session, created on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def fetch(self) -> bytes | None:
+        """Get the promotions payload.
+
+        Returns:
+            bytes | None: The new payload, or None if it has not changed.
+        Raises:
+            aiohttp.ClientError: The request kept failing after every retry.
+        """
+        headers = {}
+        if etag := self.validators.get("etag"):
+            headers["If-None-Match"] = etag
+        if modified := self.validators.get("last_modified"):
+            headers["If-Modified-Since"] = modified
+        session = await self.session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(self.url, headers=headers) as response:
+                    if response.status == 304:
+                        return None
+                    if response.status >= 500:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                        )
+                    response.raise_for_status()
+                    payload = await response.read()
+                    self.validators = {
+                        key: value
+                        for key, header in (
+                            ("etag", "ETag"),
+                            ("last_modified", "Last-Modified"),
+                        )
+                        if (value := response.headers.get(header))
+                    }
+                    await asyncio.to_thread(self._save_cache, payload)
+                    return payload
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                if attempt == self.retries or (
+                    isinstance(err, aiohttp.ClientResponseError) and err.status < 500
+                ):
+                    raise
+                # Exponential backoff with jitter so retries don't line up.
+                delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                await asyncio.sleep(delay)
+        return None
+
+    async def close(self) -> None:
+        """Close the pooled session."""
+        if self._session is not None:
+            await self._session.close()
+
+
+class EpicProvider(storefronts.Provider):
+    """Free games from the Epic promotions feed."""
+
+    name = "epic"
+    timeout = 90.0  # EpicFetcher's retries and backoff included
+
+    def __init__(self, fetcher: EpicFetcher | None = None) -> None:
+        self.fetcher = fetcher if fetcher is not None else EpicFetcher()
+        self._loaded = False
+
+    async def free_games(self) -> list[storefronts.FreeGame] | None:
+        payload = await self.fetcher.fetch()
+        if payload is None:
+            # Unchanged since before a restart, the games are still needed
+            # for their end dates and the merge.
+            if self._loaded or (payload := self.fetcher.cached()) is None:
+                return None
+        free = await asyncio.to_thread(current_free_games, payload)
+        self._loaded = True
+        return [game.free_game() for game in free]
+
+    async def close(self) -> None:
+        await self.fetcher.close()
+
+
+async def fetch_free_games() -> list[storefronts.FreeGame]:
+    """Fetch the free games of every storefront once."""
+    free_games = storefronts.FreeGames([EpicProvider()])
+    try:
+        return await free_games.fetch()
+    finally:
+        await free_games.close()
 
 
 if __name__ == "__main__":
-    with open("games.json", "w", encoding="utf8") as fp:
-        json.dump(list(epic_free_games(True)), fp)
+    if "--profile" in sys.argv:
+        # Compare parsers on the last payload the bot fetched.
+        raw = EPIC_CACHE.read_bytes()
+        for label, projected in (("full", False), ("projected", True)):
+            stats = profile_parse(raw, projected)
+            print(
+                f"{label:>9}: {stats.seconds * 1000:.2f} ms, "
+                f"peak {stats.peak_bytes / 1024:.0f} KiB, {stats.games} games"
+            )
+    else:
+        free = asyncio.run(fetch_free_games())
+        print(*free, sep="\n")
+        storefronts.save(free, GAMES)
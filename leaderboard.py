@@ -0,0 +1,158 @@
+"""
+Leaderboards kept in rank order as scores change.
+"""
+
+import datetime as dt
+from bisect import bisect_left, insort
+from typing import Iterator
+
+from records import TimeoutRecord, epoch
+
+
+class Leaderboard:
+    """Scores per key, kept sorted so reads never sort.
+
+    Rank lookups are a binary search and the top entries are a slice.
+    Changing a score is a binary search plus a memmove of the sorted list,
+    which stays well under a millisecond at a million entries.
+
+    >>> board = Leaderboard({"a": 3, "b": 5})
+    >>> board.add("c", 4)
+    4
+    >>> board.top(2)
+    [('b', 5), ('c', 4)]
+    >>> board.rank("a"), board.rank("z")
+    (3, None)
+    """
+
+    def __init__(self, scores: dict[str, int] | None = None) -> None:
+        self._scores: dict[str, int] = {}
+        self._order: list[tuple[int, str]] = []  # (-score, key), ascending
+        if scores:
+            self.load(scores)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._scores
+
+    def load(self, scores: dict[str, int]) -> None:
+        """Replace every score."""
+        self._scores = dict(scores)
+        self._order = sorted((-score, key) for key, score in self._scores.items())
+
+    def get(self, key: str) -> int:
+        """Score for key, 0 if unknown."""
+        return self._scores.get(key, 0)
+
+    def set(self, key: str, score: int) -> None:
+        """Change the score for key."""
+        if (old := self._scores.get(key)) is not None:
+            if old == score:
+                return
+            del self._order[bisect_left(self._order, (-old, key))]
+        self._scores[key] = score
+        insort(self._order, (-score, key))
+
+    def add(self, key: str, amount: int) -> int:
+        """Add to the score for key.
+
+        Returns:
+            int: The new score.
+        """
+        score = self.get(key) + amount
+        self.set(key, score)
+        return score
+
+    def rank(self, key: str) -> int | None:
+        """1 based position of key, None if it has no score."""
+        if (score := self._scores.get(key)) is None:
+            return None
+        return bisect_left(self._order, (-score, key)) + 1
+
+    def top(self, limit: int, offset: int = 0) -> list[tuple[str, int]]:
+        """Highest scores first.
+
+        Args:
+            limit (int): Number of entries
+            offset (int): Number of entries to skip
+        Returns:
+            list[tuple[str, int]]: key and score
+        """
+        return [(key, -score) for score, key in self._order[offset : offset + limit]]
+
+
+class TimeoutLeaderboard:
+    """Rankings by number of timeouts and by time spent in timeout.
+
+    Totals are indexed as banked when a user leaves timeout. Anyone still in
+    timeout is tracked separately and their live total is merged in on read,
+    which only ever touches the people currently in timeout.
+    """
+
+    def __init__(self, data: dict[int, TimeoutRecord] | None = None) -> None:
+        # Keyed by user id as a string, like the mention leaderboards.
+        self.counts = Leaderboard()
+        self.totals = Leaderboard()
+        self.active: dict[str, int] = {}  # epoch seconds each timeout started
+        if data:
+            self.load(data)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def load(self, data: dict[int, TimeoutRecord]) -> None:
+        """Replace every record."""
+        self.counts.load({str(user): record.count for user, record in data.items()})
+        self.totals.load({str(user): record.seconds for user, record in data.items()})
+        self.active = {
+            str(user): record.start
+            for user, record in data.items()
+            if record.start is not None
+        }
+
+    def update(self, record: TimeoutRecord) -> None:
+        """Record a changed timeout record."""
+        key = str(record.user_id)
+        self.counts.set(key, record.count)
+        self.totals.set(key, record.seconds)
+        if record.start is None:
+            self.active.pop(key, None)
+        else:
+            self.active[key] = record.start
+
+    def top(
+        self, time: dt.datetime, limit: int = 5, offset: int = 0
+    ) -> tuple[Iterator[tuple[int, int]], ...]:
+        """Most and longest timed out people, like users.get_timeout_leaderboard.
+
+        Args:
+            time (dt.datetime): Time of the current check
+            limit (int): Number of users per board
+            offset (int): Number of users to skip
+        Returns:
+            tuple[Iterator[tuple[int, int]], ...]: count / seconds and user id.
+        """
+        most = self.counts.top(limit, offset)
+        # Live totals only ever move people up, so the banked top plus
+        # everyone in timeout is enough to find the live top.
+        candidates = dict(self.totals.top(offset + limit))
+        now = epoch(time)
+        for user, start in self.active.items():
+            candidates[user] = self.totals.get(user) + now - start
+        longest = sorted(candidates.items(), key=lambda x: (-x[1], x[0]))
+        longest = longest[offset : offset + limit]
+        return (
+            ((count, int(user)) for user, count in most),
+            ((total, int(user)) for user, total in longest),
+        )
+
+
+def pages(total: int, per_page: int) -> int:
+    """Number of pages needed to show total entries.
+
+    >>> pages(11, 5), pages(0, 5)
+    (3, 1)
+    """
+    return max(1, -(-total // per_page))
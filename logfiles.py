@@ -0,0 +1,184 @@
+"""
+Log files written from a background thread.
+
+Loggers get a QueueHandler, which only puts the record on a queue, and a
+QueueListener thread does the formatting and the disk writes. A slow disk
+then never holds up the event loop. Files are appended to, so history
+survives restarts. They are rotated by size and by age, and rotated files
+are gzipped.
+
+Records can be written as JSON lines instead of text. Each line then has
+timing fields: when the record was made and how long it waited in the queue.
+"""
+
+import atexit
+import copy
+import datetime as dt
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any
+
+MAX_BYTES = 10 * 1024 * 1024  # a log file is rotated once it reaches this size
+MAX_AGE = 86400  # seconds, a log file is rotated once a day (UTC) if not sooner
+BACKUPS = 7  # rotated files kept for each log
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s"
+# Attributes every LogRecord has; anything else came in through extra=.
+STANDARD = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# Every file handler, queue and listener opened, so configure, queued and stop
+# reach them all.
+FILES: list["RotatingLog"] = []
+QUEUES: list["queue.SimpleQueue[logging.LogRecord]"] = []
+LISTENERS: list[QueueListener] = []
+
+
+class JsonLines(logging.Formatter):
+    """Formats records as one JSON object per line.
+
+    >>> record = logging.makeLogRecord(
+    ...     {"msg": "hi %s", "args": ("vin",), "created": 0.0, "seconds": 1.5}
+    ... )
+    >>> line = json.loads(JsonLines().format(record))
+    >>> line["message"], line["time"], line["seconds"]
+    ('hi vin', '1970-01-01T00:00:00+00:00', 1.5)
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line: dict[str, Any] = {
+            "time": dt.datetime.fromtimestamp(
+                record.created, dt.timezone.utc
+            ).isoformat(),
+            "created": record.created,
+            "queued_ms": round((time.time() - record.created) * 1000, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        line.update(
+            (key, value) for key, value in vars(record).items() if key not in STANDARD
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line["exception"] = record.exc_text
+        if record.stack_info:
+            line["stack"] = record.stack_info
+        return json.dumps(line, default=str)
+
+
+class RotatingLog(RotatingFileHandler):
+    """A log file rotated by size and by age, keeping gzipped backups.
+
+    Backups are named like debug.log.1.gz, newest first.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = MAX_BYTES,
+        max_age: int = MAX_AGE,
+        backups: int = BACKUPS,
+    ) -> None:
+        super().__init__(path, encoding="utf-8", delay=True)
+        self.setFormatter(logging.Formatter(TEXT_FORMAT))
+        self.set_rotation(max_bytes, max_age, backups)
+
+    def set_rotation(self, max_bytes: int, max_age: int, backups: int) -> None:
+        """Change when the file is rotated and how many backups are kept."""
+        self.maxBytes = max_bytes
+        self.backupCount = backups
+        self.max_age = max_age
+        # A file written before a restart is rotated by the age of its last
+        # write, so a bot restarted every day still starts a new file daily.
+        path = Path(self.baseFilename)
+        written = path.stat().st_mtime if path.exists() else time.time()
+        self.rollover_at = self._next_rollover(written)
+
+    def _next_rollover(self, after: float) -> float:
+        return (after // self.max_age + 1) * self.max_age
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        self.rollover_at = self._next_rollover(time.time())
+        if os.path.exists(self.baseFilename):
+            super().doRollover()
+
+    def rotation_filename(self, default_name: str) -> str:
+        return f"{default_name}.gz"
+
+    def rotate(self, source: str, dest: str) -> None:
+        with open(source, "rb") as log, gzip.open(dest, "wb") as packed:
+            shutil.copyfileobj(log, packed)
+        os.remove(source)
+
+
+class _Enqueue(QueueHandler):
+    """Puts records on the queue for the listener thread to format.
+
+    Only the message and any traceback are resolved here, since arguments
+    and exc_info may not be safe to read later on another thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def open_log(path: Path) -> QueueHandler:
+    """A handler that writes to a rotated log file from a background thread.
+
+    Args:
+        path (Path): Log file, appended to if it exists
+
+    Returns:
+        QueueHandler: Handler to add to a logger, or pass to discord.py
+    """
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    file = RotatingLog(path)
+    listener = QueueListener(records, file, respect_handler_level=True)
+    listener.start()
+    FILES.append(file)
+    QUEUES.append(records)
+    LISTENERS.append(listener)
+    return _Enqueue(records)
+
+
+def configure(
+    max_bytes: int = MAX_BYTES,
+    max_age: int = MAX_AGE,
+    backups: int = BACKUPS,
+    json_lines: bool = False,
+) -> None:
+    """Apply the configured rotation and format to every open log file."""
+    for file in FILES:
+        file.set_rotation(max_bytes, max_age, backups)
+        file.setFormatter(JsonLines() if json_lines else logging.Formatter(TEXT_FORMAT))
+
+
+def queued() -> int:
+    """Records waiting to be written."""
+    return sum(records.qsize() for records in QUEUES)
+
+
+@atexit.register
+def stop() -> None:
+    """Write every queued record and stop the listener threads."""
+    while LISTENERS:
+        LISTENERS.pop().stop()
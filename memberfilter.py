@@ -0,0 +1,98 @@
+"""
+Drop member updates that do not change anything the bot tracks.
+
+Discord sends a member update for every role, avatar, nickname, boost and
+timeout change in the guild. The bot only cares about display names and
+whether someone is in timeout, so updates are checked against just those
+before any handler work is done.
+"""
+
+import datetime as dt
+from dataclasses import dataclass
+from typing import Iterable, NamedTuple
+
+import discord
+
+TIMEOUT_ROLE = 937779479676338196  # the guild's timeout role
+
+
+@dataclass(slots=True)
+class FilterStats:
+    """Counters for a filter."""
+
+    passed: int = 0  # updates that changed tracked state
+    dropped: int = 0  # updates that did not
+    renames: int = 0
+    timeouts: int = 0  # entered or left timeout
+
+
+class MemberChange(NamedTuple):
+    """What a member update changed."""
+
+    renamed: bool
+    timeout: bool | None  # True entered timeout, False left it, None neither
+    extended: bool = False  # still in a native timeout that now ends elsewhen
+
+
+class MemberUpdateFilter:
+    """Check updates against watched roles, the native timeout and names.
+
+    A member is in timeout if they have any of the timeout roles or, with
+    native timeouts on, an unexpired timed_out_until.
+
+    >>> from types import SimpleNamespace
+    >>> def member(name, roles=()):
+    ...     get_role = lambda role: role if role in roles else None
+    ...     return SimpleNamespace(display_name=name, timed_out_until=None,
+    ...                            get_role=get_role)
+    >>> check = MemberUpdateFilter([1]).check
+    >>> check(member("Vin"), member("Vin", roles=[2])) is None
+    True
+    >>> check(member("Vin"), member("Kelsier", roles=[1]))
+    MemberChange(renamed=True, timeout=True, extended=False)
+    """
+
+    def __init__(
+        self,
+        timeout_roles: Iterable[int] = (TIMEOUT_ROLE,),
+        native_timeouts: bool = True,
+        names: bool = True,
+    ) -> None:
+        self.timeout_roles = frozenset(timeout_roles)
+        self.native_timeouts = native_timeouts
+        self.names = names
+        self.stats = FilterStats()
+
+    def in_timeout(self, member: discord.Member) -> bool:
+        """Whether the member is in timeout by role or natively."""
+        if self.native_timeouts and (until := member.timed_out_until) is not None:
+            # Most members have never been timed out, so the clock is rarely read.
+            if until > dt.datetime.now(dt.timezone.utc):
+                return True
+        # get_role is a binary search of the member's role ids, no Role objects.
+        return any(member.get_role(role) is not None for role in self.timeout_roles)
+
+    def check(
+        self, before: discord.Member, after: discord.Member
+    ) -> MemberChange | None:
+        """What changed, or None if nothing tracked did."""
+        renamed = self.names and before.display_name != after.display_name
+        was_in = self.in_timeout(before)
+        is_in = self.in_timeout(after)
+        # A timeout extended or shortened while it runs keeps was_in == is_in,
+        # but its expiry has to be moved.
+        extended = (
+            self.native_timeouts
+            and was_in
+            and is_in
+            and before.timed_out_until != after.timed_out_until
+        )
+        if not renamed and not extended and was_in == is_in:
+            self.stats.dropped += 1
+            return None
+        self.stats.passed += 1
+        self.stats.renames += renamed
+        if was_in != is_in:
+            self.stats.timeouts += 1
+            return MemberChange(renamed, is_in)
+        return MemberChange(renamed, None, extended)
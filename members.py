@@ -0,0 +1,128 @@
+"""
+Resolve user ids to display names for leaderboards, a whole board at a time.
+
+Names come from the guild's member cache when it has them. Everyone else is
+fetched with one gateway member query per 100 ids, and every answer is kept
+for a while so the next render does not have to ask again.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+import discord
+
+NOT_FOUND = "User not found"
+QUERY_LIMIT = 100  # most user ids discord accepts in one member query
+
+
+@dataclass(slots=True)
+class ResolverStats:
+    """Counters for a resolver."""
+
+    hits: int = 0  # answered from this cache
+    guild_hits: int = 0  # answered from the guild's member cache
+    queried: int = 0  # ids sent to the gateway
+    queries: int = 0  # gateway requests made
+    failed: int = 0  # gateway requests that timed out
+
+
+class MemberNames:
+    """LRU cache of display names with a time to live, filled in bulk.
+
+    Users that are no longer in the guild are remembered too, for a shorter
+    time, so a leaderboard full of people who left does not query every time.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 600,
+        missing_ttl: float = 60,
+        max_size: int = 5_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.stats = ResolverStats()
+        # (guild id, user id) -> (display name or None if not a member, expiry)
+        self._names: OrderedDict[tuple[int, int], tuple[str | None, float]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _store(self, key: tuple[int, int], name: str | None, now: float) -> None:
+        ttl = self.missing_ttl if name is None else self.ttl
+        self._names[key] = (name, now + ttl)
+        self._names.move_to_end(key)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    def _cached(self, key: tuple[int, int], now: float) -> tuple[bool, str | None]:
+        if (found := self._names.get(key)) is None:
+            return False, None
+        name, expires = found
+        if expires <= now:
+            del self._names[key]
+            return False, None
+        self._names.move_to_end(key)
+        return True, name
+
+    def remember(self, member: discord.Member) -> None:
+        """Store a member's current name, e.g. after a name change."""
+        self._store((member.guild.id, member.id), member.display_name, self.clock())
+
+    async def resolve(
+        self, guild: discord.Guild | None, user_ids: Iterable[int | str]
+    ) -> dict[int, str]:
+        """Display names for user ids, NOT_FOUND for anyone not in the guild.
+
+        Args:
+            guild (discord.Guild | None): Guild the leaderboard is shown in
+            user_ids (Iterable[int | str]): Users to look up
+
+        Returns:
+            dict[int, str]: Display name by user id.
+        """
+        ids = list(dict.fromkeys(int(user) for user in user_ids))
+        if guild is None:
+            return dict.fromkeys(ids, NOT_FOUND)
+        now = self.clock()
+        names: dict[int, str] = {}
+        missing: list[int] = []
+        for user_id in ids:
+            key = (guild.id, user_id)
+            found, name = self._cached(key, now)
+            if found:
+                self.stats.hits += 1
+                names[user_id] = name or NOT_FOUND
+            elif (member := guild.get_member(user_id)) is not None:
+                self.stats.guild_hits += 1
+                names[user_id] = member.display_name
+                self._store(key, member.display_name, now)
+            else:
+                missing.append(user_id)
+
+        for start in range(0, len(missing), QUERY_LIMIT):
+            chunk = missing[start : start + QUERY_LIMIT]
+            self.stats.queries += 1
+            self.stats.queried += len(chunk)
+            try:
+                members = await guild.query_members(user_ids=chunk, limit=len(chunk))
+            except asyncio.TimeoutError:
+                # Show what we have, without caching, so the next render retries.
+                self.stats.failed += 1
+                names.update(dict.fromkeys(chunk, NOT_FOUND))
+                continue
+            now = self.clock()
+            fetched = {member.id: member.display_name for member in members}
+            for user_id in chunk:
+                name = fetched.get(user_id)
+                names[user_id] = name or NOT_FOUND
+                self._store((guild.id, user_id), name, now)
+        return names
@@ -0,0 +1,74 @@
+"""
+Count keyword mentions for the mention leaderboards in one pass per message.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Iterable, Mapping
+
+from paths import KEYWORDS
+
+# Leaderboard the original Sanderson / Mistborn tracking feeds.
+MISTBORN = "mistborn"
+DEFAULT_GROUPS = {MISTBORN: ["sanderson", "mistborn"]}
+
+
+class KeywordMatcher:
+    """Every keyword of every leaderboard compiled into a single regex.
+
+    >>> matcher = KeywordMatcher({"mistborn": ["sanderson", "mistborn"], \
+"tolkien": ["tolkien", "hobbit"]})
+    >>> sorted(matcher.count("Mistborn > The Hobbit, says SANDERSON fan").items())
+    [('mistborn', 2), ('tolkien', 1)]
+    >>> matcher.count("nothing to see")
+    {}
+    """
+
+    def __init__(self, groups: Mapping[str, Iterable[str]]) -> None:
+        self.groups: dict[str, str] = {}  # keyword -> leaderboard
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                self.groups[keyword.lower()] = group
+        # Longest first so a keyword never loses to one of its own prefixes.
+        alternatives = sorted(self.groups, key=len, reverse=True)
+        self.pattern = (
+            re.compile("|".join(map(re.escape, alternatives))) if alternatives else None
+        )
+
+    def count(self, text: str) -> dict[str, int]:
+        """Mentions per leaderboard in text, leaving out leaderboards with none."""
+        if self.pattern is None or not (found := self.pattern.findall(text.lower())):
+            return {}
+        counts: dict[str, int] = {}
+        for keyword in found:
+            group = self.groups[keyword]
+            counts[group] = counts.get(group, 0) + 1
+        return counts
+
+
+def load_matchers(path: Path = KEYWORDS) -> dict[int | None, KeywordMatcher]:
+    """Build a matcher per guild from the keyword file.
+
+    The file maps "default" and guild ids to {leaderboard: [keywords]}.
+    Guild entries add to (or replace groups of) the defaults. Without a
+    file, only the Mistborn leaderboard is tracked.
+
+    Returns:
+        dict[int | None, KeywordMatcher]: matchers by guild id, None for default.
+    """
+    config: dict[str, dict[str, list[str]]] = (
+        json.loads(path.read_text(encoding="utf8")) if path.exists() else {}
+    )
+    default = config.pop("default", DEFAULT_GROUPS)
+    matchers: dict[int | None, KeywordMatcher] = {None: KeywordMatcher(default)}
+    for guild_id, groups in config.items():
+        matchers[int(guild_id)] = KeywordMatcher(default | groups)
+    return matchers
+
+
+def matcher_for(
+    matchers: dict[int | None, KeywordMatcher], guild_id: int | None
+) -> KeywordMatcher:
+    """The matcher for a guild, falling back to the default."""
+    return matchers.get(guild_id) or matchers[None]
@@ -0,0 +1,216 @@
+"""
+Latency histograms for handlers, file I/O and the event loop.
+
+Everything is off until enable() is called. While off, timed handlers call
+straight through and timer() hands back a shared no-op context manager.
+"""
+
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any, Callable, Coroutine, Iterator, ParamSpec, TypeVar
+
+from aiohttp import web
+
+T = TypeVar("T")
+P = ParamSpec("P")
+# Upper bounds in seconds, the last bucket catches everything else.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LAG_INTERVAL = 0.5  # seconds between event loop lag probes
+HELP = {
+    "dadbot_handler_seconds": "Time spent in command and event handlers.",
+    "dadbot_file_read_seconds": "Time spent reading state files.",
+    "dadbot_file_write_seconds": "Time spent writing state files.",
+    "dadbot_loop_lag_seconds": "How late the event loop ran a scheduled wakeup.",
+    "dadbot_queue_wait_seconds": "Time messages waited for a pipeline worker.",
+}
+
+ENABLED = False
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Counts of observations per bucket plus their sum and maximum."""
+
+    __slots__ = ("counts", "total", "count", "largest")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.largest = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record one observation."""
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        self.largest = max(self.largest, value)
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given quantile.
+
+        The bound is capped at the largest observation, so a quantile never
+        reads higher than the maximum.
+
+        >>> histogram = Histogram()
+        >>> for value in (0.002, 0.003, 0.2):
+        ...     histogram.observe(value)
+        >>> histogram.quantile(0.5), histogram.quantile(0.99)
+        (0.005, 0.2)
+        """
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip((*BUCKETS, self.largest), self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.largest)
+        return self.largest
+
+
+# metric name -> label value -> histogram
+HISTOGRAMS: dict[str, dict[str, Histogram]] = {name: {} for name in HELP}
+# Extra values read at scrape time, e.g. cooldown counters. name -> callable
+GAUGES: dict[str, Callable[[], float]] = {}
+
+
+def enable() -> None:
+    """Start collecting."""
+    global ENABLED
+    ENABLED = True
+
+
+def observe(metric: str, label: str, seconds: float) -> None:
+    """Add an observation to a histogram."""
+    labels = HISTOGRAMS[metric]
+    if (histogram := labels.get(label)) is None:
+        histogram = labels[label] = Histogram()
+    histogram.observe(seconds)
+
+
+class _Timer(AbstractContextManager["_Timer"]):
+    __slots__ = ("metric", "label", "start")
+
+    def __init__(self, metric: str, label: str) -> None:
+        self.metric = metric
+        self.label = label
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        observe(self.metric, self.label, time.perf_counter() - self.start)
+
+
+def timer(metric: str, label: str) -> AbstractContextManager[Any]:
+    """Context manager that times its block into a histogram when enabled."""
+    return _Timer(metric, label) if ENABLED else _NOOP
+
+
+def timed(
+    name: str,
+) -> Callable[
+    [Callable[P, Coroutine[Any, Any, T]]], Callable[P, Coroutine[Any, Any, T]]
+]:
+    """Time an async event handler as dadbot_handler_seconds{handler=name}."""
+
+    def decorator(
+        func: Callable[P, Coroutine[Any, Any, T]],
+    ) -> Callable[P, Coroutine[Any, Any, T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            if not ENABLED:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                observe("dadbot_handler_seconds", name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+async def probe_loop_lag(interval: float = LAG_INTERVAL) -> None:
+    """Forever measure how late sleeps wake up, a direct read of loop blocking."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        observe("dadbot_loop_lag_seconds", "loop", loop.time() - start - interval)
+
+
+def _label(metric: str) -> str:
+    return {
+        "dadbot_handler_seconds": "handler",
+        "dadbot_file_read_seconds": "file",
+        "dadbot_file_write_seconds": "file",
+        "dadbot_queue_wait_seconds": "queue",
+    }.get(metric, "source")
+
+
+def prometheus() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for metric, labels in HISTOGRAMS.items():
+        lines.append(f"# HELP {metric} {HELP[metric]}")
+        lines.append(f"# TYPE {metric} histogram")
+        key = _label(metric)
+        for label, histogram in sorted(labels.items()):
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{metric}_bucket{{{key}="{label}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{metric}_sum{{{key}="{label}"}} {histogram.total}')
+            lines.append(f'{metric}_count{{{key}="{label}"}} {histogram.count}')
+    for name, read in sorted(GAUGES.items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {read()}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> Iterator[str]:
+    """Human readable lines for the !stats command."""
+    titles = {
+        "dadbot_handler_seconds": "Handlers",
+        "dadbot_file_read_seconds": "File reads",
+        "dadbot_file_write_seconds": "File writes",
+        "dadbot_loop_lag_seconds": "Event loop lag",
+        "dadbot_queue_wait_seconds": "Queue waits",
+    }
+    for metric, labels in HISTOGRAMS.items():
+        if not labels:
+            continue
+        yield f"{titles[metric]}:"
+        for label, histogram in sorted(labels.items()):
+            mean = histogram.total / histogram.count * 1000
+            p99 = histogram.quantile(0.99) * 1000
+            yield (
+                f"  {label:<28} {histogram.count:>7} calls avg {mean:8.2f} ms "
+                f"p99 <{p99:7.1f} ms max {histogram.largest * 1000:8.2f} ms"
+            )
+    for name, read in sorted(GAUGES.items()):
+        yield f"{name}: {read():g}"
+
+
+async def serve(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """Serve prometheus() at http://host:port/metrics."""
+
+    async def handle(_: web.Request) -> web.Response:
+        return web.Response(text=prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,130 @@
+"""
+Reverse lookup from display names to the users that have worn them.
+"""
+
+import heapq
+import math
+import sys
+import unicodedata
+from typing import Iterable, NamedTuple
+
+MIN_SIMILARITY = 0.3  # share of trigrams a fuzzy match needs in common
+
+
+class Match(NamedTuple):
+    """A user who has used a name like the one searched for."""
+
+    user_id: str
+    name: str
+    score: float  # 1.0 for an exact match of the normalized name
+
+
+def normalize(name: str) -> str:
+    """Fold a display name for comparison.
+
+    >>> normalize("  Ｓａｎｄｅｒｓｏｎ   FAN ")
+    'sanderson fan'
+    """
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def trigrams(name: str) -> set[str]:
+    """Three character slices of a normalized name, padded at both ends.
+
+    >>> sorted(trigrams("abc"))
+    ['  a', ' ab', 'abc', 'bc ']
+    """
+    padded = f"  {name} "
+    return {padded[idx : idx + 3] for idx in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Every name in the name histories, searchable by exact or fuzzy name.
+
+    Postings are kept per distinct normalized name rather than per user, so
+    a popular name costs one entry however many people have used it.
+
+    >>> index = NameIndex({"1": ["Vin", "Kelsier"], "2": ["kelsier"], "3": ["Elend"]})
+    >>> [match.user_id for match in index.search("KELSIER")]
+    ['1', '2']
+    >>> index.search("kelsir")[0].name
+    'Kelsier'
+    """
+
+    def __init__(self, histories: dict[str, list[str]] | None = None) -> None:
+        self.users: dict[str, set[str]] = {}  # normalized name -> user ids
+        self.names: dict[str, str] = {}  # normalized name -> name as first seen
+        self.grams: dict[str, set[str]] = {}  # trigram -> normalized names
+        if histories:
+            self.load(histories)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def load(self, histories: dict[str, list[str]]) -> None:
+        """Index every name in {user id: names}."""
+        for user_id, names in histories.items():
+            self.update(user_id, names)
+
+    def add(self, user_id: str, name: str) -> None:
+        """Index one more name for a user."""
+        key = sys.intern(normalize(name))
+        if (ids := self.users.get(key)) is None:
+            ids = self.users[key] = set()
+            self.names[key] = sys.intern(name)
+            for gram in trigrams(key):
+                self.grams.setdefault(gram, set()).add(key)
+        ids.add(sys.intern(user_id))
+
+    def update(self, user_id: str, names: Iterable[str]) -> None:
+        """Index several names for a user."""
+        for name in names:
+            self.add(user_id, name)
+
+    def search(self, query: str, limit: int = 5) -> list[Match]:
+        """Users that have had a name matching query, best match first.
+
+        Exact matches of the normalized name come first, then names that
+        share enough trigrams with the query.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        matches = [
+            Match(user_id, self.names[key], 1.0)
+            for user_id in sorted(self.users.get(key, ()))
+        ]
+        if len(matches) >= limit:
+            return matches[:limit]
+
+        wanted = trigrams(key)
+        # A name at MIN_SIMILARITY shares at least `needed` trigrams with the
+        # query, so it must show up in one of the rarest len - needed + 1
+        # postings. Only those are scanned for candidates; the common ones
+        # are only probed for names already found.
+        needed = math.ceil(MIN_SIMILARITY * len(wanted))
+        postings = sorted((self.grams.get(gram, set()) for gram in wanted), key=len)
+        cut = len(postings) - needed + 1
+        shared: dict[str, int] = {}
+        for posting in postings[:cut]:
+            for name in posting:
+                shared[name] = shared.get(name, 0) + 1
+        for posting in postings[cut:]:
+            for name in shared:
+                if name in posting:
+                    shared[name] += 1
+        shared.pop(key, None)
+        # Length of a padded name's trigram set is at most len(name) + 1.
+        scored = (
+            (common / (len(wanted) + len(name) + 1 - common), name)
+            for name, common in shared.items()
+        )
+        best = heapq.nlargest(limit, scored)
+        for score, name in best:
+            if score < MIN_SIMILARITY:
+                break
+            matches.extend(
+                Match(user_id, self.names[name], round(score, 2))
+                for user_id in sorted(self.users[name])
+            )
+        return matches[:limit]
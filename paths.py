@@ -11,3 +11,12 @@ CHAMPS = PROJ_PATH / "champs.json"
 INI = PROJ_PATH / "env.ini"
 GAMES = PROJ_PATH / "games.json"
 NAMES = PROJ_PATH / "names.json"
+DATABASE = PROJ_PATH / "dadbot.db"
+TIMEOUT_EVENTS = PROJ_PATH / "timeouts.jsonl"
+TIMEOUT_ARCHIVE = PROJ_PATH / "timeout_history"
+EPIC_CACHE = PROJ_PATH / "epic_promotions.json"
+KEYWORDS = PROJ_PATH / "keywords.json"
+MENTIONS = PROJ_PATH / "mentions.json"
+BACKFILL = PROJ_PATH / "backfill.json"
+TIMEOUT_DAYS = PROJ_PATH / "timeout_days.json"
+SCHEDULE = PROJ_PATH / "schedule.json"
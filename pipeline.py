@@ -0,0 +1,103 @@
+"""
+Bounded queue between the gateway and the message listeners.
+
+on_message only puts the message on the queue; a few workers run the
+handlers. When the queue is full new messages are dropped and counted
+rather than piling up tasks without limit.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import metrics
+
+LOGGER = logging.getLogger("debug")
+HANDLER = Callable[[Any], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class PipelineStats:
+    """Counters for a pipeline."""
+
+    accepted: int = 0
+    dropped: int = 0  # the queue was full
+    processed: int = 0
+    failed: int = 0  # handler calls that raised
+    high_water: int = 0  # deepest the queue has been
+
+
+class MessagePipeline:
+    """Runs every handler for each queued message on a small worker pool.
+
+    Messages are handled in arrival order by whichever worker is free, so
+    handlers must not assume one message finishes before the next starts.
+    """
+
+    def __init__(
+        self, handlers: list[HANDLER], workers: int = 4, max_queued: int = 1_000
+    ) -> None:
+        self.handlers = handlers
+        self.workers = workers
+        self.stats = PipelineStats()
+        self.queue: asyncio.Queue[tuple[float, Any]] = asyncio.Queue(max_queued)
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @property
+    def running(self) -> bool:
+        """True once the workers have been started."""
+        return bool(self._tasks)
+
+    def submit(self, message: Any) -> bool:
+        """Queue a message without waiting.
+
+        Returns:
+            bool: False if the queue was full and the message was dropped.
+        """
+        try:
+            self.queue.put_nowait((time.perf_counter(), message))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            return False
+        self.stats.accepted += 1
+        self.stats.high_water = max(self.stats.high_water, self.queue.qsize())
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            queued, message = await self.queue.get()
+            if metrics.ENABLED:
+                metrics.observe(
+                    "dadbot_queue_wait_seconds",
+                    "messages",
+                    time.perf_counter() - queued,
+                )
+            for handler in self.handlers:
+                try:
+                    await handler(message)
+                except Exception:  # pylint: disable=broad-except
+                    # One bad handler must not take a worker down with it.
+                    self.stats.failed += 1
+                    LOGGER.exception("%s failed", handler.__name__)
+            self.stats.processed += 1
+            self.queue.task_done()
+
+    def start(self) -> None:
+        """Start the workers, once."""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+
+    async def stop(self, timeout: float = 5) -> None:
+        """Finish what is queued, waiting at most timeout seconds, then stop."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
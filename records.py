@@ -0,0 +1,188 @@
+"""
+Timeout records keyed by user id, with times as epoch seconds.
+
+The first timeouts.json format keyed records by user name, which changes,
+and stored [count, seconds, start, user id] where start was a date string or
+False. Version 2 is {"version": 2, "users": {user id: [count, seconds,
+start, name]}} with start an integer or null, so nothing is parsed on read
+and a rename no longer starts a second record.
+
+Loading an old file upgrades it, keeping the original as timeouts.json.v1.
+python -m records [timeouts.json] does that without starting the bot.
+"""
+
+import calendar
+import datetime as dt
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from paths import TIMEOUT_ARCHIVE, TIMEOUT_EVENTS, TIMEOUTS
+
+VERSION = 2
+LEGACY_FORMAT = "%Y-%m-%d, %H:%M:%S"  # start times in the first format
+LEGACY_RECORD = tuple[int, int, str | bool, int]
+
+
+def epoch(time: dt.datetime) -> int:
+    """Seconds since 1970 of a naive UTC time, as the bot's clock gives.
+
+    >>> epoch(dt.datetime(2024, 1, 1))
+    1704067200
+    """
+    return calendar.timegm(time.timetuple())
+
+
+def from_epoch(seconds: int) -> dt.datetime:
+    """The naive UTC time of epoch seconds.
+
+    >>> from_epoch(1704067200)
+    datetime.datetime(2024, 1, 1, 0, 0)
+    """
+    return dt.datetime(1970, 1, 1) + dt.timedelta(seconds=seconds)
+
+
+@dataclass(slots=True)
+class TimeoutRecord:
+    """One user's timeouts.
+
+    >>> record = TimeoutRecord(7)
+    >>> record.enter(100)
+    >>> record.total(160), record.in_timeout
+    (60, True)
+    >>> record.leave(190), record.total(500), record.count
+    (90, 90, 1)
+    """
+
+    user_id: int
+    count: int = 0
+    seconds: int = 0  # banked, not counting a timeout still going on
+    start: int | None = None  # epoch seconds, None when not in timeout
+    name: str = ""  # last user name seen, only for reading the files
+
+    @property
+    def in_timeout(self) -> bool:
+        """Whether the user is in timeout right now."""
+        return self.start is not None
+
+    def total(self, now: int) -> int:
+        """Seconds in timeout, including any timeout still going on."""
+        if self.start is None:
+            return self.seconds
+        return self.seconds + now - self.start
+
+    def enter(self, now: int) -> None:
+        """Start a timeout."""
+        self.count += 1
+        self.start = now
+
+    def leave(self, now: int) -> int:
+        """End the current timeout.
+
+        Returns:
+            int: Seconds it lasted.
+        """
+        assert self.start is not None
+        duration = now - self.start
+        self.seconds += duration
+        self.start = None
+        return duration
+
+    def dump(self) -> list[Any]:
+        """The record as stored in version 2 files."""
+        return [self.count, self.seconds, self.start, self.name]
+
+    @classmethod
+    def load(cls, user_id: int | str, row: list[Any]) -> "TimeoutRecord":
+        """A record from its version 2 form."""
+        return cls(int(user_id), *row)
+
+    @classmethod
+    def from_legacy(cls, name: str, record: LEGACY_RECORD) -> "TimeoutRecord":
+        """A record from the first format.
+
+        >>> TimeoutRecord.from_legacy("vin", (2, 60, "2024-01-01, 00:00:10", 7))
+        TimeoutRecord(user_id=7, count=2, seconds=60, start=1704067210, name='vin')
+        """
+        count, seconds, start, user_id = record
+        if isinstance(start, bool):
+            started = None
+        else:
+            started = epoch(dt.datetime.strptime(start, LEGACY_FORMAT))
+        return cls(int(user_id), count, int(seconds), started, name)
+
+    def merge(self, other: "TimeoutRecord") -> None:
+        """Fold in a record the same user got under another name.
+
+        The later start wins if both say the user is in timeout, since the
+        earlier one was never closed.
+        """
+        self.count += other.count
+        self.seconds += other.seconds
+        if other.start is not None and (self.start is None or other.start > self.start):
+            self.start = other.start
+            self.name = other.name
+
+
+def dump_records(records: dict[int, TimeoutRecord]) -> dict[str, Any]:
+    """Records in the version 2 file format."""
+    return {
+        "version": VERSION,
+        "users": {str(user_id): record.dump() for user_id, record in records.items()},
+    }
+
+
+def load_records(data: dict[str, Any]) -> tuple[dict[int, TimeoutRecord], int]:
+    """Records from either file format.
+
+    Returns:
+        tuple[dict[int, TimeoutRecord], int]: Records by user id, and how many
+            legacy records were merged into another one of the same user
+
+    >>> legacy = {"vin": [1, 5, False, 7], "kelsier": [2, 9, False, 7]}
+    >>> records, merged = load_records(legacy)
+    >>> records[7].count, records[7].seconds, merged
+    (3, 14, 1)
+    """
+    if data.get("version") == VERSION:
+        return {
+            int(user_id): TimeoutRecord.load(user_id, row)
+            for user_id, row in data["users"].items()
+        }, 0
+    if "version" in data:
+        raise ValueError(f"Unknown timeouts format version {data['version']}")
+    records: dict[int, TimeoutRecord] = {}
+    merged = 0
+    for name, legacy in data.items():
+        record = TimeoutRecord.from_legacy(name, tuple(legacy))  # type: ignore
+        if (existing := records.get(record.user_id)) is None:
+            records[record.user_id] = record
+        else:
+            existing.merge(record)
+            merged += 1
+    return records, merged
+
+
+def main() -> None:
+    """Upgrade a timeouts snapshot, given as an argument or the default one."""
+    # Imported here, eventlog itself depends on this module.
+    from eventlog import TimeoutLog
+    from store import JsonFile
+
+    snapshot = Path(sys.argv[1]) if len(sys.argv) > 1 else TIMEOUTS
+    log = TimeoutLog(
+        JsonFile(snapshot),
+        snapshot.with_name(TIMEOUT_EVENTS.name),
+        snapshot.with_name(TIMEOUT_ARCHIVE.name),
+    )
+    log.load()
+    log.close()
+    if log.merged is None:
+        print(f"{log.snapshot.path} is already version {VERSION}.")
+    else:
+        print(f"Upgraded {log.snapshot.path}, merged {log.merged} duplicate(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cache for rendered command responses, with single-flight rendering.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class RenderStats:
+    """Counters for a cache."""
+
+    hits: int = 0
+    misses: int = 0  # renders started
+    shared: int = 0  # requests that waited on a render already in progress
+
+
+class RenderCache(Generic[T]):
+    """Responses keyed by request, valid while the data version is unchanged.
+
+    The version is whatever the caller derives from the data a response was
+    built from, e.g. users.version("timeouts"). A changed version or an
+    expired entry means a fresh render. Concurrent requests for the same key
+    and version share one render instead of each doing the work.
+
+    >>> cache = RenderCache()
+    >>> calls = []
+    >>> async def render():
+    ...     calls.append(1)
+    ...     await asyncio.sleep(0)
+    ...     return "board"
+    >>> async def burst(version):
+    ...     return await asyncio.gather(
+    ...         *(cache.get("key", version, render) for _ in range(3))
+    ...     )
+    >>> asyncio.run(burst(1)), asyncio.run(burst(1)), len(calls)
+    (['board', 'board', 'board'], ['board', 'board', 'board'], 1)
+    >>> asyncio.run(burst(2)) and len(calls)
+    2
+    """
+
+    def __init__(
+        self,
+        ttl: float = 15,
+        max_entries: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.stats = RenderStats()
+        # key -> (version, expiry, response)
+        self._entries: OrderedDict[Hashable, tuple[Hashable, float, T]] = OrderedDict()
+        self._rendering: dict[tuple[Hashable, Hashable], asyncio.Future[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Forget every cached response."""
+        self._entries.clear()
+
+    async def get(
+        self, key: Hashable, version: Hashable, render: Callable[[], Awaitable[T]]
+    ) -> T:
+        """The cached response for key, rendering it if stale or missing."""
+        if (entry := self._entries.get(key)) is not None:
+            if entry[0] == version and entry[1] > self.clock():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry[2]
+        if (pending := self._rendering.get((key, version))) is not None:
+            self.stats.shared += 1
+            # Shielded, so one caller being cancelled does not cancel the rest.
+            return await asyncio.shield(pending)
+
+        self.stats.misses += 1
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._rendering[(key, version)] = future
+        try:
+            response = await render()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # Waiters see the error; mark it retrieved so asyncio does not
+            # also log it when there are none.
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            self._entries[key] = (version, self.clock() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return response
+        finally:
+            del self._rendering[(key, version)]
@@ -0,0 +1,235 @@
+"""
+Run jobs at deadlines they work out from their own data.
+
+Instead of each job polling on a fixed interval, every job says when it
+next needs to run: the end of an Epic promotion, the next reminder inside
+the Thursday game night window. A single task sleeps until the earliest
+deadline in a heap, so a quiet week costs a handful of wakeups.
+"""
+
+import asyncio
+import datetime as dt
+import heapq
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from paths import SCHEDULE
+from store import JsonFile
+
+LOGGER = logging.getLogger("debug")
+# Deadline after now, or None to not run again until rescheduled.
+PLAN = Callable[[dt.datetime], dt.datetime | None]
+# Longest single sleep, so a wall clock jump is noticed within this many seconds.
+MAX_SLEEP = 3600
+
+
+def now() -> dt.datetime:
+    """The current time in the local timezone."""
+    return dt.datetime.now().astimezone()
+
+
+def weekly_window(
+    weekday: int,
+    opens: dt.time,
+    closes: dt.time,
+    every: dt.timedelta,
+    skip: Callable[[dt.date], bool] | None = None,
+) -> PLAN:
+    """Plan for runs every so often inside one local time window each week.
+
+    Args:
+        weekday (int): Day of the window, Monday is 0
+        opens (dt.time): First run of the day
+        closes (dt.time): No runs from this time on
+        every (dt.timedelta): Time between runs, counted from opens
+        skip (Callable[[dt.date], bool] | None): Days to skip, e.g. once done
+
+    >>> plan = weekly_window(3, dt.time(8), dt.time(21), dt.timedelta(minutes=43))
+    >>> plan(dt.datetime(2024, 1, 1, 12).astimezone()).replace(tzinfo=None)
+    datetime.datetime(2024, 1, 4, 8, 0)
+    >>> plan(dt.datetime(2024, 1, 4, 8, 1).astimezone()).time()
+    datetime.time(8, 43)
+    >>> plan(dt.datetime(2024, 1, 4, 20, 55).astimezone()).date()
+    datetime.date(2024, 1, 11)
+    """
+
+    def plan(after: dt.datetime) -> dt.datetime | None:
+        local = after.astimezone()
+        for offset in range(8):
+            day = local.date() + dt.timedelta(days=offset)
+            if day.weekday() != weekday or (skip is not None and skip(day)):
+                continue
+            # astimezone on a naive time uses the offset in force that day.
+            start = dt.datetime.combine(day, opens).astimezone()
+            end = dt.datetime.combine(day, closes).astimezone()
+            if local < start:
+                return start
+            following = start + ((local - start) // every + 1) * every
+            if following < end:
+                return following
+        return None
+
+    return plan
+
+
+@dataclass(slots=True)
+class Job:
+    """Something to run, and how to work out when."""
+
+    name: str
+    action: Callable[[], Awaitable[None]]
+    plan: PLAN
+    enabled: bool = True
+    runs: int = 0
+    last_run: dt.datetime | None = None
+    # How late a deadline missed while the bot was down may still run, None
+    # for any time. Past it the job just follows its plan.
+    grace: dt.timedelta | None = None
+
+
+@dataclass(slots=True)
+class SchedulerStats:
+    """Counters for a scheduler."""
+
+    wakeups: int = 0
+    runs: int = 0
+    failures: int = 0
+
+
+class Scheduler:
+    """A heap of job deadlines served by one task.
+
+    Whether each job is enabled, and its next deadline, are kept in a json
+    file. A job stopped with !badbot stays stopped after a restart, and one
+    that came due while the bot was down runs as soon as it is back.
+    """
+
+    def __init__(
+        self,
+        path: Path = SCHEDULE,
+        clock: Callable[[], dt.datetime] = now,
+    ) -> None:
+        self.clock = clock
+        self.jobs: dict[str, Job] = {}
+        self.stats = SchedulerStats()
+        self._state = JsonFile(path)
+        self._heap: list[tuple[dt.datetime, int, str]] = []
+        self._deadlines: dict[str, tuple[dt.datetime, int]] = {}
+        self._count = 0
+        self._changed = asyncio.Event()
+
+    def add(self, job: Job) -> None:
+        """Add a job, restoring its saved state."""
+        self.jobs[job.name] = job
+        saved = self._state.data.get(job.name, {})
+        job.enabled = saved.get("enabled", job.enabled)
+        if last := saved.get("last_run"):
+            job.last_run = dt.datetime.fromisoformat(last)
+        if not job.enabled:
+            return
+        current = self.clock()
+        deadline = job.plan(current)
+        if due := saved.get("deadline"):
+            # Missed while the bot was down, or still ahead of the new plan.
+            missed = dt.datetime.fromisoformat(due)
+            stale = job.grace is not None and current - missed > job.grace
+            if not stale and (deadline is None or missed < deadline):
+                deadline = max(missed, current)
+        self._set(job.name, deadline)
+
+    def deadline(self, name: str) -> dt.datetime | None:
+        """When a job next runs."""
+        found = self._deadlines.get(name)
+        return found[0] if found is not None else None
+
+    def start(self, name: str) -> bool:
+        """Enable a job.
+
+        Returns:
+            bool: False if it was already enabled.
+        """
+        job = self.jobs[name]
+        if job.enabled:
+            return False
+        job.enabled = True
+        self._set(name, job.plan(self.clock()))
+        return True
+
+    def stop(self, name: str) -> bool:
+        """Disable a job until it is started again.
+
+        Returns:
+            bool: False if it was already disabled.
+        """
+        job = self.jobs[name]
+        if not job.enabled:
+            return False
+        job.enabled = False
+        self._set(name, None)
+        return True
+
+    def reschedule(self, name: str) -> None:
+        """Plan a job again, after the data its plan uses has changed."""
+        if (job := self.jobs[name]).enabled:
+            self._set(name, job.plan(self.clock()))
+
+    def _set(self, name: str, deadline: dt.datetime | None) -> None:
+        # Replaced entries stay in the heap and are skipped when popped.
+        self._deadlines.pop(name, None)
+        if deadline is not None:
+            self._count += 1
+            self._deadlines[name] = (deadline, self._count)
+            heapq.heappush(self._heap, (deadline, self._count, name))
+        job = self.jobs[name]
+        self._state.data[name] = {
+            "enabled": job.enabled,
+            "deadline": deadline.isoformat() if deadline is not None else None,
+            "last_run": job.last_run.isoformat() if job.last_run else None,
+        }
+        self._state.mark_dirty()
+        self._changed.set()
+
+    def _next(self) -> tuple[dt.datetime, str] | None:
+        while self._heap:
+            deadline, count, name = self._heap[0]
+            if self._deadlines.get(name) == (deadline, count):
+                return deadline, name
+            heapq.heappop(self._heap)
+        return None
+
+    async def _run(self, job: Job) -> None:
+        job.last_run = self.clock()
+        job.runs += 1
+        self.stats.runs += 1
+        try:
+            await job.action()
+        except Exception:  # pylint: disable=broad-except
+            self.stats.failures += 1
+            LOGGER.exception("Scheduled job %s failed", job.name)
+        if job.enabled:
+            self._set(job.name, job.plan(self.clock()))
+
+    async def run(self) -> None:
+        """Run jobs as they come due, forever."""
+        while True:
+            try:
+                await self._state.flush_async()
+            except OSError as err:
+                # Still marked dirty, so it is written on the next pass.
+                LOGGER.warning("Schedule not saved, will retry: %s", err)
+            self._changed.clear()
+            if (found := self._next()) is None:
+                await self._changed.wait()
+                continue
+            deadline, name = found
+            wait = (deadline - self.clock()).total_seconds()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), min(wait, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    self.stats.wakeups += 1
+                continue
+            self._deadlines.pop(name)
+            await self._run(self.jobs[name])
@@ -0,0 +1,589 @@
+"""
+Storage backends for timeouts, mention counts and name history.
+"""
+
+import asyncio
+import dataclasses
+import datetime as dt
+import heapq
+import sqlite3
+import sys
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Iterable, TypeVar
+
+from eventlog import COMPACT_EVERY, TimeoutLog
+from mentions import MISTBORN
+from paths import DATABASE
+from records import TimeoutRecord, load_records
+from store import JsonFile, StateStore
+from timewindows import SEED_DAY
+
+T = TypeVar("T")
+
+
+class Storage(ABC):
+    """Interface for where the per-user state lives.
+
+    Methods are synchronous. Callers on the event loop should go through
+    run, which backends that block (on disk or a database) move off the loop.
+    """
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Call one of the storage methods from the event loop."""
+        return func(*args)
+
+    @abstractmethod
+    def get_timeout(self, user_id: int) -> TimeoutRecord | None:
+        """Timeout record for the user or None if they have never had one.
+
+        The record is a copy, changing it changes nothing until it is saved.
+        """
+
+    @abstractmethod
+    def set_timeout(self, record: TimeoutRecord) -> None:
+        """Replace the timeout record for the user."""
+
+    def record_timeout(
+        self, record: TimeoutRecord, event: str, when: dt.datetime
+    ) -> None:
+        """Replace the timeout record for the user because of an event.
+
+        Args:
+            record (TimeoutRecord): Record after the event
+            event (str): "enter" or "leave"
+            when (dt.datetime): Time of the event
+        """
+        self.set_timeout(record)
+
+    @abstractmethod
+    def all_timeouts(self) -> dict[int, TimeoutRecord]:
+        """Every timeout record keyed by user id."""
+
+    @abstractmethod
+    def add_timeout_day(self, user_id: str, day: int, count: int, seconds: int) -> None:
+        """Add to a user's timeouts and seconds in timeout for one day."""
+
+    @abstractmethod
+    def all_timeout_days(self) -> dict[str, dict[int, tuple[int, int]]]:
+        """Timeouts and seconds per day, keyed by user id then day number."""
+
+    @abstractmethod
+    def seed_timeout_days(self) -> bool:
+        """Put lifetime totals in the SEED_DAY bucket, the first time only.
+
+        Records from before daily tracking have no dates, so they only count
+        towards lifetime totals.
+
+        Returns:
+            bool: True if the buckets were seeded.
+        """
+
+    @abstractmethod
+    def get_mentions(self, user_id: str, board: str = MISTBORN) -> int:
+        """Number of times the user has mentioned the leaderboard's keywords."""
+
+    @abstractmethod
+    def add_mentions(self, user_id: str, mentions: int, board: str = MISTBORN) -> int:
+        """Add to the mention count of the user.
+
+        Returns:
+            int: The count before adding.
+        """
+
+    def add_mention_batch(self, counts: dict[tuple[str, str], int]) -> None:
+        """Add to many mention counts at once, {(board, user id): mentions}.
+
+        Either every count is added or, if this raises, none are.
+        """
+        for (board, user_id), mentions in counts.items():
+            self.add_mentions(user_id, mentions, board)
+
+    @abstractmethod
+    def top_mentions(self, limit: int, board: str = MISTBORN) -> list[tuple[str, int]]:
+        """Users with the most mentions, highest first."""
+
+    @abstractmethod
+    def all_mentions(self, board: str = MISTBORN) -> dict[str, int]:
+        """Every mention count on a leaderboard keyed by user id."""
+
+    @abstractmethod
+    def mention_boards(self) -> list[str]:
+        """Names of every mention leaderboard with counts."""
+
+    @abstractmethod
+    def replace_mentions(self, counts: dict[str, dict[str, int]]) -> None:
+        """Overwrite whole leaderboards at once, {board: {user id: count}}.
+
+        Leaderboards that are not in counts are left alone.
+        """
+
+    @abstractmethod
+    def get_names(self, user_id: str) -> list[str]:
+        """Display names used by the user, oldest first."""
+
+    @abstractmethod
+    def add_name(self, user_id: str, name: str) -> bool:
+        """Record a display name for the user.
+
+        Returns:
+            bool: False if the name was already known.
+        """
+
+    @abstractmethod
+    def all_names(self) -> dict[str, list[str]]:
+        """Every name history keyed by user id."""
+
+    async def flush_async(self) -> None:
+        """Persist anything that is only held in memory."""
+
+    def close(self) -> None:
+        """Persist everything and release resources."""
+
+
+class JsonStorage(Storage):
+    """The original json files, held in memory by a StateStore.
+
+    Timeout changes are appended to an event log and only folded into
+    timeouts.json every COMPACT_EVERY events.
+    """
+
+    def __init__(
+        self, state: StateStore | None = None, log: TimeoutLog | None = None
+    ) -> None:
+        self.state = state if state is not None else StateStore()
+        self.log = log if log is not None else TimeoutLog(self.state.timeouts)
+        # Sets mirroring names.json for O(1) duplicate checks, built on first use.
+        self._known_names: dict[str, set[str]] | None = None
+
+    def get_timeout(self, user_id: int) -> TimeoutRecord | None:
+        found = self.log.data.get(user_id)
+        return dataclasses.replace(found) if found is not None else None
+
+    def set_timeout(self, record: TimeoutRecord) -> None:
+        self.log.record("set", record, dt.datetime.utcnow())
+
+    def record_timeout(
+        self, record: TimeoutRecord, event: str, when: dt.datetime
+    ) -> None:
+        self.log.record(event, record, when)
+
+    def all_timeouts(self) -> dict[int, TimeoutRecord]:
+        return self.log.data
+
+    def add_timeout_day(self, user_id: str, day: int, count: int, seconds: int) -> None:
+        users = self.state.days.data.setdefault("users", {})
+        bucket = users.setdefault(user_id, {}).setdefault(str(day), [0, 0])
+        bucket[0] += count
+        bucket[1] += seconds
+        self.state.days.mark_dirty()
+
+    def all_timeout_days(self) -> dict[str, dict[int, tuple[int, int]]]:
+        return {
+            user_id: {int(day): tuple(bucket) for day, bucket in days.items()}
+            for user_id, days in self.state.days.data.get("users", {}).items()
+        }  # type: ignore
+
+    def seed_timeout_days(self) -> bool:
+        if self.state.days.data.get("seeded"):
+            return False
+        for record in self.all_timeouts().values():
+            if record.count or record.seconds:
+                self.add_timeout_day(
+                    str(record.user_id), SEED_DAY, record.count, record.seconds
+                )
+        self.state.days.data["seeded"] = True
+        self.state.days.mark_dirty()
+        return True
+
+    def _board(self, board: str) -> tuple[dict[str, int], JsonFile]:
+        """Counts for a leaderboard and the file they are saved in."""
+        if board == MISTBORN:
+            return self.state.mist.data, self.state.mist
+        return self.state.mentions.data.setdefault(board, {}), self.state.mentions
+
+    def get_mentions(self, user_id: str, board: str = MISTBORN) -> int:
+        return self._board(board)[0].get(user_id, 0)
+
+    def add_mentions(self, user_id: str, mentions: int, board: str = MISTBORN) -> int:
+        data, file = self._board(board)
+        last_count = data.get(user_id, 0)
+        data[user_id] = last_count + mentions
+        file.mark_dirty()
+        return last_count
+
+    def top_mentions(self, limit: int, board: str = MISTBORN) -> list[tuple[str, int]]:
+        data = self._board(board)[0]
+        return heapq.nlargest(limit, data.items(), key=lambda x: x[1])
+
+    def all_mentions(self, board: str = MISTBORN) -> dict[str, int]:
+        return self._board(board)[0]
+
+    def mention_boards(self) -> list[str]:
+        return [MISTBORN, *self.state.mentions.data]
+
+    def replace_mentions(self, counts: dict[str, dict[str, int]]) -> None:
+        for board, scores in counts.items():
+            data, file = self._board(board)
+            data.clear()
+            data.update(scores)
+            file.mark_dirty()
+
+    def get_names(self, user_id: str) -> list[str]:
+        return list(self.state.names.data.get(user_id, []))
+
+    def _names_seen(self) -> dict[str, set[str]]:
+        if self._known_names is None:
+            data: dict[str, list[str]] = self.state.names.data
+            for names in data.values():
+                names[:] = map(sys.intern, names)
+            self._known_names = {user: set(names) for user, names in data.items()}
+        return self._known_names
+
+    def add_name(self, user_id: str, name: str) -> bool:
+        known = self._names_seen().setdefault(user_id, set())
+        if name in known:
+            return False
+        name = sys.intern(name)
+        known.add(name)
+        self.state.names.data.setdefault(user_id, []).append(name)
+        self.state.names.mark_dirty()
+        return True
+
+    def all_names(self) -> dict[str, list[str]]:
+        return self.state.names.data
+
+    async def flush_async(self) -> None:
+        await self.state.flush_async()
+        if self.log.pending >= COMPACT_EVERY:
+            await self.log.compact_async()
+
+    def close(self) -> None:
+        self.state.flush()
+        self.log.close()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS timeout_records (
+    user_id INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    start INTEGER,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS timeout_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    time TEXT NOT NULL,
+    name TEXT NOT NULL,
+    user_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mention_counts (
+    board TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (board, user_id)
+);
+CREATE INDEX IF NOT EXISTS mention_counts_rank
+    ON mention_counts (board, count DESC);
+CREATE TABLE IF NOT EXISTS timeout_days (
+    user_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+CREATE TABLE IF NOT EXISTS names (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (user_id, name)
+);
+"""
+
+
+class SqliteStorage(Storage):
+    """SQLite database in WAL mode.
+
+    A single worker thread owns the connection, so statements never run on
+    the event loop and never run concurrently.
+    """
+
+    def __init__(self, path: Path = DATABASE) -> None:
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._upgrade()
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    def _has_table(self, name: str) -> bool:
+        return bool(
+            self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (name,),
+            ).fetchone()
+        )
+
+    def _upgrade(self) -> None:
+        """Bring the tables of older databases up to date.
+
+        Counts move out of the Mistborn-only table, and timeout records keyed
+        by name with text start times become one row per user id.
+        """
+        conn = self._conn
+        if self._has_table("mentions"):
+            with conn:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "INSERT OR IGNORE INTO mention_counts "
+                    "SELECT ?, user_id, count FROM mentions",
+                    (MISTBORN,),
+                )
+                conn.execute("DROP TABLE mentions")
+        if self._has_table("timeouts"):
+            legacy = {
+                name: (count, total, False if start is None else start, user_id)
+                for name, user_id, count, total, start in conn.execute(
+                    "SELECT name, user_id, count, total, start FROM timeouts"
+                )
+            }
+            with conn:
+                conn.execute("BEGIN")
+                self._insert_timeouts(load_records(legacy)[0].values())
+                conn.execute("DROP TABLE timeouts")
+
+    def _insert_timeouts(self, records: Iterable[TimeoutRecord]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO timeout_records VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    record.user_id,
+                    record.count,
+                    record.seconds,
+                    record.start,
+                    record.name,
+                )
+                for record in records
+            ),
+        )
+
+    def migrate_from_json(self, source: JsonStorage) -> bool:
+        """Copy the json files into the database the first time it is opened.
+
+        Returns:
+            bool: True if the migration ran.
+        """
+        conn = self._conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            return False
+        with conn:
+            conn.execute("BEGIN")
+            self._insert_timeouts(source.all_timeouts().values())
+            conn.executemany(
+                "INSERT OR REPLACE INTO mention_counts VALUES (?, ?, ?)",
+                (
+                    (board, user_id, count)
+                    for board in source.mention_boards()
+                    for user_id, count in source.all_mentions(board).items()
+                ),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO names (user_id, name) VALUES (?, ?)",
+                (
+                    (user_id, name)
+                    for user_id, names in source.all_names().items()
+                    for name in names
+                ),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO timeout_days VALUES (?, ?, ?, ?)",
+                (
+                    (user_id, day, count, seconds)
+                    for user_id, days in source.all_timeout_days().items()
+                    for day, (count, seconds) in days.items()
+                ),
+            )
+            if source.state.days.data.get("seeded"):
+                conn.execute(
+                    "INSERT INTO meta VALUES ('timeout_days_seeded', datetime('now'))"
+                )
+            conn.execute("INSERT INTO meta VALUES ('migrated', datetime('now'))")
+        return True
+
+    def get_timeout(self, user_id: int) -> TimeoutRecord | None:
+        row = self._conn.execute(
+            "SELECT user_id, count, seconds, start, name FROM timeout_records "
+            "WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        return TimeoutRecord(*row) if row else None
+
+    def set_timeout(self, record: TimeoutRecord) -> None:
+        self._insert_timeouts((record,))
+
+    def record_timeout(
+        self, record: TimeoutRecord, event: str, when: dt.datetime
+    ) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO timeout_events (event, time, name, user_id) "
+                "VALUES (?, ?, ?, ?)",
+                (event, when.isoformat(), record.name, record.user_id),
+            )
+            self.set_timeout(record)
+
+    def all_timeouts(self) -> dict[int, TimeoutRecord]:
+        rows = self._conn.execute(
+            "SELECT user_id, count, seconds, start, name FROM timeout_records"
+        )
+        return {row[0]: TimeoutRecord(*row) for row in rows}
+
+    def add_timeout_day(self, user_id: str, day: int, count: int, seconds: int) -> None:
+        self._conn.execute(
+            "INSERT INTO timeout_days VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id, day) DO UPDATE "
+            "SET count = count + excluded.count, seconds = seconds + excluded.seconds",
+            (user_id, day, count, seconds),
+        )
+
+    def all_timeout_days(self) -> dict[str, dict[int, tuple[int, int]]]:
+        data: dict[str, dict[int, tuple[int, int]]] = {}
+        for user_id, day, count, seconds in self._conn.execute(
+            "SELECT user_id, day, count, seconds FROM timeout_days"
+        ):
+            data.setdefault(user_id, {})[day] = (count, seconds)
+        return data
+
+    def seed_timeout_days(self) -> bool:
+        conn = self._conn
+        if conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'timeout_days_seeded'"
+        ).fetchone():
+            return False
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT INTO timeout_days "
+                "SELECT CAST(user_id AS TEXT), ?, count, seconds "
+                "FROM timeout_records WHERE count > 0 OR seconds > 0 "
+                "ON CONFLICT (user_id, day) DO UPDATE SET "
+                "count = count + excluded.count, seconds = seconds + excluded.seconds",
+                (SEED_DAY,),
+            )
+            conn.execute(
+                "INSERT INTO meta VALUES ('timeout_days_seeded', datetime('now'))"
+            )
+        return True
+
+    def get_mentions(self, user_id: str, board: str = MISTBORN) -> int:
+        row = self._conn.execute(
+            "SELECT count FROM mention_counts WHERE board = ? AND user_id = ?",
+            (board, user_id),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def add_mentions(self, user_id: str, mentions: int, board: str = MISTBORN) -> int:
+        row = self._conn.execute(
+            "INSERT INTO mention_counts VALUES (?, ?, ?) "
+            "ON CONFLICT (board, user_id) DO UPDATE "
+            "SET count = count + excluded.count RETURNING count",
+            (board, user_id, mentions),
+        ).fetchone()
+        return row[0] - mentions
+
+    def add_mention_batch(self, counts: dict[tuple[str, str], int]) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO mention_counts VALUES (?, ?, ?) "
+                "ON CONFLICT (board, user_id) DO UPDATE "
+                "SET count = count + excluded.count",
+                ((board, user_id, count) for (board, user_id), count in counts.items()),
+            )
+
+    def top_mentions(self, limit: int, board: str = MISTBORN) -> list[tuple[str, int]]:
+        return self._conn.execute(
+            "SELECT user_id, count FROM mention_counts WHERE board = ? "
+            "ORDER BY count DESC LIMIT ?",
+            (board, limit),
+        ).fetchall()
+
+    def all_mentions(self, board: str = MISTBORN) -> dict[str, int]:
+        return dict(
+            self._conn.execute(
+                "SELECT user_id, count FROM mention_counts WHERE board = ?", (board,)
+            )
+        )
+
+    def mention_boards(self) -> list[str]:
+        rows = self._conn.execute("SELECT DISTINCT board FROM mention_counts")
+        return [row[0] for row in rows]
+
+    def replace_mentions(self, counts: dict[str, dict[str, int]]) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for board, scores in counts.items():
+                self._conn.execute(
+                    "DELETE FROM mention_counts WHERE board = ?", (board,)
+                )
+                self._conn.executemany(
+                    "INSERT INTO mention_counts VALUES (?, ?, ?)",
+                    ((board, user_id, count) for user_id, count in scores.items()),
+                )
+
+    def get_names(self, user_id: str) -> list[str]:
+        rows = self._conn.execute(
+            "SELECT name FROM names WHERE user_id = ? ORDER BY seq", (user_id,)
+        )
+        return [row[0] for row in rows]
+
+    def add_name(self, user_id: str, name: str) -> bool:
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO names (user_id, name) VALUES (?, ?)",
+            (user_id, name),
+        )
+        return cursor.rowcount > 0
+
+    def all_names(self) -> dict[str, list[str]]:
+        data: dict[str, list[str]] = {}
+        for user_id, name in self._conn.execute(
+            "SELECT user_id, name FROM names ORDER BY seq"
+        ):
+            data.setdefault(user_id, []).append(name)
+        return data
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+
+def open_storage(kind: str, database: Path = DATABASE) -> Storage:
+    """Create the backend named in the config.
+
+    Args:
+        kind (str): "json" or "sqlite"
+        database (Path): Database file for the sqlite backend.
+    Returns:
+        Storage: The backend. A new sqlite database is seeded from the json files.
+    """
+    match kind.lower():
+        case "json":
+            return JsonStorage()
+        case "sqlite":
+            backend = SqliteStorage(database)
+            backend.migrate_from_json(JsonStorage())
+            return backend
+        case _:
+            raise ValueError(f"Unknown storage backend {kind!r}")
@@ -0,0 +1,137 @@
+"""
+In-memory state for the bot's json files with write-behind persistence.
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import metrics
+from paths import MENTIONS, MIST, NAMES, TIMEOUT_DAYS, TIMEOUTS
+
+
+class JsonFile:
+    """A json file kept in memory. Changes are only written out on flush."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.dirty = False
+        self._data: dict[str, Any] | None = None
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """The file contents, read from disk on first access."""
+        if self._data is None:
+            self.load()
+        assert self._data is not None
+        return self._data
+
+    def load(self) -> None:
+        """(Re)read the file from disk, discarding unsaved changes."""
+        with metrics.timer("dadbot_file_read_seconds", self.path.name):
+            if self.path.exists():
+                self._data = json.loads(self.path.read_text(encoding="utf8"))
+            else:
+                self._data = {}
+        self.dirty = False
+
+    def mark_dirty(self) -> None:
+        """Flag the file as needing to be written on the next flush."""
+        self.dirty = True
+
+    def dumps(self) -> str:
+        """Serialize the current contents."""
+        return json.dumps(self.data, indent=2)
+
+    def write(self, text: str) -> None:
+        """Atomically replace the file on disk with text."""
+        temp = self.path.with_name(f"{self.path.name}.tmp")
+        with metrics.timer("dadbot_file_write_seconds", self.path.name):
+            temp.write_text(text, encoding="utf8")
+            os.replace(temp, self.path)
+
+    def flush(self) -> bool:
+        """Write the file if it has changed.
+
+        Returns:
+            bool: True if anything was written.
+        """
+        if not self.dirty:
+            return False
+        self.write(self.dumps())
+        self.dirty = False  # only once written, so a failed write is retried
+        return True
+
+    async def flush_async(self) -> bool:
+        """Like flush, but the disk write happens on a worker thread.
+
+        The contents are serialized on the calling thread so the snapshot
+        that gets written is consistent.
+        """
+        if not self.dirty:
+            return False
+        self.dirty = False
+        text = self.dumps()
+        try:
+            await asyncio.to_thread(self.write, text)
+        except OSError:
+            self.dirty = True
+            raise
+        return True
+
+
+class StateStore:
+    """All of the per-user state the bot tracks, served from memory."""
+
+    def __init__(
+        self,
+        timeouts: Path = TIMEOUTS,
+        mist: Path = MIST,
+        names: Path = NAMES,
+        mentions: Path = MENTIONS,
+        days: Path = TIMEOUT_DAYS,
+    ) -> None:
+        self.timeouts = JsonFile(timeouts)
+        self.mist = JsonFile(mist)
+        self.names = JsonFile(names)
+        # Leaderboards other than Mistborn, {leaderboard: {user id: count}}
+        self.mentions = JsonFile(mentions)
+        # Timeouts per day, {"seeded": bool, "users": {user id: {day: [count,
+        # seconds]}}}
+        self.days = JsonFile(days)
+
+    @property
+    def files(self) -> tuple[JsonFile, ...]:
+        """Every file managed by the store."""
+        return (self.timeouts, self.mist, self.names, self.mentions, self.days)
+
+    @property
+    def dirty(self) -> bool:
+        """True if any file has unsaved changes."""
+        return any(file.dirty for file in self.files)
+
+    def load(self) -> None:
+        """Read every file from disk."""
+        for file in self.files:
+            file.load()
+
+    def flush(self) -> int:
+        """Write out every changed file.
+
+        Returns:
+            int: Number of files written.
+        """
+        return sum(file.flush() for file in self.files)
+
+    async def flush_async(self) -> int:
+        """Write out every changed file without blocking the event loop.
+
+        Returns:
+            int: Number of files written.
+        """
+        written = 0
+        for file in self.files:
+            written += await file.flush_async()
+        return written
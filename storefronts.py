@@ -0,0 +1,233 @@
+"""
+Free games from every storefront feed, fetched together and merged.
+
+Each feed is a Provider. They are all fetched at once, each with its own
+timeout and a circuit breaker that stops calling a feed that keeps failing
+for a while. A provider that fails or has nothing new keeps contributing its
+last good list, so one bad feed never empties the announcement.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import aiohttp
+
+import metrics
+from paths import GAMES
+
+LOGGER = logging.getLogger("debug")
+FAILURES = 3  # failures in a row that open a provider's breaker
+COOL_DOWN = 1800  # seconds an open breaker waits before trying the feed again
+
+
+@dataclass(slots=True, frozen=True)
+class FreeGame:
+    """A game a storefront is giving away."""
+
+    title: str
+    url: str
+    store: str
+    ends: datetime | None = None
+
+    @property
+    def key(self) -> str:
+        """The title reduced to letters and digits, the same on every store.
+
+        >>> FreeGame("Hades: Deluxe", "", "epic").key
+        'hadesdeluxe'
+        """
+        return re.sub(r"[\W_]+", "", self.title.casefold())
+
+
+class Provider(ABC):
+    """A storefront feed of free games."""
+
+    name = "provider"
+    timeout = 30.0  # seconds for a whole fetch, retries included
+
+    @abstractmethod
+    async def free_games(self) -> list[FreeGame] | None:
+        """The games free right now, or None if the feed has not changed."""
+
+    async def close(self) -> None:
+        """Release any connections."""
+
+
+class CircuitBreaker:
+    """Stops calls to something that keeps failing, then tries it again later.
+
+    >>> now = [0.0]
+    >>> breaker = CircuitBreaker(2, 60, clock=lambda: now[0])
+    >>> breaker.failure(); breaker.failure(); breaker.allow()
+    False
+    >>> now[0] = 61
+    >>> breaker.allow(), breaker.allow()
+    (True, False)
+    >>> breaker.success(); breaker.allow()
+    True
+    """
+
+    def __init__(
+        self,
+        failures: int = FAILURES,
+        cool_down: float = COOL_DOWN,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failures = failures
+        self.cool_down = cool_down
+        self.clock = clock
+        self.failed = 0  # failures in a row
+        self.opened: float | None = None  # when calls were stopped
+
+    @property
+    def open(self) -> bool:
+        """Whether calls are being stopped."""
+        return self.opened is not None
+
+    def allow(self) -> bool:
+        """Whether to make a call now.
+
+        Once the cool down has passed a single trial call is let through; it
+        closes the breaker on success or restarts the cool down on failure.
+        """
+        if self.opened is None:
+            return True
+        if self.clock() - self.opened < self.cool_down:
+            return False
+        self.opened = self.clock()  # no other calls until the trial is over
+        return True
+
+    def success(self) -> None:
+        """Record a call that worked."""
+        self.failed = 0
+        self.opened = None
+
+    def failure(self) -> None:
+        """Record a call that failed."""
+        self.failed += 1
+        if self.failed >= self.failures:
+            self.opened = self.clock()
+
+
+class FreeGames:
+    """Every provider's free games as one list, without duplicates.
+
+    A game on several stores is listed once, from the first provider that
+    has it.
+    """
+
+    def __init__(self, providers: Iterable[Provider]) -> None:
+        self.providers = list(providers)
+        self.breakers = {provider.name: CircuitBreaker() for provider in self.providers}
+        self.last: dict[str, list[FreeGame]] = {}  # last good list per provider
+
+    async def _fetch(self, provider: Provider) -> list[FreeGame]:
+        breaker = self.breakers[provider.name]
+        if breaker.allow():
+            try:
+                found = await asyncio.wait_for(provider.free_games(), provider.timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+                breaker.failure()
+                LOGGER.warning(
+                    "%s free games check failed (%d in a row): %s",
+                    provider.name,
+                    breaker.failed,
+                    str(err) or type(err).__name__,
+                )
+            except Exception:  # pylint: disable=broad-except
+                # e.g. a KeyError from a feed that changed shape. Only this
+                # provider's results are lost, not everyone else's.
+                breaker.failure()
+                LOGGER.exception(
+                    "%s free games check broke (%d in a row)",
+                    provider.name,
+                    breaker.failed,
+                )
+            else:
+                breaker.success()
+                if found is not None:
+                    self.last[provider.name] = found
+        return self.last.get(provider.name, [])
+
+    async def fetch(self) -> list[FreeGame]:
+        """Fetch every provider at once and merge what they have."""
+        found = await asyncio.gather(*map(self._fetch, self.providers))
+        return merge(found)
+
+    def next_change(self, after: datetime) -> datetime | None:
+        """When the next known giveaway ends, None if none are known."""
+        return min(
+            (
+                game.ends
+                for games in self.last.values()
+                for game in games
+                if game.ends is not None and game.ends > after
+            ),
+            default=None,
+        )
+
+    async def close(self) -> None:
+        """Close every provider."""
+        await asyncio.gather(*(provider.close() for provider in self.providers))
+
+
+def merge(lists: Iterable[list[FreeGame]]) -> list[FreeGame]:
+    """Games from several providers, the first of each title only.
+
+    >>> epic = [FreeGame("Hades", "e/hades", "epic")]
+    >>> other = [FreeGame("HADES", "o/h", "other"), FreeGame("Celeste", "o/c", "other")]
+    >>> [game.url for game in merge([epic, other])]
+    ['e/hades', 'o/c']
+    """
+    merged: dict[str, FreeGame] = {}
+    for games in lists:
+        for game in games:
+            merged.setdefault(game.key, game)
+    return list(merged.values())
+
+
+def content_hash(urls: Iterable[str]) -> str:
+    """A digest of a set of games, the same whatever order they come in.
+
+    >>> content_hash(["b", "a"]) == content_hash(["a", "b"])
+    True
+    """
+    digest = hashlib.sha256()
+    for url in sorted(urls):
+        digest.update(url.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _saved_hash(data: Any) -> str | None:
+    if isinstance(data, list):  # written before hashes were stored
+        return content_hash(data)
+    return data.get("hash") if isinstance(data, dict) else None
+
+
+def changed(games: list[FreeGame], path: Path = GAMES) -> bool:
+    """Whether games differ from the ones last announced."""
+    with metrics.timer("dadbot_file_read_seconds", path.name):
+        if not path.exists():
+            return True
+        saved = _saved_hash(json.loads(path.read_text(encoding="utf8")))
+    return saved != content_hash(game.url for game in games)
+
+
+def save(games: list[FreeGame], path: Path = GAMES) -> None:
+    """Remember games as the ones last announced."""
+    urls = [game.url for game in games]
+    with metrics.timer("dadbot_file_write_seconds", path.name):
+        path.write_text(
+            json.dumps({"hash": content_hash(urls), "games": urls}, indent=2),
+            encoding="utf8",
+        )
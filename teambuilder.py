@@ -2,13 +2,23 @@
 Functions to create random teams.
 """
 
+import asyncio
 import json
 import random
-from collections import defaultdict
-from typing import DefaultDict
+from array import array
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, DefaultDict, Mapping, Sequence
 
 from paths import CHAMPS
 
+POSITIONS = ("Baron", "Dragon", "Mid", "Jungle", "Support")
+RECENT_TEAMS = 4  # generated teams whose champions are made less likely
+RECENT_WEIGHT = 0.25  # weight multiplier for each recent team a champion was in
+RETRIES = 8  # weighted picks tried before choosing among the free champions
+
 
 def get_champs() -> tuple[list[str], DefaultDict[str, list[str]]]:
     """
@@ -31,10 +41,14 @@ DefaultDict(<class 'list'>, {'Mid': ['Ahri', ...], \
     return list(champs_data.keys()), champ_positions
 
 
-def make_team(champ_positions: DefaultDict[str, list[str]]) -> list[str]:
+def make_team(
+    champ_positions: DefaultDict[str, list[str]], sampler: "TeamSampler | None" = None
+) -> list[str]:
     """
     Get a random team of 5 champs based on where they normally play.
 
+    With a sampler the champs are drawn from its weights instead of uniformly.
+
     >>> random.seed(1)
     >>> make_team({'Mid': ['Aurelion Sol', 'Oriana'], \
 'Baron': ['Darius', 'Riven'], \
@@ -44,6 +58,8 @@ def make_team(champ_positions: DefaultDict[str, list[str]]) -> list[str]:
     ['Mid Aurelion Sol', 'Baron Darius', 'Support Senna', \
 'Jungle Evelynn', 'Dragon Jinx']
     """
+    if sampler is not None:
+        return sampler.draw()[0]
     team: list[str] = []
     for position, champs in champ_positions.items():
         champ = random.choice(champs)
@@ -54,11 +70,15 @@ def make_team(champ_positions: DefaultDict[str, list[str]]) -> list[str]:
     return team
 
 
-def make_chaos(champs: list[str]) -> list[str]:
+def make_chaos(
+    champs: Sequence[str], sampler: "TeamSampler | None" = None
+) -> list[str]:
     """
     Get a fully random ream of 5 champs. They will get randomly assigned
     to AD / AP / Tank as well as positions.
 
+    With a sampler the champs are drawn from its weights instead of uniformly.
+
     >>> random.seed(1)
     >>> make_chaos(['Aurelion Sol', 'Darius', 'Janna', 'Evelynn', 'Lucian', \
 'Ezreal', 'Blitzcrank', 'Kennen', 'Draven', 'Varus'])
@@ -67,6 +87,400 @@ def make_chaos(champs: list[str]) -> list[str]:
     """
     positions = ["Baron", "Dragon", "Mid", "Jungle", "Support"]
     build_opts = ["AD", "AP", "Tank"]
+    if sampler is not None:
+        team = sampler.sample(5)
+        builds = [sampler.rng.choice(build_opts) for _ in positions]
+        return [f"{builds[i]} {positions[i]} {champ}" for i, champ in enumerate(team)]
     team = random.sample(champs, 5)
     builds = [random.choice(build_opts) for _ in positions]
     return [f"{builds[i]} {positions[i]} {champ}" for i, champ in enumerate(team)]
+
+
+class AliasTable:
+    """
+    Walker's alias method: O(n) to build, then O(1) per weighted pick.
+
+    Every slot holds its own share of probability and one alias that takes
+    the rest, so a pick is one uniform slot and one coin flip.
+
+    >>> table = AliasTable([0, 3, 1])
+    >>> rng = random.Random(3)
+    >>> counts = Counter(table.pick(rng) for _ in range(4000))
+    >>> counts[0], round(counts[1] / counts[2])
+    (0, 3)
+    """
+
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights: Sequence[float]) -> None:
+        size = len(weights)
+        total = sum(weights)
+        if not size or total <= 0:
+            raise ValueError("Need at least one positive weight.")
+        scaled = [weight * size / total for weight in weights]
+        self.prob = array("d", [1.0]) * size
+        self.alias = array("I", range(size))
+        small = [idx for idx, share in enumerate(scaled) if share < 1]
+        large = [idx for idx, share in enumerate(scaled) if share >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # Whatever is left is 1 up to rounding, and keeps its own slot.
+
+    def pick(self, rng: random.Random) -> int:
+        """A weighted random index."""
+        idx = rng.randrange(len(self.prob))
+        return idx if rng.random() < self.prob[idx] else self.alias[idx]
+
+
+class RecentPicks:
+    """
+    The champions of the last few generated teams, in a ring buffer.
+
+    Each recent team a champion was in multiplies its weight by decay.
+
+    >>> recent = RecentPicks(2, decay=0.5)
+    >>> recent.add(["Ahri", "Lux"]); recent.add(["Ahri"])
+    >>> recent.factor("Ahri"), recent.factor("Lux")
+    (0.25, 0.5)
+    >>> recent.add(["Sona"])
+    >>> recent.factor("Ahri"), recent.factor("Lux")
+    (0.5, 1.0)
+    """
+
+    def __init__(self, size: int = RECENT_TEAMS, decay: float = RECENT_WEIGHT) -> None:
+        if not 0 < decay <= 1:
+            raise ValueError("decay must be more than 0 and at most 1")
+        self.size = size
+        self.decay = decay
+        self.counts: Counter[str] = Counter()
+        self._teams: list[tuple[str, ...]] = [()] * size
+        self._next = 0
+
+    def factor(self, champ: str) -> float:
+        """How much a champion's weight is reduced for being picked recently."""
+        return self.decay ** self.counts[champ]
+
+    def add(self, team: Sequence[str]) -> None:
+        """Remember a team, forgetting the oldest one once the buffer is full."""
+        if not self.size:
+            return
+        oldest = self._teams[self._next]
+        self._teams[self._next] = tuple(team)
+        self._next = (self._next + 1) % self.size
+        self.counts.subtract(oldest)
+        self.counts.update(team)
+        for champ in oldest:
+            if not self.counts[champ]:
+                del self.counts[champ]
+
+
+class TeamSampler:
+    """
+    Draws teams where no champion appears twice, on either side.
+
+    Champions are numbered once and every position keeps an array of the
+    numbers that can play it. Picks are tracked in an int bitmask; if a
+    position runs out of unused champions, an augmenting path moves earlier
+    picks to other champions instead of starting over.
+
+    Picks are weighted by an alias table per position, built on first use
+    from the configured weights. With recent picks, a champion from the last
+    few teams is only kept with chance RecentPicks.factor, so the tables never
+    have to be rebuilt as teams are generated.
+
+    >>> sampler = TeamSampler({'Mid': ['Ahri', 'Lux'], \
+'Support': ['Lux', 'Janna', 'Sona']})
+    >>> side_a, side_b = sampler.draw(sides=2)
+    >>> sorted(side_a + side_b)
+    ['Mid Ahri', 'Mid Lux', 'Support Janna', 'Support Sona']
+    >>> seeded = sampler.seeded(7)
+    >>> seeded.draw_many(3) == sampler.seeded(7).draw_many(3)
+    True
+    """
+
+    def __init__(
+        self,
+        champ_positions: Mapping[str, Sequence[str]],
+        rng: random.Random | None = None,
+        weights: Mapping[str, float] | None = None,
+        recent: RecentPicks | None = None,
+    ) -> None:
+        self.champ_positions = champ_positions
+        self.positions = tuple(champ_positions)
+        self.champs = tuple(
+            sorted({champ for champs in champ_positions.values() for champ in champs})
+        )
+        number = {champ: idx for idx, champ in enumerate(self.champs)}
+        # One pool per position, then one of every champion for make_chaos.
+        self.pools = tuple(
+            array("H", sorted(number[champ] for champ in champ_positions[position]))
+            for position in self.positions
+        ) + (
+            array("H", range(len(self.champs))),
+        )
+        self.weights = weights or {}
+        if any(weight <= 0 for weight in self.weights.values()):
+            raise ValueError("Champion weights must be positive.")
+        self.recent = recent
+        self.rng = rng if rng is not None else random.Random()
+        self._tables: list[AliasTable | None] = [None] * len(self.pools)
+
+    def seeded(self, seed: int) -> "TeamSampler":
+        """
+        A sampler with the same weights that draws the same teams for a seed,
+        e.g. to publish a tournament bracket. Recent picks are not used.
+        """
+        return TeamSampler(self.champ_positions, random.Random(seed), self.weights)
+
+    def _factor(self, champ: int) -> float:
+        if self.recent is None:
+            return 1.0
+        return self.recent.factor(self.champs[champ])
+
+    def weight(self, champ: int) -> float:
+        """Current weight of a champion number."""
+        return self.weights.get(self.champs[champ], 1.0) * self._factor(champ)
+
+    def _table(self, pool_idx: int) -> AliasTable:
+        table = self._tables[pool_idx]
+        if table is None:
+            pool = self.pools[pool_idx]
+            table = AliasTable([self.weights.get(self.champs[c], 1.0) for c in pool])
+            self._tables[pool_idx] = table
+        return table
+
+    def _pick(self, pool_idx: int, used: int) -> int:
+        """A weighted champion number from a pool not in used, -1 if none left."""
+        pool = self.pools[pool_idx]
+        table = self._table(pool_idx)
+        for _ in range(RETRIES):
+            champ = pool[table.pick(self.rng)]
+            # Keeping a pick with chance factor turns the configured weights
+            # into the current ones, without rebuilding the table.
+            if not used >> champ & 1 and self.rng.random() < self._factor(champ):
+                return champ
+        # Rejected picks followed by a weighted pick among the free champs
+        # are still weighted over the free champs.
+        if free := [champ for champ in pool if not used >> champ & 1]:
+            return self.rng.choices(free, [self.weight(champ) for champ in free])[0]
+        return -1
+
+    def _remember(self, team: Sequence[int]) -> None:
+        if self.recent is not None:
+            self.recent.add([self.champs[champ] for champ in team])
+
+    def _assign(self, sides: int) -> list[int]:
+        """Champion number for every (side, position) slot."""
+        slots = len(self.positions) * sides
+        picks = [-1] * slots
+        owner: dict[int, int] = {}  # champion number -> slot
+        used = 0
+        for slot in range(slots):
+            champ = self._pick(slot % len(self.positions), used)
+            if champ < 0:
+                if (champ := self._augment(slot, picks, owner, set())) < 0:
+                    raise ValueError("Not enough champions to fill every position.")
+                # Earlier slots changed champions, rebuild the mask.
+                used = sum(1 << pick for pick in picks if pick >= 0)
+            picks[slot] = champ
+            owner[champ] = slot
+            used |= 1 << champ
+        return picks
+
+    def _augment(
+        self, slot: int, picks: list[int], owner: dict[int, int], seen: set[int]
+    ) -> int:
+        """Free a champion for slot by moving earlier picks. Returns -1 if stuck."""
+        for champ in self.pools[slot % len(self.positions)]:
+            if champ in seen:
+                continue
+            seen.add(champ)
+            holder = owner.get(champ)
+            if holder is None:
+                return champ
+            if (other := self._augment(holder, picks, owner, seen)) >= 0:
+                picks[holder] = other
+                owner[other] = holder
+                return champ
+        return -1
+
+    def draw(self, sides: int = 1) -> list[list[str]]:
+        """
+        Random teams of one champ per position, like make_team, with every
+        champ used at most once across all sides.
+        """
+        picks = self._assign(sides)
+        width = len(self.positions)
+        teams = []
+        for side in range(sides):
+            self._remember(picks[side * width : (side + 1) * width])
+            team = [
+                f"{position} {self.champs[picks[side * width + idx]]}"
+                for idx, position in enumerate(self.positions)
+            ]
+            self.rng.shuffle(team)
+            teams.append(team)
+        return teams
+
+    def draw_many(self, count: int, sides: int = 2) -> list[list[list[str]]]:
+        """count independent draws, e.g. team pairs for a tournament."""
+        return [self.draw(sides) for _ in range(count)]
+
+    def sample(self, count: int) -> list[str]:
+        """count different champs from every position, weighted, for make_chaos."""
+        if count > len(self.champs):
+            raise ValueError("Not enough champions.")
+        picks: list[int] = []
+        used = 0
+        for _ in range(count):
+            champ = self._pick(len(self.positions), used)
+            picks.append(champ)
+            used |= 1 << champ
+        self._remember(picks)
+        return [self.champs[champ] for champ in picks]
+
+
+def validate_champs(data: Any) -> dict[str, list[str]]:
+    """Check champion data is {name: [positions]} with known positions.
+
+    Returns:
+        dict[str, list[str]]: The data, with duplicate positions removed.
+
+    Raises:
+        ValueError: Listing every problem found.
+
+    >>> validate_champs({"Ahri": ["Mid", "Mid"]})
+    {'Ahri': ['Mid']}
+    >>> validate_champs({"Ahri": ["Top"], "": ["Mid"]})
+    Traceback (most recent call last):
+    ...
+    ValueError: Ahri: unknown position 'Top'
+    '': champion name is empty
+    """
+    if not isinstance(data, dict):
+        raise ValueError("champion data must map names to lists of positions")
+    problems = []
+    champs: dict[str, list[str]] = {}
+    for champ, positions in data.items():
+        if not isinstance(champ, str) or not champ.strip():
+            problems.append(f"{champ!r}: champion name is empty")
+            continue
+        if not isinstance(positions, list) or not positions:
+            problems.append(f"{champ}: needs a list of positions")
+            continue
+        for position in positions:
+            if position not in POSITIONS:
+                problems.append(f"{champ}: unknown position {position!r}")
+        champs[champ] = list(dict.fromkeys(positions))
+    if problems:
+        raise ValueError("\n".join(problems))
+    return champs
+
+
+def parse_weights(text: str) -> dict[str, float]:
+    """Champion weights from config text.
+
+    >>> parse_weights("Teemo: 0.5, Lee Sin: 2")
+    {'Teemo': 0.5, 'Lee Sin': 2.0}
+    >>> parse_weights("")
+    {}
+    """
+    weights = {}
+    for item in filter(None, (item.strip() for item in text.split(","))):
+        champ, _, weight = item.rpartition(":")
+        weights[champ.strip()] = float(weight)
+    return weights
+
+
+@dataclass(frozen=True, slots=True)
+class ChampIndex:
+    """An immutable snapshot of the champion pool, ready to sample from."""
+
+    champs: tuple[str, ...]
+    positions: Mapping[str, tuple[str, ...]]
+    sampler: TeamSampler
+
+    @classmethod
+    def build(
+        cls,
+        data: dict[str, list[str]],
+        weights: Mapping[str, float] | None = None,
+        recent: RecentPicks | None = None,
+    ) -> "ChampIndex":
+        """Index {champion: [positions]} data.
+
+        Args:
+            data (dict[str, list[str]]): Positions of every champion
+            weights (Mapping[str, float] | None): Pick weights, 1 if not listed
+            recent (RecentPicks | None): Recent picks to avoid, kept across
+                reloads
+        """
+        champ_positions: dict[str, list[str]] = defaultdict(list)
+        for champ, positions in data.items():
+            for pos in positions:
+                champ_positions[pos].append(champ)
+        by_position = MappingProxyType(
+            {pos: tuple(champs) for pos, champs in champ_positions.items()}
+        )
+        sampler = TeamSampler(by_position, weights=weights, recent=recent)
+        return cls(tuple(data), by_position, sampler)
+
+    @classmethod
+    def read(
+        cls,
+        path: Path = CHAMPS,
+        weights: Mapping[str, float] | None = None,
+        recent: RecentPicks | None = None,
+    ) -> "ChampIndex":
+        """Read, validate and index a champion file."""
+        with path.open("r", encoding="utf8") as json_file:
+            return cls.build(validate_champs(json.load(json_file)), weights, recent)
+
+
+class ChampPool:
+    """The current champion index, rebuilt whenever the champion file changes.
+
+    Commands take `pool.index` once and use that snapshot throughout, so a
+    reload never changes the champions under a command that is running.
+    """
+
+    def __init__(
+        self,
+        path: Path = CHAMPS,
+        weights: Mapping[str, float] | None = None,
+        recent: RecentPicks | None = None,
+    ) -> None:
+        self.path = path
+        self.weights = weights
+        self.recent = recent
+        self._stamp = self._stat()
+        self.index = ChampIndex.read(path, weights, recent)
+
+    def _stat(self) -> tuple[int, int]:
+        stat = self.path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    async def reload(self) -> bool:
+        """Swap in a new index if the file changed since it was last read.
+
+        Returns:
+            bool: True if the index was replaced.
+
+        Raises:
+            ValueError: If the changed file is not valid champion data. The
+                old index is kept and the file is read again on the next call.
+        """
+        stamp = await asyncio.to_thread(self._stat)
+        if stamp == self._stamp:
+            return False
+        # Parsing and indexing happen off the event loop.
+        index = await asyncio.to_thread(
+            ChampIndex.read, self.path, self.weights, self.recent
+        )
+        self.index = index
+        self._stamp = stamp
+        return True
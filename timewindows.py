@@ -0,0 +1,164 @@
+"""
+Timeouts per day, so totals over the last N days are a couple of lookups.
+
+Every user keeps the days they had timeout activity in order, alongside
+running totals of timeouts and seconds up to each day. A window is then two
+binary searches and a subtraction, however long the history.
+"""
+
+import datetime as dt
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator
+
+# Bucket for totals from before daily tracking started. It counts towards
+# lifetime totals but is older than any window.
+SEED_DAY = 0
+DAY_SECONDS = 86_400
+
+
+def day_number(time: dt.datetime) -> int:
+    """Day of a time, as a proleptic Gregorian ordinal."""
+    return time.toordinal()
+
+
+def split_by_day(start: dt.datetime, end: dt.datetime) -> Iterator[tuple[int, int]]:
+    """Seconds of [start, end) that fall on each day.
+
+    >>> list(split_by_day(dt.datetime(2024, 1, 1, 23), dt.datetime(2024, 1, 2, 1)))
+    [(738886, 3600), (738887, 3600)]
+    """
+    while start < end:
+        midnight = dt.datetime.combine(start.date() + dt.timedelta(days=1), dt.time())
+        stop = min(midnight, end)
+        yield day_number(start), int((stop - start).total_seconds())
+        start = stop
+
+
+class DailyTotals:
+    """One user's timeouts and seconds per day, as prefix sums.
+
+    >>> totals = DailyTotals()
+    >>> totals.add(10, 1, 60)
+    >>> totals.add(12, 2, 30)
+    >>> totals.add(11, 0, 5)
+    >>> totals.between(11, 12), totals.between(0, 10), totals.between(13, 20)
+    ((2, 35), (1, 60), (0, 0))
+    """
+
+    __slots__ = ("days", "counts", "seconds")
+
+    def __init__(self) -> None:
+        self.days = array("l")
+        # Running totals up to and including days[i].
+        self.counts = array("q")
+        self.seconds = array("q")
+
+    def add(self, day: int, count: int, seconds: int) -> None:
+        """Add to a day's bucket.
+
+        Days nearly always arrive in order, which is an append or a change
+        to the last bucket. Earlier days shift the later running totals.
+        """
+        idx = bisect_left(self.days, day)
+        if idx == len(self.days) or self.days[idx] != day:
+            before_counts = self.counts[idx - 1] if idx else 0
+            before_seconds = self.seconds[idx - 1] if idx else 0
+            self.days.insert(idx, day)
+            self.counts.insert(idx, before_counts)
+            self.seconds.insert(idx, before_seconds)
+        for later in range(idx, len(self.days)):
+            self.counts[later] += count
+            self.seconds[later] += seconds
+
+    def between(self, first: int, last: int) -> tuple[int, int]:
+        """Timeouts and seconds from day first to day last, inclusive."""
+        start = bisect_left(self.days, first)
+        stop = bisect_right(self.days, last)
+        if stop <= start:
+            return 0, 0
+        counts = self.counts[stop - 1] - (self.counts[start - 1] if start else 0)
+        seconds = self.seconds[stop - 1] - (self.seconds[start - 1] if start else 0)
+        return counts, seconds
+
+    def buckets(self) -> Iterator[tuple[int, int, int]]:
+        """(day, timeouts, seconds) for every day with activity."""
+        counts = seconds = 0
+        for day, count_total, seconds_total in zip(
+            self.days, self.counts, self.seconds
+        ):
+            yield day, count_total - counts, seconds_total - seconds
+            counts, seconds = count_total, seconds_total
+
+
+class TimeoutWindows:
+    """Daily timeout totals for every user, plus who is in timeout right now.
+
+    Leaderboards for a window only look at users with activity in it, found
+    through an index of users per day.
+    """
+
+    def __init__(
+        self,
+        buckets: dict[str, dict[int, tuple[int, int]]] | None = None,
+        active: dict[str, dt.datetime] | None = None,
+    ) -> None:
+        self.users: dict[str, DailyTotals] = {}
+        self.by_day: dict[int, set[str]] = {}  # day -> users with activity
+        self.active = dict(active or {})  # user id -> start of current timeout
+        for user_id, days in (buckets or {}).items():
+            for day, (count, seconds) in sorted(days.items()):
+                self.add(user_id, day, count, seconds)
+
+    def add(self, user_id: str, day: int, count: int, seconds: int) -> None:
+        """Add to a user's bucket for a day."""
+        if (totals := self.users.get(user_id)) is None:
+            totals = self.users[user_id] = DailyTotals()
+        totals.add(day, count, seconds)
+        self.by_day.setdefault(day, set()).add(user_id)
+
+    def _live(self, user_id: str, since: dt.datetime, now: dt.datetime) -> int:
+        if (start := self.active.get(user_id)) is None:
+            return 0
+        return max(0, int((now - max(start, since)).total_seconds()))
+
+    def user(self, user_id: str, now: dt.datetime, days: int) -> tuple[int, int]:
+        """Timeouts and seconds in timeout over the last days days, live included.
+
+        Args:
+            user_id (str): User to look up
+            now (dt.datetime): Time of the current check
+            days (int): Window length, today counts as the first day
+        """
+        first = day_number(now) - days + 1
+        count, seconds = (
+            totals.between(first, day_number(now))
+            if (totals := self.users.get(user_id)) is not None
+            else (0, 0)
+        )
+        since = dt.datetime.combine(dt.date.fromordinal(first), dt.time())
+        return count, seconds + self._live(user_id, since, now)
+
+    def top(
+        self, now: dt.datetime, days: int, limit: int = 5
+    ) -> tuple[list[tuple[int, str]], list[tuple[int, str]]]:
+        """Most and longest timed out users over the last days days.
+
+        Returns:
+            tuple[list[tuple[int, str]], list[tuple[int, str]]]: count / seconds
+                and user id, like TimeoutLeaderboard.top.
+        """
+        today = day_number(now)
+        candidates: set[str] = set(self.active)
+        for day in range(today - days + 1, today + 1):
+            candidates.update(self.by_day.get(day, ()))
+        totals = [(*self.user(user_id, now, days), user_id) for user_id in candidates]
+        most = heapq.nlargest(limit, (row for row in totals if row[0]))
+        longest = heapq.nlargest(
+            limit, (row for row in totals if row[1]), key=lambda row: row[1]
+        )
+        return (
+            [(count, user_id) for count, _, user_id in most],
+            [(seconds, user_id) for _, seconds, user_id in longest],
+        )
@@ -3,39 +3,125 @@ Functions for dealing with users.
 """
 
 import datetime as dt
-import json
 import logging
-from typing import Iterator, Optional
+from typing import Iterable, Iterator, Optional
 
 import discord
 
-from paths import MIST, NAMES, PROJ_PATH, TIMEOUTS
+import logfiles
+from leaderboard import Leaderboard, TimeoutLeaderboard
+from mentions import MISTBORN
+from nameindex import Match, NameIndex
+from paths import PROJ_PATH
+from records import TimeoutRecord, epoch, from_epoch
+from storage import JsonStorage, Storage
+from timewindows import TimeoutWindows, day_number, split_by_day
 
 LOGGER = logging.getLogger("debug")
 LOGGER.setLevel(logging.DEBUG)
-LOGGER.addHandler(
-    logging.FileHandler(filename=PROJ_PATH / "debug.log", encoding="utf-8", mode="w")
-)
+LOGGER.addHandler(logfiles.open_log(PROJ_PATH / "debug.log"))
 
-TIMEOUT = dict[str, tuple[int, int, str | bool, int]]
+TIMEOUT = dict[int, TimeoutRecord]
 
+# Swapped for the configured backend by the bot at startup.
+BACKEND: Storage = JsonStorage()
+# Built from the backend on first use, then kept up to date by every write.
+TIMEOUT_BOARD: TimeoutLeaderboard | None = None
+MENTION_BOARDS: dict[str, Leaderboard] = {}
+NAME_INDEX: NameIndex | None = None
+TIMEOUT_WINDOWS: TimeoutWindows | None = None
+# Mentions counted in the indexes but not written yet, by (board, user id).
+PENDING_MENTIONS: dict[tuple[str, str], int] = {}
+MENTION_STATS = {"queued": 0, "writes": 0}  # increments in, backend writes out
+# Bumped by every write, so cached views of the data know when they are stale.
+# Keys are "timeouts", "names" and "mentions:<leaderboard>".
+VERSIONS: dict[str, int] = {}
+GENERATION = 0  # bumped when the backend is swapped
 
-def get_user_timeout_data(
-    time: dt.datetime, data: tuple[int, int, str | bool, int]
-) -> tuple[int, int]:
+
+def use_backend(backend: Storage) -> None:
+    """Set where user state is read from and written to."""
+    global BACKEND, TIMEOUT_BOARD, NAME_INDEX, TIMEOUT_WINDOWS, GENERATION
+    BACKEND = backend
+    GENERATION += 1
+    TIMEOUT_BOARD = None
+    NAME_INDEX = None
+    TIMEOUT_WINDOWS = None
+    MENTION_BOARDS.clear()
+    PENDING_MENTIONS.clear()
+
+
+def changed(key: str) -> None:
+    """Mark a kind of data as written."""
+    VERSIONS[key] = VERSIONS.get(key, 0) + 1
+
+
+def version(*keys: str) -> tuple[int, ...]:
+    """A value that changes whenever any of the given kinds of data is written.
+
+    >>> before = version("timeouts", "names")
+    >>> changed("names")
+    >>> version("timeouts", "names") != before
+    True
+    """
+    return (GENERATION, *(VERSIONS.get(key, 0) for key in keys))
+
+
+async def timeout_board() -> TimeoutLeaderboard:
+    """The timeout leaderboard index, built on first use."""
+    global TIMEOUT_BOARD
+    if TIMEOUT_BOARD is None:
+        TIMEOUT_BOARD = TimeoutLeaderboard(await BACKEND.run(BACKEND.all_timeouts))
+    return TIMEOUT_BOARD
+
+
+async def timeout_windows() -> TimeoutWindows:
+    """The daily timeout index, built on first use.
+
+    Building it also seeds the daily buckets from the lifetime totals the
+    first time, so it must happen before any day is written.
+    """
+    global TIMEOUT_WINDOWS
+    if TIMEOUT_WINDOWS is None:
+        await BACKEND.run(BACKEND.seed_timeout_days)
+        buckets = await BACKEND.run(BACKEND.all_timeout_days)
+        active = {
+            str(record.user_id): from_epoch(record.start)
+            for record in (await BACKEND.run(BACKEND.all_timeouts)).values()
+            if record.start is not None
+        }
+        windows = TimeoutWindows(buckets, active)
+        if TIMEOUT_WINDOWS is None:
+            TIMEOUT_WINDOWS = windows
+    return TIMEOUT_WINDOWS
+
+
+async def mention_board(board: str = MISTBORN) -> Leaderboard:
+    """The index of a mention leaderboard, built on first use."""
+    if (found := MENTION_BOARDS.get(board)) is None:
+        found = Leaderboard(await BACKEND.run(BACKEND.all_mentions, board))
+        found = MENTION_BOARDS.setdefault(board, found)
+    return found
+
+
+async def name_index() -> NameIndex:
+    """The reverse name lookup index, built on first use."""
+    global NAME_INDEX
+    if NAME_INDEX is None:
+        NAME_INDEX = NameIndex(await BACKEND.run(BACKEND.all_names))
+    return NAME_INDEX
+
+
+def get_user_timeout_data(time: dt.datetime, data: TimeoutRecord) -> tuple[int, int]:
     """Checks if the indicated user is in timeout
 
     Args:
         time (dt.datetime): Time of the current check
-        data (tuple[int, int, str | bool, int]): Timeout data
+        data (TimeoutRecord): Timeout data
     Returns:
         tuple[int, int]: Number of times in timeout and duration (seconds)
     """
-    if isinstance(data[2], bool):
-        # Not in timeout.
-        return (data[0], data[1])
-    latest_in_timeout = dt.datetime.strptime(data[2], "%Y-%m-%d, %H:%M:%S")
-    return (data[0], data[1] + int((time - latest_in_timeout).total_seconds()))
+    return (data.count, data.total(epoch(time)))
 
 
 def get_timeout_leaderboard(
@@ -45,13 +131,13 @@ def get_timeout_leaderboard(
 
     Args:
         time (dt.datetime): Time of the current check
-        data (dict[str, tuple[int, int, str | bool, int]]): Timeout data
+        data (dict[int, TimeoutRecord]): Timeout data
 
     Returns:
         tuple[Iterator[tuple[int, int]], ...]]: users and timeouts count / total time.
     """
     compiled = {
-        (*get_user_timeout_data(time, v), idx): v[3]
+        (*get_user_timeout_data(time, v), idx): v.user_id
         for idx, v in enumerate(data.values())
     }
     most_timed_out = sorted(list(compiled.items()), key=lambda x: x[0][0], reverse=True)
@@ -69,18 +155,20 @@ async def entered_timeout(user: discord.Member, time: dt.datetime) -> None:
         user (discord.Member): User in timeout
         time (dt.datetime): Time of timeout
     """
-    with TIMEOUTS.open() as json_file:
-        data: TIMEOUT = json.load(json_file)
-    existing = data.setdefault(user.name, (0, 0, True, user.id))
-    number_of_timeouts = existing[0] + 1
-    data[user.name] = (
-        number_of_timeouts,
-        existing[1],
-        time.strftime("%Y-%m-%d, %H:%M:%S"),
-        user.id,
-    )
-    with TIMEOUTS.open("w+") as json_file:
-        json.dump(data, json_file, indent=2)
+    windows = await timeout_windows()
+    record = await BACKEND.run(BACKEND.get_timeout, user.id)
+    if record is None:
+        record = TimeoutRecord(user.id)
+    record.name = user.name
+    record.enter(epoch(time))
+    await BACKEND.run(BACKEND.record_timeout, record, "enter", time)
+    if TIMEOUT_BOARD is not None:
+        TIMEOUT_BOARD.update(record)
+    user_id = str(user.id)
+    await BACKEND.run(BACKEND.add_timeout_day, user_id, day_number(time), 1, 0)
+    windows.add(user_id, day_number(time), 1, 0)
+    windows.active[user_id] = time
+    changed("timeouts")
 
 
 async def left_timeout(user: discord.Member, time: dt.datetime) -> None:
@@ -90,23 +178,92 @@ async def left_timeout(user: discord.Member, time: dt.datetime) -> None:
         user (discord.Member): User no longer in timeout
         time (dt.datetime): Time of timeout ending
     """
-    with TIMEOUTS.open() as json_file:
-        data: TIMEOUT = json.load(json_file)
-    existing = data.setdefault(user.name, (0, 0, False, user.id))
-    duration = existing[1]
-    if isinstance(existing[2], bool):
+    windows = await timeout_windows()
+    user_id = str(user.id)
+    record = await BACKEND.run(BACKEND.get_timeout, user.id)
+    if record is None:
+        record = TimeoutRecord(user.id)
+    record.name = user.name
+    if record.start is None:
         LOGGER.error("%s left timeout when not in it.", user.display_name)
     else:
-        last_put_in_timeout = dt.datetime.strptime(existing[2], "%Y-%m-%d, %H:%M:%S")
-        duration += (time - last_put_in_timeout).total_seconds()
-    data[user.name] = (
-        existing[0],
-        int(duration),
-        False,
-        user.id,
-    )
-    with TIMEOUTS.open("w+") as json_file:
-        json.dump(data, json_file, indent=2)
+        started = from_epoch(record.start)
+        record.leave(epoch(time))
+        for day, seconds in split_by_day(started, time):
+            await BACKEND.run(BACKEND.add_timeout_day, user_id, day, 0, seconds)
+            windows.add(user_id, day, 0, seconds)
+    windows.active.pop(user_id, None)
+    await BACKEND.run(BACKEND.record_timeout, record, "leave", time)
+    if TIMEOUT_BOARD is not None:
+        TIMEOUT_BOARD.update(record)
+    changed("timeouts")
+
+
+async def user_timeout(user: discord.Member) -> TimeoutRecord:
+    """Timeout record for one user.
+
+    Args:
+        user (discord.Member): User to look up
+    Returns:
+        TimeoutRecord: Timeout data
+    """
+    found = await BACKEND.run(BACKEND.get_timeout, user.id)
+    return found or TimeoutRecord(user.id, name=user.name)
+
+
+async def all_timeouts() -> TIMEOUT:
+    """Timeout records for every user."""
+    return await BACKEND.run(BACKEND.all_timeouts)
+
+
+async def timeout_leaderboard(
+    time: dt.datetime, page: int = 1, per_page: int = 5
+) -> tuple[Iterator[tuple[int, int]], ...]:
+    """One page of the most and longest timed out people.
+
+    Args:
+        time (dt.datetime): Time of the current check
+        page (int): 1 based page number
+        per_page (int): Users per page
+    Returns:
+        tuple[Iterator[tuple[int, int]], ...]: users and timeouts count / total time.
+    """
+    board = await timeout_board()
+    return board.top(time, per_page, (page - 1) * per_page)
+
+
+async def user_timeout_window(
+    user: discord.Member, time: dt.datetime, days: int
+) -> tuple[int, int]:
+    """Timeouts and seconds in timeout over the last days days.
+
+    Args:
+        user (discord.Member): User to look up
+        time (dt.datetime): Time of the current check
+        days (int): Window length, today counts as the first day
+    Returns:
+        tuple[int, int]: Number of timeouts started and duration (seconds)
+    """
+    windows = await timeout_windows()
+    return windows.user(str(user.id), time, days)
+
+
+async def timeout_window_leaderboard(
+    time: dt.datetime, days: int, limit: int = 5
+) -> tuple[list[tuple[int, str]], list[tuple[int, str]]]:
+    """The most and longest timed out people over the last days days.
+
+    Returns:
+        tuple[list[tuple[int, str]], list[tuple[int, str]]]: users and
+            timeouts count / time in timeout.
+    """
+    windows = await timeout_windows()
+    return windows.top(time, days, limit)
+
+
+async def timed_out_users() -> int:
+    """Number of users that have ever been in timeout."""
+    return len(await timeout_board())
 
 
 def get_user(guild: Optional[discord.Guild], user: int | str) -> str:
@@ -139,29 +296,165 @@ async def update_mistborn_leaderboard(
     Returns:
         int: Number of mentions
     """
-    with MIST.open() as json_file:
-        data: dict[str, int] = json.load(json_file)
-    last_count = data.setdefault(str(member.id), 0)
-    data[str(member.id)] = last_count + mentions
-    with MIST.open("w") as json_file:
-        json.dump(data, json_file, indent=2)
+    return await update_mention_leaderboard(MISTBORN, member, mentions)
+
+
+async def update_mention_leaderboard(
+    board: str, member: discord.User | discord.Member, mentions: int
+) -> int:
+    """Update a keyword mention leaderboard
+
+    Args:
+        board (str): Leaderboard the keywords belong to.
+        member (discord.Member): User who made the mention.
+        mentions (int): Number of mentions in the message.
+    Returns:
+        int: Number of mentions
+    """
+    user_id = str(member.id)
+    last_count = await BACKEND.run(BACKEND.add_mentions, user_id, mentions, board)
+    if (index := MENTION_BOARDS.get(board)) is not None:
+        index.set(user_id, last_count + mentions)
+    changed(f"mentions:{board}")
+    return last_count + 1
+
+
+async def queue_mentions(
+    board: str, member: discord.User | discord.Member, mentions: int
+) -> int:
+    """Count mentions now and write them with the next flush_mentions.
+
+    The index is updated straight away, so leaderboards and replies are
+    current; only the write is deferred. A burst of mentions from one user
+    becomes a single write.
+
+    Args:
+        board (str): Leaderboard the keywords belong to.
+        member (discord.Member): User who made the mention.
+        mentions (int): Number of mentions in the message.
+    Returns:
+        int: Number of mentions, as update_mention_leaderboard
+    """
+    user_id = str(member.id)
+    index = await mention_board(board)
+    last_count = index.get(user_id)
+    index.add(user_id, mentions)
+    key = (board, user_id)
+    PENDING_MENTIONS[key] = PENDING_MENTIONS.get(key, 0) + mentions
+    MENTION_STATS["queued"] += 1
+    changed(f"mentions:{board}")
     return last_count + 1
 
 
+async def flush_mentions() -> int:
+    """Write the mentions queued since the last flush.
+
+    Returns:
+        int: Number of writes made
+    """
+    if not PENDING_MENTIONS:
+        return 0
+    pending = dict(PENDING_MENTIONS)
+    PENDING_MENTIONS.clear()
+    try:
+        await BACKEND.run(BACKEND.add_mention_batch, pending)
+    except Exception:
+        # Nothing was written, put them back for the next flush on top of
+        # anything queued since.
+        for key, mentions in pending.items():
+            PENDING_MENTIONS[key] = PENDING_MENTIONS.get(key, 0) + mentions
+        raise
+    MENTION_STATS["writes"] += len(pending)
+    return len(pending)
+
+
+def flush_mentions_now() -> None:
+    """flush_mentions for shutdown, once the event loop has stopped."""
+    BACKEND.add_mention_batch(PENDING_MENTIONS)
+    MENTION_STATS["writes"] += len(PENDING_MENTIONS)
+    PENDING_MENTIONS.clear()
+
+
+async def mistborn_leaderboard(limit: int, offset: int = 0) -> list[tuple[str, int]]:
+    """Users with the most Mistborn / Sanderson mentions, highest first.
+
+    Args:
+        limit (int): Number of users to return.
+        offset (int): Number of users to skip.
+    Returns:
+        list[tuple[str, int]]: user id and mention count.
+    """
+    board = await mention_board(MISTBORN)
+    return board.top(limit, offset)
+
+
+async def mistborn_mentions(user_id: int | str) -> int:
+    """Number of Mistborn / Sanderson mentions for one user."""
+    # The index, not the backend, so queued mentions are included.
+    return (await mention_board(MISTBORN)).get(str(user_id))
+
+
+async def mention_counts(boards: Iterable[str]) -> dict[str, dict[str, int]]:
+    """A copy of the mention counts of several leaderboards."""
+    return {
+        board: dict(await BACKEND.run(BACKEND.all_mentions, board)) for board in boards
+    }
+
+
+async def replace_mention_leaderboards(
+    counts: dict[str, dict[str, int]], since: dict[str, dict[str, int]]
+) -> None:
+    """Overwrite whole mention leaderboards with recounted history.
+
+    Mentions counted live after the recount started are kept on top, so
+    messages sent during a long recount are not lost.
+
+    Args:
+        counts (dict[str, dict[str, int]]): Recounted mentions by user id, per board.
+        since (dict[str, dict[str, int]]): The boards as they were when the
+            recount started.
+    """
+
+    # Queued mentions are not in the backend yet; once the indexes are
+    # rebuilt from it below they would be missing from them.
+    await flush_mentions()
+
+    def replace() -> None:
+        # One backend call, so no live update can land between read and write.
+        for board, scores in counts.items():
+            before = since.get(board, {})
+            for user_id, count in BACKEND.all_mentions(board).items():
+                if (added := count - before.get(user_id, 0)) > 0:
+                    scores[user_id] = scores.get(user_id, 0) + added
+        BACKEND.replace_mentions(counts)
+
+    await BACKEND.run(replace)
+    for board in counts:
+        MENTION_BOARDS.pop(board, None)
+        changed(f"mentions:{board}")
+
+
+async def mistborn_rank(user_id: int | str) -> tuple[int | None, int]:
+    """Leaderboard position and mention count for one user.
+
+    Returns:
+        tuple[int | None, int]: 1 based rank (None if never mentioned) and count.
+    """
+    board = await mention_board(MISTBORN)
+    key = str(user_id)
+    return board.rank(key), board.get(key)
+
+
 async def name_change(user: discord.Member) -> None:
     """
     Adds the latest display name to the json data for the user.
     """
     name = user.display_name
     id_no = str(user.id)
-    data: dict[str, list[str]] = json.loads(NAMES.read_text())
-    user_data = data.get(id_no, [])
-    if not user_data:
-        data[id_no] = []
-    if name not in user_data:
-        data[id_no].append(name)
-    with NAMES.open("w", encoding="utf8") as file:
-        json.dump(data, file, indent=2)
+    if await BACKEND.run(BACKEND.add_name, id_no, name):
+        if NAME_INDEX is not None:
+            NAME_INDEX.add(id_no, name)
+        changed("names")
 
 
 async def user_history(user: discord.Member) -> list[str]:
@@ -169,9 +462,16 @@ async def user_history(user: discord.Member) -> list[str]:
     Return the list of past display names for a user.
     """
     id_no = str(user.id)
-    data: dict[str, list[str]] = json.loads(NAMES.read_text())
-    match data.get(id_no):
-        case None:
+    match await BACKEND.run(BACKEND.get_names, id_no):
+        case []:
             return [user.display_name]
         case names:
             return names
+
+
+async def whois(name: str, limit: int = 5) -> list[Match]:
+    """
+    Users who have gone by a name, exact matches first, then similar names.
+    """
+    index = await name_index()
+    return index.search(name, limit)